@@ -0,0 +1,98 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Microbenchmark for response header parsing.
+
+Compares httpplus's own header parser, and the framing-only scan
+responses do eagerly, against the email-package based parsing
+httpplus used to do, on a header block typical of a small API
+response. Run from the top of the source tree:
+
+  python benchmarks/headers.py
+"""
+from __future__ import absolute_import, print_function
+
+import email
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from httpplus import _headers  # pylint: disable=wrong-import-position
+
+BLOCK = (b'Server: nginx/1.18.0\r\n'
+         b'Date: Sun, 01 May 2011 13:56:57 GMT\r\n'
+         b'Content-Type: application/json; charset=utf-8\r\n'
+         b'Content-Length: 1234\r\n'
+         b'Connection: keep-alive\r\n'
+         b'Cache-Control: no-cache, no-store, must-revalidate\r\n'
+         b'ETag: "5d8c72a5edda8d6a"\r\n'
+         b'Vary: Accept-Encoding\r\n'
+         b'X-Request-Id: 3f2b8c9e-1c4d-4f6a-9a7b-2e5d6c8f0a1b\r\n'
+         b'Set-Cookie: session=abc; Path=/; HttpOnly\r\n'
+         b'Set-Cookie: theme=dark; Path=/\r\n'
+         b'Strict-Transport-Security: max-age=31536000\r\n')
+
+
+def email_parse(block):
+    """How headers were parsed before httpplus had its own parser."""
+    headers = email.message_from_string(block.decode('iso-8859-1'))
+    return (headers.get('content-length'), headers.get('transfer-encoding'),
+            headers.get('connection'), headers.get_all('set-cookie'))
+
+
+def httpplus_parse(block):
+    headers = _headers.parse(block)
+    return (headers.get('content-length'), headers.get('transfer-encoding'),
+            headers.get('connection'), headers.get_all('set-cookie'))
+
+
+def httpplus_framing(block):
+    """What a response does eagerly, leaving the rest unparsed."""
+    framing = _headers.framing(block)
+    return (framing.get('content-length'), framing.get('transfer-encoding'),
+            framing.get('connection'))
+
+
+def main():
+    assert email_parse(BLOCK) == httpplus_parse(BLOCK)
+    assert email_parse(BLOCK)[:3] == httpplus_framing(BLOCK)
+    number = 20000
+    results = []
+    for func in (email_parse, httpplus_parse, httpplus_framing):
+        best = min(timeit.repeat(lambda: func(BLOCK), number=number, repeat=5))
+        results.append(best)
+        print('%-16s %7.2f usec/parse' % (func.__name__,
+                                          best / number * 1e6))
+    print('speedup: %.1fx (full parse), %.1fx (framing only)' % (
+        results[0] / results[1], results[0] / results[2]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Benchmark for sending file request bodies.
+
+Compares the three ways a request writer can send a file on disk:
+reading it into Python in blocks (what happens for pipes and other
+files of unknown length), handing it to the kernel with sendfile()
+(plaintext sockets) and sending it from a memory map (sockets without
+a usable fd, notably SSL ones). The writer sends into one end of a
+socket pair while a thread drains the other, so this measures the
+client side's cost only. Run from the top of the source tree:
+
+  python benchmarks/upload.py [size-in-MiB]
+"""
+from __future__ import absolute_import, division, print_function
+
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from httpplus import _writers  # pylint: disable=wrong-import-position
+
+BLOCKSIZE = 1 << 15
+
+# Python 2 has no process_time(), but its clock() measures the same
+# thing on Unix.
+_cputime = getattr(time, 'process_time', None) or time.clock
+
+
+class ReadOnlyFile(object):
+    """Hides a file's fileno(), so it can only be read."""
+    def __init__(self, f):
+        self.read = f.read
+
+
+class NoFdSocket(object):
+    """Hides a socket's fileno(), as SSL sockets effectively do."""
+    def __init__(self, sock):
+        self.send = sock.send
+        # Python 2 has no sendmsg(), which _writers copes with.
+        self.sendmsg = getattr(sock, 'sendmsg', None)
+        self.getsockopt = sock.getsockopt
+
+
+def drain(sock, total):
+    buf = bytearray(1 << 20)
+    got = 0
+    while got < total:
+        amt = sock.recv_into(buf)
+        if not amt:
+            break
+        got += amt
+
+
+def upload(f, wrapbody, wrapsock):
+    size = os.fstat(f.fileno()).st_size
+    f.seek(0)
+    a, b = socket.socketpair()
+    sink = threading.Thread(target=drain, args=(b, size))
+    sink.start()
+    try:
+        writer = _writers.RequestWriter(b'', wrapbody(f), False, BLOCKSIZE)
+        sock = wrapsock(a)
+        start, cpustart = time.time(), _cputime()
+        while not writer.done():
+            writer.write(sock)
+        sink.join()
+        return time.time() - start, _cputime() - cpustart
+    finally:
+        a.close()
+        b.close()
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    with tempfile.TemporaryFile() as f:
+        block = os.urandom(1 << 20)
+        for _ in range(size):
+            f.write(block)
+        f.flush()
+        paths = (('read', ReadOnlyFile, lambda s: s),
+                 ('mmap', lambda f: f, NoFdSocket),
+                 ('sendfile', lambda f: f, lambda s: s))
+        for name, wrapbody, wrapsock in paths:
+            wall, cpu = min(upload(f, wrapbody, wrapsock) for _ in range(3))
+            # CPU time includes the draining thread, which does the
+            # same work for every path.
+            print('%-9s %8.1f MiB/s %7.3f s cpu' % (name, size / wall, cpu))
+
+
+if __name__ == '__main__':
+    main()
@@ -32,7 +32,7 @@ This library contains an HTTPConnection which is similar to the one in
 httplib, but has several additional features:
 
   * supports keepalives natively
-  * uses select() to block for incoming data
+  * waits for sockets with epoll (or the platform's equivalent)
   * notices when the server responds early to a request
   * implements ssl inline instead of in a different class
 """
@@ -40,12 +40,11 @@ from __future__ import absolute_import
 
 # Many functions in this file have too many arguments.
 # pylint: disable=R0913
-import email
-import email.message
+import collections
+import copy
 import errno
 import inspect
 import logging
-import select
 import socket
 import ssl
 import sys
@@ -63,12 +62,18 @@ except ImportError:
     import http.client as httplib
 
 from . import (
+    _connector,
+    _headers,
+    _poll,
     _readers,
+    _tls,
+    _writers,
+    dnscache,
 )
 
 logger = logging.getLogger(__name__)
 
-__all__ = ['HTTPConnection', 'HTTPResponse']
+__all__ = ['HTTPConnection', 'HTTPResponse', 'PreparedRequest']
 
 HTTP_VER_1_0 = b'HTTP/1.0'
 HTTP_VER_1_1 = b'HTTP/1.1'
@@ -85,6 +90,11 @@ XFER_ENCODING_CHUNKED = 'chunked'
 
 CONNECTION_CLOSE = 'close'
 
+# Only requests that can safely be sent twice are pipelined, since the
+# server may close the connection without answering some of them.
+_IDEMPOTENT_METHODS = frozenset(
+    [b'GET', b'HEAD', b'OPTIONS', b'TRACE', b'PUT', b'DELETE'])
+
 EOL = b'\r\n'
 _END_HEADERS = EOL * 2
 
@@ -108,48 +118,40 @@ def _ensurebytes(data):
                     data[err.start:err.end],))
     return data
 
-class _CompatMessage(email.message.Message):
-    """Workaround for rfc822.Message and email.message.Message API diffs."""
-
-    @classmethod
-    def from_string(cls, s):
-        if sys.version_info > (3, 0):
-            # Python 3 can't decode headers from bytes, so we have to
-            # trust RFC 2616 and decode the headers as iso-8859-1
-            # bytes.
-            s = s.decode('iso-8859-1')
-        headers = email.message_from_string(s, _class=_CompatMessage)
-        # Fix multi-line headers to match httplib's behavior from
-        # Python 2.x, since email.message.Message handles them in
-        # slightly different ways.
-        if sys.version_info < (3, 0):
-            new = []
-            for h, v in headers._headers:
-                if '\r\n' in v:
-                    v = '\n'.join([' ' + x.lstrip() for x in v.split('\r\n')])[1:]
-                new.append((h, v))
-            headers._headers = new
-        return headers
-
-    def getheaders(self, key):
-        return self.get_all(key)
-
-    def getheader(self, key, default=None):
-        return self.get(key, failobj=default)
-
-
 class HTTPResponse(object):
     """Response from an HTTP server.
 
     The response will continue to load as available. If you need the
     complete response before continuing, check the .complete() method.
+
+    Bodies with a Content-Length of at most preallocate_limit bytes
+    are received into a single preallocated bytearray, which an
+    unbounded read() returns as-is (so the result is a bytearray
+    rather than bytes). This keeps peak memory for large downloads at
+    the size of the body. It is disabled by default; subclass and set
+    it, then use the subclass as an HTTPConnection's response_class.
     """
+    preallocate_limit = 0
+
+    # Limits on the response header block, which guard against a
+    # misbehaving server making us buffer headers forever.
+    # HTTPHeadersTooLargeError is raised if they are exceeded.
+    max_header_size = 1 << 16
+    max_headers = 100
+
     def __init__(self, sock, timeout, method):
         self.sock = sock
         self.method = method
-        self.raw_response = b''
+        self.raw_response = bytearray()
         self._headers_len = 0
-        self.headers = None
+        # How much of raw_response has been searched for the end of
+        # the headers.
+        self._end_scanned = 0
+        self._eol_known = False
+        # The header block is kept as bytes and only parsed into
+        # _headers if the headers are asked for.
+        self._raw_headers = None
+        self._headers = None
         self.will_close = False
         self.status_line = b''
         self.status = None
@@ -162,6 +164,9 @@ class HTTPResponse(object):
         self._eol = EOL
 
         self._timeout = timeout
+        # Shared with the connection when it created us.
+        self._poller = None
+        self._closed = False
 
     @property
     def _end_headers(self):
@@ -183,6 +188,44 @@ class HTTPResponse(object):
             # pylint: disable=W0212
             self._reader._close()
 
+    def _takeexcess(self):
+        """Returns (and forgets) data received after the end of the body.
+
+        On a pipelined connection this is the start of the next
+        response.
+        """
+        if self._reader is None:
+            return b''
+        # We're a friend of the reader class here.
+        # pylint: disable=W0212
+        return self._reader._takeexcess()
+
+    @property
+    def headers(self):
+        """The response headers, or None if they haven't arrived yet.
+
+        Only the headers that determine how to read the body are
+        looked at while loading a response; the full header block is
+        parsed the first time this (or getheader() or getheaders())
+        is used.
+        """
+        if self._headers is None and self._raw_headers is not None:
+            self._headers = _headers.parse(self._raw_headers)
+        return self._headers
+
+    @property
+    def trailers(self):
+        """Trailer headers sent after a chunked response body.
+
+        This is None until the body has been completely loaded, and
+        always None for responses that were not chunked.
+        """
+        if not isinstance(self._reader, _readers.ChunkedReader):
+            return None
+        if not self.complete():
+            return None
+        return _headers.parse(EOL.join(self._reader.trailer_lines))
+
     def getheader(self, header, default=None):
         return self.headers.getheader(header, default=default)
 
@@ -221,18 +264,142 @@ class HTTPResponse(object):
             length = self._reader.available_data
         r = self._reader.read(length)
         if self.complete() and self.will_close:
-            self.sock.close()
+            self._closesock()
         return r
 
-    def _select(self):
-        r, unused_write, unused_err = select.select(
-            [self.sock], [], [], self._timeout)
-        if not r:
+    def readinto(self, buf):
+        """Read response body data into a writable buffer.
+
+        This follows io.RawIOBase.readinto(): it returns the number of
+        bytes placed in buf, which may be fewer than len(buf), and
+        returns 0 only once the body has been completely read. Data
+        the response has already buffered is copied out first; beyond
+        that, bodies that need no decoding are received from the
+        socket directly into buf.
+        """
+        view = memoryview(buf)
+        if view.itemsize != 1:
+            view = view.cast('B')
+        if not view:
+            return 0
+        # We're a friend of the reader class here.
+        # pylint: disable=W0212
+        reader = self._reader
+        while not reader.available_data and not self.complete():
+            limit = reader._directlimit(len(view))
+            if not limit:
+                self._select()
+                continue
+            amt = self._recvinto(view[:limit])
+            if amt:
+                if self.complete() and self.will_close:
+                    self._closesock()
+                return amt
+        amt = reader.readinto(view)
+        if self.complete() and self.will_close:
+            self._closesock()
+        return amt
+
+    def readable(self):
+        """Returns True, for compatibility with io.RawIOBase."""
+        return True
+
+    @property
+    def closed(self):
+        """True once close() has been called, as for io.RawIOBase."""
+        return self._closed
+
+    def close(self):
+        """Stop reading this response.
+
+        If the body hasn't been completely read, the socket is closed,
+        since whatever is left of the response would otherwise be
+        mistaken for the start of the next one.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if not self.complete():
+            self.will_close = True
+            self._closesock()
+
+    def flush(self):
+        """Does nothing, for compatibility with io.RawIOBase."""
+
+    def fileno(self):
+        """Returns the socket's file descriptor, as for io.RawIOBase."""
+        return self.sock.fileno()
+
+    def _recvinto(self, view):
+        """Receive body data straight into view, bypassing the reader.
+
+        Returns the number of bytes received, which is 0 if nothing
+        could be read yet or the server closed the socket.
+        """
+        self._waitforread()
+        try:
+            amt = self.sock.recv_into(view)
+        except ssl.SSLError as e:
+            if e.args[0] != ssl.SSL_ERROR_WANT_READ:
+                raise
+            logger.debug('SSL_ERROR_WANT_READ in _recvinto, should retry later')
+            return 0
+        logger.debug('response read %d data directly into caller buffer', amt)
+        # We're a friend of the reader class here.
+        # pylint: disable=W0212
+        if amt:
+            self._reader._directloaded(amt)
+        else:
+            self._reader._close()
+        return amt
+
+    def _recvintoreader(self, target):
+        """Like _select(), but receives into a buffer owned by the reader."""
+        try:
+            amt = self.sock.recv_into(target)
+        except ssl.SSLError as e:
+            if e.args[0] != ssl.SSL_ERROR_WANT_READ:
+                raise
+            logger.debug('SSL_ERROR_WANT_READ in _select, should retry later')
+            return True
+        logger.debug('response read %d data during _select', amt)
+        # We're a friend of the reader class here.
+        # pylint: disable=W0212
+        if not amt:
+            self._reader._close()
+            return False
+        self._reader._bufferloaded(amt)
+        return True
+
+    def _getpoller(self):
+        if self._poller is None or self._poller.sock is not self.sock:
+            self._poller = _poll.Poller(self.sock)
+        return self._poller
+
+    def _closesock(self):
+        _tls.sessions.save(self.sock)
+        self.sock.close()
+        if self._poller is not None:
+            self._poller.close()
+            self._poller = None
+
+    def _waitforread(self):
+        readable, unused_writable = self._getpoller().wait(
+            True, False, self._timeout)
+        if not readable:
             # socket was not readable. If the response is not
             # complete, raise a timeout.
             if not self.complete():
                 logger.info('timed out with timeout of %s', self._timeout)
                 raise HTTPTimeoutException('timeout reading data')
+
+    def _select(self):
+        self._waitforread()
+        # We're a friend of the reader class here.
+        # pylint: disable=W0212
+        target = self._reader and self._reader._loadbuffer()
+        if target is not None:
+            return self._recvintoreader(target)
         try:
             data = self.sock.recv(INCOMING_BUFFER_SIZE)
         except ssl.SSLError as e:
@@ -254,43 +421,78 @@ class HTTPResponse(object):
             self._load_response(data)
             return True
 
+    def _detect_eol(self, scanned):
+        """Work out the line ending in use from the data loaded so far.
+
+        scanned is how much of raw_response was already looked at by
+        a previous call.
+        """
+        raw = self.raw_response
+        # Back up one byte in case an EOL was split across two reads.
+        start = max(0, scanned - 1)
+        if raw.find(EOL, start) != -1:
+            self._eol_known = True
+            return
+        # This is a bogus server with bad line endings
+        for bad_eol in (b'\n', b'\r'):
+            i = raw.find(bad_eol, start)
+            # verify that bad_eol is not the end of the incoming data
+            # as this could be a response line that just got
+            # split between \r and \n.
+            if i != -1 and i < len(raw) - 1:
+                logger.info('bogus line endings detected, '
+                            'using %r for EOL', bad_eol)
+                self._eol = bad_eol
+                self._eol_known = True
+                self._end_scanned = 0
+                return
+
     # This method gets replaced by _load later, which confuses pylint.
     def _load_response(self, data): # pylint: disable=E0202
         # Being here implies we're not at the end of the headers yet,
         # since at the end of this method if headers were completely
         # loaded we replace this method with the load() method of the
         # reader we created.
-        self.raw_response += data
-        # This is a bogus server with bad line endings
-        if self._eol not in self.raw_response:
-            for bad_eol in (b'\n', b'\r'):
-                if (bad_eol in self.raw_response
-                    # verify that bad_eol is not the end of the incoming data
-                    # as this could be a response line that just got
-                    # split between \r and \n.
-                    and (self.raw_response.index(bad_eol) <
-                         (len(self.raw_response) - 1))):
-                    logger.info('bogus line endings detected, '
-                                'using %r for EOL', bad_eol)
-                    self._eol = bad_eol
-                    break
-        # exit early if not at end of headers
-        if self._end_headers not in self.raw_response or self.headers:
+        raw = self.raw_response
+        scanned = len(raw)
+        raw += data
+        if not self._eol_known:
+            self._detect_eol(scanned)
+        # Only look for the end of the headers in data we haven't
+        # already searched, backing up far enough to catch a
+        # terminator that was split across two reads.
+        end_headers = self._end_headers
+        split = raw.find(end_headers,
+                         max(0, self._end_scanned - len(end_headers) + 1))
+        if split == -1:
+            self._end_scanned = len(raw)
+            if len(raw) > self.max_header_size:
+                raise HTTPHeadersTooLargeError(
+                    'response headers exceed %d bytes' % self.max_header_size)
             return
+        if split > self.max_header_size:
+            raise HTTPHeadersTooLargeError(
+                'response headers exceed %d bytes' % self.max_header_size)
+        hdrs = bytes(raw[:split])
+        body = bytes(raw[split + len(end_headers):])
 
         # handle 100-continue response
-        hdrs, body = self.raw_response.split(self._end_headers, 1)
         unused_http_ver, status = hdrs.split(b' ', 1)
         if status.startswith(b'100'):
-            self.raw_response = body
+            self.raw_response = bytearray()
+            self._end_scanned = 0
             self.continued = True
             logger.debug('continue seen, setting body to %r', body)
+            if body:
+                self._load_response(body)
             return
 
         # arriving here means we should parse response headers
         # as all headers have arrived completely
-        hdrs, body = self.raw_response.split(self._end_headers, 1)
         del self.raw_response
+        if hdrs.count(self._eol) > self.max_headers:
+            raise HTTPHeadersTooLargeError(
+                'got more than %d response headers' % self.max_headers)
         if self._eol in hdrs:
             self.status_line, hdrs = hdrs.split(self._eol, 1)
         else:
@@ -302,17 +504,17 @@ class HTTPResponse(object):
         self.status = int(self.status)
         if self._eol != EOL:
             hdrs = hdrs.replace(self._eol, b'\r\n')
-        headers = _CompatMessage.from_string(hdrs)
+        framing = _headers.framing(hdrs)
         content_len = None
-        if HDR_CONTENT_LENGTH in headers:
-            content_len = int(headers[HDR_CONTENT_LENGTH])
+        if HDR_CONTENT_LENGTH in framing:
+            content_len = int(framing[HDR_CONTENT_LENGTH])
         if self.http_version == HTTP_VER_1_0:
             self.will_close = True
-        elif HDR_CONNECTION_CTRL in headers:
+        elif HDR_CONNECTION_CTRL in framing:
             self.will_close = (
-                headers[HDR_CONNECTION_CTRL].lower() == CONNECTION_CLOSE)
-        if (HDR_XFER_ENCODING in headers
-            and headers[HDR_XFER_ENCODING].lower() == XFER_ENCODING_CHUNKED):
+                framing[HDR_CONNECTION_CTRL].lower() == CONNECTION_CLOSE)
+        if (HDR_XFER_ENCODING in framing
+            and framing[HDR_XFER_ENCODING].lower() == XFER_ENCODING_CHUNKED):
             self._reader = _readers.ChunkedReader(self._eol)
             logger.debug('using a chunked reader')
         else:
@@ -325,7 +527,9 @@ class HTTPResponse(object):
             if content_len is not None:
                 logger.debug('using a content-length reader with length %d',
                              content_len)
-                self._reader = _readers.ContentLengthReader(content_len)
+                self._reader = _readers.ContentLengthReader(
+                    content_len,
+                    preallocate=0 < content_len <= self.preallocate_limit)
             else:
                 # Response body had no length specified and is not
                 # chunked, so the end of the body will only be
@@ -343,7 +547,7 @@ class HTTPResponse(object):
             # pylint: disable=W0212
             self._reader._load(body)
         logger.debug('headers complete')
-        self.headers = headers
+        self._raw_headers = hdrs
         # We're a friend of the reader class here.
         # pylint: disable=W0212
         self._load_response = self._reader._load
@@ -356,6 +560,78 @@ def _foldheaders(headers):
     """
     return dict((k.lower(), (k, v)) for k, v in headers.items())
 
+def _hostport(host, port, use_ssl):
+    """Work out the server to talk to from HTTPConnection's arguments.
+
+    host may include a port (and IPv6 addresses must then be in
+    brackets). Returns a (host, port, use_ssl) tuple with the
+    defaults filled in.
+    """
+    host = _ensurebytes(host)
+    if port is None and host.count(b':') == 1 or b']:' in host:
+        host, port = host.rsplit(b':', 1)
+        port = int(port)
+        if b'[' in host:
+            host = host[1:-1]
+    if use_ssl is None and port is None:
+        use_ssl = False
+        port = 80
+    elif use_ssl is None:
+        use_ssl = (port == 443)
+    elif port is None:
+        port = (use_ssl and 443 or 80)
+    return host, port, use_ssl
+
+
+def _bodylen(body):
+    """Returns the size in bytes of a body, or block of one, with __len__.
+
+    len() of a memoryview or array whose items are wider than a byte
+    counts items, not bytes.
+    """
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    try:
+        view = memoryview(body)
+    except TypeError:
+        return len(body)
+    # Python 2's memoryview has no nbytes, but only ever views bytes.
+    return getattr(view, 'nbytes', len(view))
+
+
+def _framebody(body, hdrs):
+    """Add any headers needed to frame a request body.
+
+    hdrs are folded headers as returned by _foldheaders(), and are
+    modified in place. Returns True if the body must be sent using
+    chunked transfer-encoding.
+
+    Bodies of unknown length (file-like objects that aren't regular
+    files, and iterables such as generators) are sent chunked, unless
+    the caller provided a Content-Length header for them.
+    """
+    if not body or HDR_CONTENT_LENGTH in hdrs:
+        return False
+    if isinstance(body, (list, tuple)):
+        length = sum(_bodylen(block) for block in body)
+        hdrs[HDR_CONTENT_LENGTH] = (HDR_CONTENT_LENGTH, b'%d' % length)
+        return False
+    if getattr(body, '__len__', False):
+        hdrs[HDR_CONTENT_LENGTH] = (HDR_CONTENT_LENGTH,
+                                    b'%d' % _bodylen(body))
+        return False
+    if getattr(body, 'read', False):
+        rng = _writers.filerange(body)
+        if rng is not None:
+            # A file on disk knows its own length, so it can be sent
+            # without chunking (and with sendfile()).
+            hdrs[HDR_CONTENT_LENGTH] = (HDR_CONTENT_LENGTH, b'%d' % rng[2])
+            return False
+    elif not _writers.isiterable(body):
+        raise BadRequestData('body has no __len__(), read() nor __iter__()')
+    hdrs[HDR_XFER_ENCODING] = (HDR_XFER_ENCODING, XFER_ENCODING_CHUNKED)
+    return True
+
 try:
     inspect.signature
     def _handlesarg(func, arg):
@@ -397,11 +673,39 @@ except AttributeError:
             return 'unknown'
         return False
 
+def _canresend(body):
+    """Returns True if body can be sent again after being sent once.
+
+    Files, generators and other iterators are used up by sending them.
+    """
+    return not body or bool(getattr(body, '__len__', False))
+
+
+class PreparedRequest(object):
+    """A request whose headers have been serialized ahead of time.
+
+    Create these with HTTPConnection.prepare(), and send them with
+    HTTPConnection.sendprepared().
+    """
+    def __init__(self, target, method, path, header_prefix, framed,
+                 expect_continue, proxy_headers):
+        self.target = target
+        self.method = method
+        self.path = path
+        # Request line and headers, minus the terminating blank line
+        # so per-request headers can be appended.
+        self.header_prefix = header_prefix
+        # True if the prepared headers already say how long the body is.
+        self.framed = framed
+        self.expect_continue = expect_continue
+        self.proxy_headers = proxy_headers
+
+
 class HTTPConnection(object):
     """Connection to a single http server.
 
-    Supports 100-continue and keepalives natively. Uses select() for
-    non-blocking socket operations.
+    Supports 100-continue and keepalives natively. Uses a poller
+    (see _poll) for non-blocking socket operations.
     """
     http_version = HTTP_VER_1_1
     response_class = HTTPResponse
@@ -410,7 +714,9 @@ class HTTPConnection(object):
                  timeout=TIMEOUT_DEFAULT,
                  continue_timeout=TIMEOUT_ASSUME_CONTINUE,
                  proxy_hostport=None, proxy_headers=None,
-                 ssl_wrap_socket=None, **ssl_opts):
+                 ssl_wrap_socket=None, pipeline_depth=1, max_sockets=1,
+                 connect_timeout=None, resolver=None, ssl_context=None,
+                 **ssl_opts):
         """Create a new HTTPConnection.
 
         Args:
@@ -433,21 +739,47 @@ class HTTPConnection(object):
                          this option and not proxy_hostport will raise an
                          ValueError.
           ssl_wrap_socket: Optional function to use for wrapping
-            sockets. If unspecified, the one from the ssl module will
-            be used if available, or something that's compatible with
-            it if on a Python older than 2.6.
+            sockets. If unspecified, sockets are wrapped as by
+            ssl.wrap_socket, but with an SSLContext shared by all
+            connections using the same extra keyword arguments, so
+            certificates are only loaded once.
+          pipeline_depth: Optional. The most requests that may be
+            awaiting responses at once. The default of 1 disables
+            pipelining; see request().
+          max_sockets: Optional. The most sockets to open to the
+            server at once. The default of 1 means requests can only
+            be sent once the previous response has been read (or
+            pipelined); see request().
+          connect_timeout: Optional. Timeout for connecting to the
+            server (or proxy), if it should differ from timeout. If
+            the host has several addresses they are tried in
+            parallel, staggered as recommended by RFC 8305.
+          resolver: Optional. Where to look up the server's (or
+            proxy's) addresses: a dnscache.CachingResolver, or
+            anything else with its getaddrinfo() method. The default
+            is dnscache.default, which all connections share.
+          ssl_context: Optional. An ssl.SSLContext to wrap sockets
+            with, instead of one built from the extra keyword
+            arguments. It's up to the context whether the server's
+            certificate and host name are checked.
+
+        TLS sessions are kept from past connections (see tls_sessions)
+        and offered again when reconnecting to the same host with the
+        same ssl options or context, so the server can skip the full
+        handshake.
 
         Any extra keyword arguments to this function will be provided
         to the ssl_wrap_socket method. If no ssl
         """
-        host = _ensurebytes(host)
-        if port is None and host.count(b':') == 1 or b']:' in host:
-            host, port = host.rsplit(b':', 1)
-            port = int(port)
-            if b'[' in host:
-                host = host[1:-1]
+        host, port, use_ssl = _hostport(host, port, use_ssl)
         if ssl_wrap_socket is not None:
             _wrap_socket = ssl_wrap_socket
+        elif ssl_context is not None:
+            def _wrap_socket(sock, server_hostname=None, **ssl_opts):
+                return _tls.wrap_socket(sock, server_hostname=server_hostname,
+                                        ssl_context=ssl_context, **ssl_opts)
+        elif getattr(ssl, 'SSLContext', None) is not None:
+            _wrap_socket = _tls.wrap_socket
         else:
             _wrap_socket = ssl.wrap_socket
         call_wrap_socket = None
@@ -472,21 +804,15 @@ class HTTPConnection(object):
                     ssl_opts['serverhostname'] = ssl_opts['server_hostname']
                 return _wrap_socket(sock, **ssl_opts)
         self._ssl_wrap_socket = call_wrap_socket
-        if use_ssl is None and port is None:
-            use_ssl = False
-            port = 80
-        elif use_ssl is None:
-            use_ssl = (port == 443)
-        elif port is None:
-            port = (use_ssl and 443 or 80)
+        # Only the default wrappers are sure to take
+        # do_handshake_on_connect; see _wrapssl().
+        self._ssl_deferrable = ssl_wrap_socket is None
         self.port = port
         self.ssl = use_ssl
         self.ssl_opts = ssl_opts
         self._ssl_validator = ssl_validator
         self.host = host
-        self.sock = None
-        self._current_response = None
-        self._current_response_taken = False
+        self._resetstate()
         if proxy_hostport is None:
             self._proxy_host = self._proxy_port = None
             if proxy_headers:
@@ -501,6 +827,31 @@ class HTTPConnection(object):
 
         self.timeout = timeout
         self.continue_timeout = continue_timeout
+        self.pipeline_depth = pipeline_depth
+        self.max_sockets = max_sockets
+        self.connect_timeout = connect_timeout
+        self.resolver = resolver
+
+    def _resetstate(self):
+        """Set up the state of a connection that has no socket yet."""
+        self.sock = None
+        # Poller for self.sock, created when it's first needed.
+        self._poller = None
+        self._current_response = None
+        self._current_response_taken = False
+        # Requests written (or waiting to be written) behind
+        # _current_response, as (response, request) pairs. response
+        # is None if the request hasn't been sent yet. request is
+        # what _resend() needs to send it again.
+        self._pipelined = collections.deque()
+        # The request for _current_response, if it was pipelined.
+        self._current_request = None
+        # With max_sockets above 1, connections to the same server
+        # that requests are also sent on...
+        self._children = []
+        # ...and the connection (self or a child) holding the
+        # response for each request, in the order requests were made.
+        self._order = collections.deque()
 
     def _connect(self, proxy_headers):
         """Connect to the host and port specified in __init__."""
@@ -509,13 +860,13 @@ class HTTPConnection(object):
         if self._proxy_host is not None:
             logger.info('Connecting to http proxy %s:%s',
                         self._proxy_host, self._proxy_port)
-            sock = socket.create_connection((self._proxy_host,
-                                             self._proxy_port))
+            sock = self._createconnection((self._proxy_host,
+                                           self._proxy_port))
             if self.ssl:
                 data = self._buildheaders(b'CONNECT', b'%s:%d' % (self.host,
                                                                   self.port),
                                           proxy_headers, HTTP_VER_1_0)
-                sock.send(data)
+                sock.sendall(data)
                 sock.setblocking(0)
                 r = self.response_class(sock, self.timeout, b'CONNECT')
                 timeout_exc = HTTPTimeoutException(
@@ -542,21 +893,78 @@ class HTTPConnection(object):
                 logger.info('CONNECT (for SSL) to %s:%s via proxy succeeded.',
                             self.host, self.port)
         else:
-            sock = socket.create_connection((self.host, self.port))
+            sock = self._createconnection((self.host, self.port))
         if self.ssl:
-            # This is the default, but in the case of proxied SSL
-            # requests the proxy logic above will have cleared
-            # blocking mode, so re-enable it just to be safe.
-            sock.setblocking(1)
-            logger.debug('wrapping socket for ssl with options %r',
-                         self.ssl_opts)
-            sock = self._ssl_wrap_socket(sock, server_hostname=self.host,
-                                         **self.ssl_opts)
-            if self._ssl_validator:
-                self._ssl_validator(sock)
+            sock = self._wrapssl(sock)
         sock.setblocking(0)
         self.sock = sock
 
+    def _wrapssl(self, sock, do_handshake_on_connect=True):
+        """Wrap sock, which is connected to the server, for ssl.
+
+        If do_handshake_on_connect is False, the handshake is left to
+        the caller (see _tls.do_handshake()), which must then call
+        _ssl_validator if it's set. That's only allowed if
+        _ssl_deferrable, as custom ssl_wrap_sockets may not support it.
+        """
+        # This is the default, but in the case of proxied SSL
+        # requests the proxy logic will have cleared blocking mode,
+        # so re-enable it just to be safe.
+        sock.setblocking(1)
+        logger.debug('wrapping socket for ssl with options %r',
+                     self.ssl_opts)
+        ssl_opts = self.ssl_opts
+        if not do_handshake_on_connect:
+            assert self._ssl_deferrable, 'ssl_wrap_socket must do handshakes'
+            ssl_opts = dict(ssl_opts, do_handshake_on_connect=False)
+        sock = self._ssl_wrap_socket(sock, server_hostname=self.host,
+                                     **ssl_opts)
+        if do_handshake_on_connect and self._ssl_validator:
+            self._ssl_validator(sock)
+        return sock
+
+    def _connecttimeout(self):
+        if self.connect_timeout is None:
+            return self.timeout
+        return self.connect_timeout
+
+    def _createconnection(self, address):
+        try:
+            return _connector.create_connection(
+                address, self._connecttimeout(),
+                resolver=self.resolver or dnscache.default)
+        except socket.timeout:
+            raise HTTPTimeoutException('timeout connecting to %r'
+                                       % (address,))
+
+    def _startconnection(self):
+        """Returns a _connector.Connector racing to reach the server.
+
+        This is for connecting without blocking. Proxies aren't
+        supported, and the socket it connects isn't wrapped for ssl.
+        """
+        return _connector.Connector(
+            (self.host, self.port), self._connecttimeout(),
+            resolver=self.resolver or dnscache.default)
+
+    def _getpoller(self):
+        """Returns the poller for self.sock, creating it if needed.
+
+        Responses to requests on the socket are given the same poller,
+        so the socket is registered once for its whole lifetime.
+        """
+        if self._poller is None or self._poller.sock is not self.sock:
+            self._poller = _poll.Poller(self.sock)
+        return self._poller
+
+    def _newresponse(self, method):
+        response = self.response_class(self.sock, self.timeout, method)
+        # We're a friend of the response class, so let us use the
+        # private attribute.
+        # pylint: disable=W0212
+        response._poller = self._getpoller()
+        return response
+
     def _buildheaders(self, method, path, headers, http_ver):
         if self.ssl and self.port == 443 or self.port == 80:
             # default port for protocol, so leave it out
@@ -591,34 +999,275 @@ class HTTPConnection(object):
         connection may automatically close if requested by the server
         or required by the nature of a response.
         """
+        for child in self._children:
+            child.close()
+        self._children = []
+        self._order.clear()
         if self.sock is None:
             return
+        self._closesock()
+        logger.info('closed connection to %s on %s', self.host, self.port)
+
+    def _closesock(self):
+        if self._poller is not None and self._poller.sock is self.sock:
+            self._poller.close()
+        self._poller = None
+        _tls.sessions.save(self.sock)
         self.sock.close()
         self.sock = None
-        logger.info('closed connection to %s on %s', self.host, self.port)
+
+    def _isstale(self):
+        """Returns True if our idle socket can't be used for a request.
+
+        Nothing should arrive on a keepalive socket between requests,
+        so if there's anything to read it's either the server closing
+        the connection or something it sent while giving up on us
+        (like a 408 response). This only costs a non-blocking peek
+        at the socket, or a poll for SSL sockets, which can't peek.
+        """
+        sock = self.sock
+        if _poll._pending(sock):
+            return True
+        if self.ssl:
+            readable, unused_writable = self._getpoller().wait(True, False, 0)
+            return readable
+        try:
+            sock.recv(1, socket.MSG_PEEK)
+        except socket.error as e:
+            if e.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN):
+                return False
+        return True
 
     def busy(self):
         """Returns True if this connection object is currently in use.
 
         If a response is still pending, this will return True, even if
-        the request has finished sending. In the future,
-        HTTPConnection may transparently juggle multiple connections
-        to the server, in which case this will be useful to detect if
-        any of those connections is ready for use.
+        the request has finished sending. With max_sockets above 1,
+        this is only True if all the sockets that may be opened are
+        in use.
+
+        A pipelining connection is busy while any response is
+        outstanding, although it may still accept more requests.
         """
+        if self.max_sockets > 1:
+            lanes = [self] + self._children
+            return (len(lanes) >= self.max_sockets
+                    and all(lane._sockbusy() for lane in lanes))
+        return self._sockbusy()
+
+    def _sockbusy(self):
+        """Returns True if our own socket has a response outstanding."""
         cr = self._current_response
         if cr is not None:
             if self._current_response_taken:
                 if cr.will_close:
                     self.sock = None
                     self._current_response = None
-                    return False
                 elif cr.complete():
                     self._current_response = None
+                if self._current_response is None:
+                    if self._pipelined:
+                        self._promote(cr)
+                        return True
                     return False
             return True
         return False
 
+    def _canpipeline(self, method, body, expect_continue):
+        """Returns True if a request may be pipelined right now."""
+        cr = self._current_response
+        return (len(self._pipelined) + 1 < self.pipeline_depth
+                and method in _IDEMPOTENT_METHODS
+                and not expect_continue
+                and _canresend(body)
+                and self.sock is not None
+                and not cr.will_close)
+
+    def _inflight(self):
+        """Returns the responses still being read from self.sock, in order."""
+        responses = [r for r, unused_request in self._pipelined
+                     if r is not None]
+        if self._current_response is not None:
+            responses.insert(0, self._current_response)
+        return responses
+
+    def _readahead(self):
+        """Receive response data while pipelining requests.
+
+        Data is handed to the responses it belongs to in order, with
+        whatever is left over after one response is complete going on
+        to the next. Returns False if the server closed the socket.
+        """
+        try:
+            data = self.sock.recv(INCOMING_BUFFER_SIZE)
+        except ssl.SSLError as e:
+            if e.args[0] != ssl.SSL_ERROR_WANT_READ:
+                raise
+            return True
+        if not data:
+            return False
+        logger.debug('read %d bytes ahead while pipelining', len(data))
+        # We're a friend of the response class, so let us use the
+        # private attributes.
+        # pylint: disable=W0212
+        for response in self._inflight():
+            if response.complete():
+                # Data left over from a finished response comes
+                # before anything we just received.
+                data = response._takeexcess() + data
+                continue
+            response._load_response(data)
+            data = response._takeexcess()
+            if not data:
+                break
+        if data:
+            logger.warning('discarding %d bytes received after the '
+                           'last expected response', len(data))
+        return True
+
+    def _sendpipelined(self, request):
+        """Write a request without waiting for earlier responses.
+
+        The response is queued behind the outstanding ones, to be
+        returned by getresponse() in turn.
+        """
+        method, outgoing_headers, body, chunked, unused_pheaders = request
+        if self.sock is None or self._current_response.will_close:
+            # This socket won't be answering any more requests; this
+            # one goes out on the next socket, with the rest of the
+            # pipeline.
+            self._pipelined.append((None, request))
+            return
+        # The response is queued first, since the server may start
+        # answering before we've finished writing.
+        self._pipelined.append((self._newresponse(method), request))
+        writer = _writers.RequestWriter(outgoing_headers, body, chunked,
+                                        OUTGOING_BUFFER_SIZE)
+        while not writer.done():
+            r, w = self._getpoller().wait(True, True, self.timeout)
+            if not r and not w:
+                raise HTTPTimeoutException('timeout sending data')
+            # Keep reading while we write, so that neither we nor
+            # the server can stall with a full send buffer.
+            if r and not self._readahead():
+                break
+            if self._current_response.will_close:
+                break
+            if w:
+                try:
+                    writer.write(self.sock)
+                except socket.error as e:
+                    if (e.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN)
+                        or (self.ssl
+                            and e.args[0] == ssl.SSL_ERROR_WANT_WRITE)):
+                        continue
+                    if e.args[0] not in (errno.ECONNRESET, errno.EPIPE):
+                        raise
+                    break
+        if not writer.done():
+            # The server is going away; send this again later.
+            logger.info('pipelined request not fully sent, will re-send')
+            self._pipelined[-1] = (None, request)
+
+    def _promote(self, prev):
+        """Make the oldest pipelined response the current one.
+
+        prev is the previous current response, which must be complete
+        (or own its socket, if the server is closing the connection).
+        """
+        response, request = self._pipelined.popleft()
+        if response is None or prev.will_close or self.sock is None:
+            # The server won't answer anything more on prev's socket,
+            # so what's left of the pipeline is sent again on a new
+            # one.
+            self._resend(
+                [request] + [req for unused, req in self._pipelined])
+            return
+        self._current_response = response
+        self._current_response_taken = False
+        self._current_request = request
+        # We're a friend of the response class, so let us use the
+        # private attributes.
+        # pylint: disable=W0212
+        excess = prev._takeexcess()
+        if excess:
+            response._load_response(excess)
+
+    def _resend(self, requests):
+        """Send pipelined requests again on a new socket.
+
+        The first request is sent the usual way, and the rest are
+        pipelined behind it.
+        """
+        logger.info('re-sending %d pipelined requests on a new connection',
+                    len(requests))
+        self._pipelined.clear()
+        if self.sock is not None:
+            self.close()
+        method, outgoing_headers, body, chunked, pheaders = requests[0]
+        while not self._sendrequest(method, outgoing_headers, body, chunked,
+                                    False, pheaders):
+            pass
+        self._current_response_taken = False
+        self._current_request = None
+        for request in requests[1:]:
+            self._sendpipelined(request)
+
+    def _checkbusy(self, method, body, expect_continue):
+        """Work out whether a new request can be sent now.
+
+        Returns True if the request has to be pipelined behind
+        outstanding responses, and raises CannotSendRequest if it
+        can't be sent at all.
+        """
+        if not self._sockbusy():
+            self._current_response_taken = False
+            self._current_request = None
+            return False
+        if not self._canpipeline(method, body, expect_continue):
+            raise httplib.CannotSendRequest(
+                'Can not send another request before '
+                'current response is read!')
+        return True
+
+    def _spawn(self):
+        """Returns a new connection to the same server, for another socket."""
+        child = copy.copy(self)
+        child._resetstate()
+        child.max_sockets = 1
+        return child
+
+    def _lanefor(self, method, body, expect_continue):
+        """Choose the connection to send a request on, with max_sockets > 1.
+
+        That's an idle connection if there is one, then a new one if
+        max_sockets allows, then one the request can be pipelined on.
+        """
+        lanes = [self] + self._children
+        for lane in lanes:
+            if not lane._sockbusy():
+                return lane
+        if len(lanes) < self.max_sockets:
+            logger.info('all %d sockets to %s busy, opening another',
+                        len(lanes), self.host)
+            child = self._spawn()
+            self._children.append(child)
+            return child
+        for lane in lanes:
+            if lane._canpipeline(method, body, expect_continue):
+                return lane
+        raise httplib.CannotSendRequest(
+            'Can not send another request before a response on one '
+            'of %d sockets is read!' % self.max_sockets)
+
+    @staticmethod
+    def _checkresend(body):
+        """Raises if a request with body can't be sent a second time."""
+        if not _canresend(body):
+            raise _readers.HTTPRemoteClosedError(
+                'server closed the connection without responding, and '
+                'the request body was used up sending it')
+
     def _reconnect(self, where, pheaders):
         logger.info('reconnecting during %s', where)
         self.close()
@@ -629,37 +1278,154 @@ class HTTPConnection(object):
         """Send a request to the server.
 
         For increased flexibility, this does not return the response
-        object. Future versions of HTTPConnection that juggle multiple
-        sockets will be able to send (for example) 5 requests all at
-        once, and then let the requests arrive as data is
-        available. Use the `getresponse()` method to retrieve the
+        object. Use the `getresponse()` method to retrieve the
         response.
+
+        If the connection was created with a pipeline_depth above 1,
+        up to that many requests may be sent before their responses
+        are read: each getresponse() then returns the response to the
+        oldest request whose response it hasn't returned yet. Only
+        requests with idempotent methods, no 100-continue
+        expectation, and a body that can be sent more than once (not
+        a file or generator) are pipelined; they're sent again on a
+        new socket if the server closes the connection before
+        answering them. Otherwise, sending a request before the
+        current response is read raises CannotSendRequest.
+
+        With max_sockets above 1, a request made while earlier
+        responses are still being read is sent on another socket to
+        the same server (reusing one whose response has been read, or
+        opening a new one), and getresponse() again returns
+        responses in the order requests were made. CannotSendRequest
+        is raised once all max_sockets sockets are busy and the
+        request can't be pipelined on any of them.
+
+        body may be bytes, a file-like object, or an iterable (such
+        as a generator) of bytes-like blocks, which is consumed
+        lazily as the request is sent. Bodies of unknown length are
+        sent chunked unless headers include a Content-Length.
         """
         method = _ensurebytes(method)
         path = _ensurebytes(path)
-        if self.busy():
-            raise httplib.CannotSendRequest(
-                'Can not send another request before '
-                'current response is read!')
-        self._current_response_taken = False
+        hdrs = _foldheaders(headers)
+        # Figure out headers that have to be computed from the request
+        # body.
+        chunked = _framebody(body, hdrs)
+        expect_continue, pheaders = self._specialheaders(hdrs,
+                                                         expect_continue)
+        if self.max_sockets > 1:
+            lane = self._lanefor(method, body, expect_continue)
+            if lane is not self:
+                HTTPConnection.request(lane, method, path, body=body,
+                                       headers=headers,
+                                       expect_continue=expect_continue)
+                self._order.append(lane)
+                return
+        pipeline = self._checkbusy(method, body, expect_continue)
 
         logger.info('sending %s request for %s to %s on port %s',
                     method, path, self.host, self.port)
 
+        # Build header data
+        outgoing_headers = self._buildheaders(
+            method, path, hdrs, self.http_version)
+
+        if pipeline:
+            self._sendpipelined(
+                (method, outgoing_headers, body, chunked, pheaders))
+        elif not self._sendrequest(method, outgoing_headers, body, chunked,
+                                 expect_continue, pheaders):
+            # The reused socket was closed by the server after all.
+            # The retry goes out on a fresh socket, so it won't need
+            # retrying itself.
+            self._checkresend(body)
+            self._sendrequest(method, outgoing_headers, body, chunked,
+                              expect_continue, pheaders)
+        if self.max_sockets > 1:
+            self._order.append(self)
+
+    def prepare(self, method, path, headers={}, expect_continue=False):
+        """Build a request that can be sent many times with sendprepared().
+
+        The request line and headers are validated, encoded and
+        serialized once, here, rather than on every send. Headers
+        that depend on the body (Content-Length or
+        Transfer-Encoding) are added when the request is sent, unless
+        a Content-Length is given in headers.
+
+        The result includes this connection's Host header, so it can
+        only be sent on connections to the same host and port.
+        """
+        method = _ensurebytes(method)
+        path = _ensurebytes(path)
         hdrs = _foldheaders(headers)
-        # Figure out headers that have to be computed from the request
-        # body.
+        framed = HDR_CONTENT_LENGTH in hdrs
+        expect_continue, pheaders = self._specialheaders(hdrs,
+                                                         expect_continue)
+        outgoing_headers = self._buildheaders(
+            method, path, hdrs, self.http_version)
+        return PreparedRequest(self._target(), method, path,
+                               outgoing_headers[:-len(EOL)], framed,
+                               expect_continue, pheaders)
+
+    def sendprepared(self, prepared, body=None):
+        """Send a request built by prepare(), optionally with a body.
+
+        Use the `getresponse()` method to retrieve the response.
+        """
+        if prepared.target != self._target():
+            raise ValueError('prepared request is for %r, not %r' % (
+                prepared.target, self._target()))
+        if self.max_sockets > 1:
+            lane = self._lanefor(prepared.method, body,
+                                 prepared.expect_continue)
+            if lane is not self:
+                HTTPConnection.sendprepared(lane, prepared, body=body)
+                self._order.append(lane)
+                return
+        pipeline = self._checkbusy(prepared.method, body,
+                                   prepared.expect_continue)
+
+        logger.info('sending prepared %s request for %s to %s on port %s',
+                    prepared.method, prepared.path, self.host, self.port)
+
+        hdrs = {}
         chunked = False
-        if body and HDR_CONTENT_LENGTH not in hdrs:
-            if getattr(body, '__len__', False):
-                hdrs[HDR_CONTENT_LENGTH] = (HDR_CONTENT_LENGTH,
-                                            b'%d' % len(body))
-            elif getattr(body, 'read', False):
-                hdrs[HDR_XFER_ENCODING] = (HDR_XFER_ENCODING,
-                                           XFER_ENCODING_CHUNKED)
-                chunked = True
-            else:
-                raise BadRequestData('body has no __len__() nor read()')
+        if not prepared.framed:
+            chunked = _framebody(body, hdrs)
+        outgoing_headers = b''.join(
+            [prepared.header_prefix]
+            + [b'%s: %s%s' % (_ensurebytes(h), _ensurebytes(v), EOL)
+               for h, v in hdrs.values()]
+            + [EOL])
+
+        if pipeline:
+            self._sendpipelined((prepared.method, outgoing_headers, body,
+                                 chunked, prepared.proxy_headers))
+        elif not self._sendrequest(prepared.method, outgoing_headers, body,
+                                 chunked, prepared.expect_continue,
+                                 prepared.proxy_headers):
+            # See request().
+            self._checkresend(body)
+            self._sendrequest(prepared.method, outgoing_headers, body,
+                              chunked, prepared.expect_continue,
+                              prepared.proxy_headers)
+        if self.max_sockets > 1:
+            self._order.append(self)
+
+    def _target(self):
+        """Returns a tuple identifying where requests are sent."""
+        return (self.host, self.port, self.ssl,
+                self._proxy_host, self._proxy_port)
+
+    def _specialheaders(self, hdrs, expect_continue):
+        """Handle headers that change how a request is sent.
+
+        hdrs are folded headers as returned by _foldheaders(), and
+        are modified in place. Returns a tuple of whether to expect
+        a 100-continue response and the headers to send to a proxy
+        for CONNECT.
+        """
         # Figure out expect-continue header
         if hdrs.get('expect', ('', ''))[1].lower() == b'100-continue':
             expect_continue = True
@@ -674,25 +1440,36 @@ class HTTPConnection(object):
             pa = hdrs.pop('proxy-authorization', None)
             if pa is not None:
                 pheaders['proxy-authorization'] = pa
-        # Build header data
-        outgoing_headers = self._buildheaders(
-            method, path, hdrs, self.http_version)
+        return expect_continue, pheaders
+
+    def _sendrequest(self, method, outgoing_headers, body, chunked,
+                     expect_continue, pheaders):
+        """Write a request with serialized headers and wait for a response.
 
+        Returns False if the request needs to be retried on a fresh
+        socket, True otherwise.
+        """
         # If we're reusing the underlying socket, there are some
         # conditions where we'll want to retry, so make a note of the
         # state of self.sock
+        if self.sock is not None and self._isstale():
+            logger.info('server closed idle connection, reconnecting')
+            self._closesock()
         fresh_socket = self.sock is None
         self._connect(pheaders)
         response = None
         first = True
+        writer = _writers.RequestWriter(outgoing_headers, body, chunked,
+                                        OUTGOING_BUFFER_SIZE)
 
-        while ((outgoing_headers or body)
+        while (not writer.done()
                and not (response and response.complete())):
             select_timeout = self.timeout
-            out = outgoing_headers or body
+            out = True
             blocking_on_continue = False
-            if expect_continue and not outgoing_headers and not (
-                response and (response.headers or response.continued)):
+            if expect_continue and writer.headerssent() and not (
+                response and (response._raw_headers is not None
+                              or response.continued)):
                 logger.info(
                     'waiting up to %s seconds for'
                     ' continue response from server',
@@ -700,15 +1477,13 @@ class HTTPConnection(object):
                 select_timeout = self.continue_timeout
                 blocking_on_continue = True
                 out = False
-            if out:
-                w = [self.sock]
-            else:
-                w = []
-            r, w, x = select.select([self.sock], w, [], select_timeout)
+            # The poller is looked up each time around because a
+            # reconnect below replaces the socket.
+            r, w = self._getpoller().wait(True, out, select_timeout)
             # if we were expecting a 100 continue and it's been long
             # enough, just go ahead and assume it's ok. This is the
             # recommended behavior from the RFC.
-            if r == w == x == []:
+            if not r and not w:
                 if blocking_on_continue:
                     expect_continue = False
                     logger.info('no response to continue expectation from '
@@ -721,7 +1496,7 @@ class HTTPConnection(object):
             if r:
                 try:
                     try:
-                        data = r[0].recv(INCOMING_BUFFER_SIZE)
+                        data = self.sock.recv(INCOMING_BUFFER_SIZE)
                     except ssl.SSLError as e:
                         if e.args[0] != ssl.SSL_ERROR_WANT_READ:
                             raise
@@ -768,13 +1543,12 @@ class HTTPConnection(object):
                                 'response was missing or incomplete!')
                     logger.debug('read %d bytes in request()', len(data))
                     if response is None:
-                        response = self.response_class(
-                            r[0], self.timeout, method)
+                        response = self._newresponse(method)
                     # We're a friend of the response class, so let us
                     # use the private attribute.
                     # pylint: disable=W0212
                     response._load_response(data)
-                    # Jump to the next select() call so we load more
+                    # Jump to the next wait() call so we load more
                     # data if the server is still sending us content.
                     continue
                 except socket.error as e:
@@ -784,52 +1558,29 @@ class HTTPConnection(object):
             # outgoing data
             if w and out:
                 try:
-                    if getattr(out, 'read', False):
-                        # pylint guesses the type of out incorrectly here
-                        # pylint: disable=E1103
-                        data = out.read(OUTGOING_BUFFER_SIZE)
-                        if not data:
-                            continue
-                        if len(data) < OUTGOING_BUFFER_SIZE:
-                            if chunked:
-                                body = b'0' + EOL + EOL
-                            else:
-                                body = None
-                        if chunked:
-                            # This encode is okay because we know
-                            # hex() is building us only 0-9 and a-f
-                            # digits.
-                            asciilen = hex(len(data))[2:].encode('ascii')
-                            out = asciilen + EOL + data + EOL
-                        else:
-                            out = data
-                    amt = w[0].send(out)
+                    writer.write(self.sock, headers_only=(
+                        expect_continue and not writer.headerssent()))
                 except socket.error as e:
-                    if e[0] == ssl.SSL_ERROR_WANT_WRITE and self.ssl:
+                    if e.args[0] == ssl.SSL_ERROR_WANT_WRITE and self.ssl:
                         # This means that SSL hasn't flushed its buffer into
                         # the socket yet.
                         # TODO: find a way to block on ssl flushing its buffer
-                        # similar to selecting on a raw socket.
+                        # similar to polling a raw socket.
                         continue
-                    if e[0] == errno.EWOULDBLOCK or e[0] == errno.EAGAIN:
+                    if e.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN):
                         continue
-                    elif (e[0] not in (errno.ECONNRESET, errno.EPIPE)
+                    elif (e.args[0] not in (errno.ECONNRESET, errno.EPIPE)
                           and not first):
                         raise
                     self._reconnect('write', pheaders)
-                    amt = self.sock.send(out)
-                logger.debug('sent %d', amt)
+                    continue
                 first = False
-                if out is body:
-                    body = out[amt:]
-                else:
-                    outgoing_headers = out[amt:]
         # End of request-sending loop.
 
         # close if the server response said to or responded before eating
         # the whole request
         if response is None:
-            response = self.response_class(self.sock, self.timeout, method)
+            response = self._newresponse(method)
             if not fresh_socket:
                 if not response._select():
                     # This means the response failed to get any response
@@ -838,19 +1589,9 @@ class HTTPConnection(object):
                     # the request again on a fresh socket.
                     logger.debug('response._select() failed during request().'
                                  ' Assuming request needs to be retried.')
-                    self.sock = None
-                    # Call this method explicitly to re-try the
-                    # request. We don't use self.request() because
-                    # some tools (notably Mercurial) expect to be able
-                    # to subclass and redefine request(), and they
-                    # don't have the same argspec as we do.
-                    #
-                    # TODO restructure sending of requests to avoid
-                    # this recursion
-                    return HTTPConnection.request(
-                        self, method, path, body=body, headers=headers,
-                        expect_continue=expect_continue)
-        data_left = bool(outgoing_headers or body)
+                    self._closesock()
+                    return False
+        data_left = not writer.done()
         if data_left:
             logger.info('stopped sending request early, '
                          'will close the socket to be safe.')
@@ -860,25 +1601,53 @@ class HTTPConnection(object):
             # the socket
             self.sock = None
         self._current_response = response
+        return True
 
     def getresponse(self):
-        """Returns the response to the most recent request."""
+        """Returns the response to the most recent request.
+
+        When requests are pipelined, or spread over several sockets,
+        this is the response to the oldest request whose response
+        hasn't been returned yet.
+        """
+        if self._order:
+            lane = self._order.popleft()
+            if lane is not self:
+                return HTTPConnection.getresponse(lane)
+        # We're a friend of the response class, so let us use the
+        # private attributes.
+        # pylint: disable=W0212
+        cr = self._current_response
+        if cr is not None and self._current_response_taken and self._pipelined:
+            # Responses arrive in order, so the rest of this one has
+            # to be loaded (and kept for whoever reads it) before we
+            # can get to the next.
+            while not cr.complete():
+                if not cr._select() and not cr.complete():
+                    raise _readers.HTTPRemoteClosedError()
+            self._sockbusy()
         if self._current_response is None:
             raise httplib.ResponseNotReady()
         r = self._current_response
-        while r.headers is None:
-            # We're a friend of the response class, so let us use the
-            # private attribute.
-            # pylint: disable=W0212
+        while r._raw_headers is None:
             if not r._select() and not r.complete():
+                if (self._current_request is not None
+                    and not r.raw_response and not r.continued):
+                    # The server closed the connection without
+                    # answering a pipelined request at all, so it's
+                    # safe to send it (and those after it) again.
+                    self._resend([self._current_request] + [
+                        req for unused, req in self._pipelined])
+                    r = self._current_response
+                    continue
                 raise _readers.HTTPRemoteClosedError()
-        if r.will_close:
-            self.sock = None
-            self._current_response = None
-        elif r.complete():
-            self._current_response = None
-        else:
-            self._current_response_taken = True
+        if self.ssl:
+            # Any TLS 1.3 session tickets will have been read by now.
+            _tls.sessions.save(r.sock)
+        self._current_response_taken = True
+        # This drops r if it's already finished with, and moves on to
+        # the next pipelined response if there is one.
+        self._sockbusy()
         return r
 
 
@@ -897,6 +1666,14 @@ class HTTPProxyConnectFailedException(httplib.HTTPException):
 class HTTPStateError(httplib.HTTPException):
     """Invalid internal state encountered."""
 
+
+class HTTPHeadersTooLargeError(httplib.HTTPException):
+    """The response headers were too large or too numerous."""
+
 # Forward this exception type from _readers since it needs to be part
 # of the public API.
 HTTPRemoteClosedError = _readers.HTTPRemoteClosedError
+
+# All connections share one TLS session cache, whose resumed and full
+# counters show how many handshakes were saved by resuming sessions.
+tls_sessions = _tls.sessions
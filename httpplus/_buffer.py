@@ -0,0 +1,152 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Byte queue used by the response readers to hold body data.
+
+This module is package-private. It is not expected that these will
+have any clients outside of httpplus.
+"""
+from __future__ import absolute_import
+
+import collections
+
+try:
+    b''.join([memoryview(b'')])
+except TypeError:
+    # Python 2's str.join() only accepts strs.
+    def joinbytes(pieces):
+        """Concatenates byte strings, bytearrays and memoryviews."""
+        return b''.join([p.tobytes() if isinstance(p, memoryview)
+                         else bytes(p) for p in pieces])
+else:
+    joinbytes = b''.join
+
+
+class BufferQueue(object):
+    """FIFO of byte strings that can be consumed in arbitrary pieces.
+
+    Each queued chunk is stored together with the bounds of its
+    unconsumed region, so taking part of a chunk just moves an offset
+    instead of re-slicing (and copying) whatever is left over. The
+    cost of read() and readto() is proportional to the number of
+    bytes they return, not to the amount of data queued.
+    """
+    def __init__(self):
+        # Entries are [data, start, end] lists; the head entry's start
+        # advances as it is consumed.
+        self._chunks = collections.deque()
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def append(self, data, start=0, end=None):
+        """Queue data[start:end] without copying it."""
+        if end is None:
+            end = len(data)
+        if start >= end:
+            return
+        self._len += end - start
+        if self._chunks:
+            last = self._chunks[-1]
+            if last[0] is data and last[2] == start:
+                # Contiguous with the previous region of the same
+                # buffer, which happens when a preallocated buffer is
+                # filled in pieces. Just grow that region.
+                last[2] = end
+                return
+        self._chunks.append([data, start, end])
+
+    def read(self, amt):
+        """Remove and return up to amt bytes from the front of the queue."""
+        chunks = self._chunks
+        pieces = []
+        need = amt
+        while need and chunks:
+            entry = chunks[0]
+            data, start, end = entry
+            if end - start <= need:
+                chunks.popleft()
+                need -= end - start
+            else:
+                end = start + need
+                entry[1] = end
+                need = 0
+            if start == 0 and end == len(data):
+                pieces.append(data)
+            else:
+                pieces.append(memoryview(data)[start:end])
+        self._len -= amt - need
+        if not pieces:
+            return b''
+        if len(pieces) == 1:
+            if isinstance(pieces[0], memoryview):
+                return pieces[0].tobytes()
+            # A whole chunk is handed out as-is, even if it is a
+            # bytearray, so that a body collected into one buffer is
+            # never copied on the way out.
+            return pieces[0]
+        return joinbytes(pieces)
+
+    def readinto(self, view):
+        """Move up to len(view) bytes into the writable memoryview view.
+
+        Returns the number of bytes copied.
+        """
+        chunks = self._chunks
+        want = len(view)
+        got = 0
+        while got < want and chunks:
+            entry = chunks[0]
+            data, start, end = entry
+            n = min(end - start, want - got)
+            view[got:got + n] = memoryview(data)[start:start + n]
+            got += n
+            if start + n == end:
+                chunks.popleft()
+            else:
+                entry[1] = start + n
+        self._len -= got
+        return got
+
+    def readto(self, delim, blocks):
+        """Move data up to and including delim onto the blocks list.
+
+        Only the chunk in which delim occurs is split; everything
+        after it stays queued. Returns True if delim was found.
+        """
+        chunks = self._chunks
+        while chunks:
+            data, start, end = chunks[0]
+            i = data.find(delim, start, end)
+            if i == -1:
+                blocks.append(self.read(end - start))
+            else:
+                blocks.append(self.read(i + len(delim) - start))
+                return True
+        return False
@@ -0,0 +1,262 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Opening connections to servers with several addresses.
+
+socket.create_connection() tries a server's addresses one after the
+other, waiting for each attempt to fail before starting the next, so
+one dead address can stall a connection for the kernel's whole SYN
+timeout. create_connection() here races them instead, as in "Happy
+Eyeballs" (RFC 8305): attempts start CONNECTION_ATTEMPT_DELAY apart,
+alternating between address families, and the first to connect
+wins. The family that won is tried first next time. A Connector runs
+such a race without blocking, for callers waiting on other sockets
+too.
+
+This module is package-private. It is not expected that these will
+have any clients outside of httpplus.
+"""
+from __future__ import absolute_import
+
+import collections
+import errno
+import logging
+import os
+import socket
+import time
+
+from . import _poll
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for an attempt before starting the next one
+# alongside it (RFC 8305 recommends 250ms).
+CONNECTION_ATTEMPT_DELAY = 0.25
+
+_now = getattr(time, 'monotonic', time.time)
+
+# The address family that last won the race, for each host.
+_families = {}
+
+_INPROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN,
+               errno.EALREADY)
+
+
+def _interleave(infos, first=None):
+    """Order getaddrinfo() results to alternate between families.
+
+    The first address is from the family first, if there are any,
+    and otherwise from whichever family getaddrinfo() put first.
+    """
+    byfamily = collections.OrderedDict()
+    for info in infos:
+        byfamily.setdefault(info[0], collections.deque()).append(info)
+    queues = list(byfamily.values())
+    if first in byfamily:
+        queues.remove(byfamily[first])
+        queues.insert(0, byfamily[first])
+    ordered = []
+    while queues:
+        for queue in queues:
+            ordered.append(queue.popleft())
+        queues = [q for q in queues if q]
+    return ordered
+
+
+def _error(err):
+    return socket.error(err, os.strerror(err))
+
+
+class Connector(object):
+    """A race between a server's addresses, which never blocks.
+
+    Attempts are started by poll(), which a caller with nothing else
+    to do can simply let wait (as create_connection() does). Callers
+    that have other sockets to wait on too can instead watch() the
+    connector's sockets alongside them, and poll() it without waiting
+    whenever one of them is ready or wakeup() has passed.
+
+    Call close() once done with it, to abandon unfinished attempts.
+    """
+    def __init__(self, address, timeout=None, delay=None, resolver=None):
+        host, port = address
+        self.host = host
+        if delay is None:
+            delay = CONNECTION_ATTEMPT_DELAY
+        self._delay = delay
+        self._deadline = None
+        if timeout is not None:
+            self._deadline = _now() + timeout
+        if resolver is not None:
+            infos = resolver.getaddrinfo(host, port)
+        else:
+            infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        if not infos:
+            raise socket.error('getaddrinfo returned no addresses for %r'
+                               % (host,))
+        self._infos = collections.deque(_interleave(infos,
+                                                    _families.get(host)))
+        self._attempts = _poll.SocketSet()
+        # Other SocketSets the attempts are registered in, and the
+        # data to register them with.
+        self._watchers = []
+        # Sockets still connecting, and the family of each.
+        self._pending = {}
+        self._error = None
+        self._winner = self._family = None
+        self._nextstart = _now()
+
+    def watch(self, sockets, data):
+        """Register the attempts' sockets (for writing) in sockets too.
+
+        They're registered with data, and discarded from sockets as
+        attempts finish.
+        """
+        self._watchers.append((sockets, data))
+        for sock in self._pending:
+            sockets.set(sock, False, True, data)
+
+    def wakeup(self):
+        """Returns the time poll() must next be called by, or None."""
+        wakeups = [t for t in (self._deadline,
+                               self._infos and self._nextstart or None)
+                   if t is not None]
+        return wakeups and min(wakeups) or None
+
+    def poll(self, timeout=0):
+        """Make what progress is possible, waiting up to timeout seconds.
+
+        If timeout is None, waits until the race is over. Returns the
+        winning socket, in non-blocking mode, or None if there isn't
+        one yet. Raises socket.timeout if nothing connects within the
+        connector's timeout (if it isn't None), or the error from the
+        last attempt to fail if they all do.
+        """
+        end = None
+        if timeout is not None:
+            end = _now() + timeout
+        waited = False
+        while self._winner is None:
+            now = _now()
+            if self._infos and (now >= self._nextstart or not self._pending):
+                self._start(now)
+                # Start the next attempt straight away if this one
+                # has already failed.
+                continue
+            if not self._pending:
+                raise self._error
+            if self._deadline is not None and now >= self._deadline:
+                raise socket.timeout('timed out connecting to %r'
+                                     % (self.host,))
+            if waited and end is not None and now >= end:
+                return None
+            wakeups = [t for t in (self.wakeup(), end) if t is not None]
+            wait = None
+            if wakeups:
+                wait = max(0, min(wakeups) - now)
+            for sock, unused_readable, unused_writable in (
+                    self._attempts.select(wait)):
+                self._check(sock)
+            waited = True
+        _families[self.host] = self._family
+        winner = self._winner
+        self.close()
+        return winner
+
+    def close(self):
+        """Abandon the attempts still in progress, closing their sockets."""
+        for sock in list(self._pending):
+            self._forget(sock)
+            sock.close()
+        self._attempts.close()
+        self._watchers = []
+
+    def _start(self, now):
+        af, socktype, proto, unused_canon, sa = self._infos.popleft()
+        logger.debug('connecting to %r', sa)
+        sock = None
+        try:
+            sock = socket.socket(af, socktype, proto)
+            sock.setblocking(0)
+            err = sock.connect_ex(sa)
+        except socket.error as e:
+            # Such as EAFNOSUPPORT for IPv6 addresses on a host
+            # without IPv6. The other addresses may still work.
+            logger.debug('unable to connect to %r: %s', sa, e)
+            if sock is not None:
+                sock.close()
+            self._error = e
+            return
+        if err == 0:
+            self._winner, self._family = sock, af
+        elif err in _INPROGRESS:
+            self._pending[sock] = af
+            self._attempts.set(sock, False, True, sock)
+            for sockets, data in self._watchers:
+                sockets.set(sock, False, True, data)
+            self._nextstart = now + self._delay
+        else:
+            sock.close()
+            self._error = _error(err)
+
+    def _check(self, sock):
+        """Finish the attempt on sock, which is writable."""
+        af = self._forget(sock)
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err == 0 and self._winner is None:
+            self._winner, self._family = sock, af
+            return
+        sock.close()
+        if err:
+            logger.debug('connection attempt failed: %s', os.strerror(err))
+            self._error = _error(err)
+
+    def _forget(self, sock):
+        self._attempts.discard(sock)
+        for sockets, unused_data in self._watchers:
+            sockets.discard(sock)
+        return self._pending.pop(sock)
+
+
+def create_connection(address, timeout=None, delay=None, resolver=None):
+    """Connect to (host, port), racing the host's addresses.
+
+    The addresses come from resolver's getaddrinfo(host, port) if
+    given (see dnscache), and socket.getaddrinfo() otherwise.
+
+    Raises socket.timeout if nothing connects within timeout seconds
+    (if it isn't None), or the error from the last attempt to fail if
+    they all do. The socket is returned in blocking mode.
+    """
+    connector = Connector(address, timeout, delay, resolver)
+    try:
+        sock = connector.poll(None)
+    finally:
+        connector.close()
+    sock.setblocking(1)
+    return sock
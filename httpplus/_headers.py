@@ -0,0 +1,156 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Parsing and storage of HTTP response headers.
+
+This module is package-private. It is not expected that these will
+have any clients outside of httpplus.
+"""
+from __future__ import absolute_import
+
+import logging
+import re
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Headers that determine how a response body is framed.
+_FRAMING_RE = re.compile(
+    br'^(content-length|transfer-encoding|connection):[ \t]*(.*?)[ \t]*\r?$',
+    re.IGNORECASE | re.MULTILINE)
+
+
+class HeaderMap(object):
+    """Case-insensitive multi-valued mapping of header names to values.
+
+    This provides the parts of the rfc822.Message and
+    email.message.Message APIs that httpplus (and httplib) clients
+    use. Header names keep the case the server sent them in, and
+    iteration follows the order they were received.
+    """
+    def __init__(self, items=()):
+        self._items = []
+        self._index = {}
+        for name, value in items:
+            self.add(name, value)
+
+    def add(self, name, value):
+        """Add a header, keeping any existing values for name."""
+        self._items.append((name, value))
+        self._index.setdefault(name.lower(), []).append(value)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, name):
+        return name.lower() in self._index
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def get(self, name, failobj=None):
+        """Returns the first value of header name, or failobj."""
+        values = self._index.get(name.lower())
+        if values is None:
+            return failobj
+        return values[0]
+
+    def get_all(self, name, failobj=None):
+        """Returns a list of all values of header name, or failobj."""
+        values = self._index.get(name.lower())
+        if values is None:
+            return failobj
+        return list(values)
+
+    def getheader(self, name, default=None):
+        return self.get(name, failobj=default)
+
+    def getheaders(self, name):
+        return self.get_all(name)
+
+    def keys(self):
+        return [k for k, unused_v in self._items]
+
+    def values(self):
+        return [v for unused_k, v in self._items]
+
+    def items(self):
+        return list(self._items)
+
+    def __repr__(self):
+        return '<HeaderMap %r>' % (self._items,)
+
+
+def parse(block):
+    """Parse a block of CRLF-separated header lines into a HeaderMap.
+
+    The status line and the blank line that ends the headers must not
+    be included. Values are decoded as iso-8859-1, per RFC 2616, and
+    folded continuation lines are kept (including their line breaks)
+    the same way email.message_from_string() does.
+    """
+    if sys.version_info > (3, 0):
+        block = block.decode('iso-8859-1')
+    items = []
+    for line in block.split('\r\n'):
+        if line[:1] in (' ', '\t'):
+            if items:
+                items[-1][1] += '\r\n' + line
+            continue
+        name, sep, value = line.partition(':')
+        if not sep:
+            if line:
+                logger.debug('ignoring malformed header line %r', line)
+            continue
+        items.append([name, value.lstrip(' \t')])
+    if sys.version_info < (3, 0):
+        # Fix multi-line headers to match httplib's behavior from
+        # Python 2.x.
+        for item in items:
+            if '\r\n' in item[1]:
+                item[1] = '\n'.join(
+                    [' ' + x.lstrip() for x in item[1].split('\r\n')])[1:]
+    return HeaderMap(items)
+
+
+def framing(block):
+    """Find the body framing headers in a block of header lines.
+
+    Returns a dict mapping the lower-cased names of any
+    Content-Length, Transfer-Encoding and Connection headers to their
+    first value. This is much cheaper than parse() since it doesn't
+    look at any other headers; folded values are not supported.
+    """
+    found = {}
+    for m in _FRAMING_RE.finditer(block):
+        found.setdefault(m.group(1).lower().decode('ascii'),
+                         m.group(2).decode('iso-8859-1'))
+    return found
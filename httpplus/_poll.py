@@ -0,0 +1,201 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Waiting for connections' sockets to become ready.
+
+This module is package-private. It is not expected that these will
+have any clients outside of httpplus.
+"""
+from __future__ import absolute_import
+
+import select
+
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
+
+def _pending(sock):
+    """Returns True if sock has data buffered in userspace.
+
+    SSL sockets decrypt whole records, so there can be data ready to
+    read that the kernel (and so any poller) knows nothing about.
+    """
+    pending = getattr(sock, 'pending', None)
+    return pending is not None and pending() > 0
+
+
+class _SelectorPoller(object):
+    """Waits on one socket using the best selector for the platform.
+
+    The socket is registered once, when the poller is created, and
+    stays registered until close(); the registration is only
+    modified when the set of events being waited for changes. With
+    epoll (or kqueue) a wait is then a single system call whose cost
+    doesn't depend on the socket's fd number.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self._selector = selectors.DefaultSelector()
+        self._events = selectors.EVENT_READ
+        self._selector.register(sock, self._events)
+
+    def wait(self, read, write, timeout):
+        """Wait up to timeout seconds (forever if None) for the socket.
+
+        Returns a (readable, writable) pair of booleans, which are
+        both False if the wait timed out.
+        """
+        if read and _pending(self.sock):
+            return True, False
+        events = ((read and selectors.EVENT_READ)
+                  | (write and selectors.EVENT_WRITE))
+        assert events, 'must wait for reading, writing or both'
+        if events != self._events:
+            self._selector.modify(self.sock, events)
+            self._events = events
+        ready = 0
+        for unused_key, mask in self._selector.select(timeout):
+            ready |= mask
+        return (bool(ready & selectors.EVENT_READ),
+                bool(ready & selectors.EVENT_WRITE))
+
+    def close(self):
+        """Release the poller's resources. The socket is left open."""
+        self._selector.close()
+
+
+class _SelectPoller(object):
+    """Waits on one socket using select(), where selectors is missing."""
+    def __init__(self, sock):
+        self.sock = sock
+
+    def wait(self, read, write, timeout):
+        if read and _pending(self.sock):
+            return True, False
+        r, w, unused_x = select.select(read and [self.sock] or [],
+                                       write and [self.sock] or [],
+                                       [], timeout)
+        return bool(r), bool(w)
+
+    def close(self):
+        pass
+
+
+class _SelectorSocketSet(object):
+    """Waits on many sockets at once using the platform's best selector.
+
+    Each socket is registered along with the events to wait for and a
+    piece of data identifying it to the caller. As with
+    _SelectorPoller, the registration is only touched when those
+    events change.
+    """
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+
+    def __len__(self):
+        return len(self._selector.get_map())
+
+    def set(self, sock, read, write, data):
+        """Wait for sock to become readable and/or writable."""
+        events = ((read and selectors.EVENT_READ)
+                  | (write and selectors.EVENT_WRITE))
+        assert events, 'must wait for reading, writing or both'
+        try:
+            key = self._selector.get_key(sock)
+        except KeyError:
+            self._selector.register(sock, events, data)
+            return
+        if key.events != events or key.data is not data:
+            self._selector.modify(sock, events, data)
+
+    def discard(self, sock):
+        """Stop waiting on sock, if we were. Do this before closing it."""
+        try:
+            self._selector.unregister(sock)
+        except KeyError:
+            pass
+
+    def select(self, timeout):
+        """Wait up to timeout seconds (forever if None) for any socket.
+
+        Returns a list of (data, readable, writable) tuples for the
+        sockets that are ready, which is empty if the wait timed out.
+        """
+        pending = [(key.data, True, False)
+                   for key in self._selector.get_map().values()
+                   if key.events & selectors.EVENT_READ
+                   and _pending(key.fileobj)]
+        if pending:
+            return pending
+        return [(key.data, bool(mask & selectors.EVENT_READ),
+                 bool(mask & selectors.EVENT_WRITE))
+                for key, mask in self._selector.select(timeout)]
+
+    def close(self):
+        """Release the selector. The sockets are left open."""
+        self._selector.close()
+
+
+class _SelectSocketSet(object):
+    """Waits on many sockets using select(), where selectors is missing."""
+    def __init__(self):
+        self._socks = {}
+
+    def __len__(self):
+        return len(self._socks)
+
+    def set(self, sock, read, write, data):
+        self._socks[sock] = (read, write, data)
+
+    def discard(self, sock):
+        self._socks.pop(sock, None)
+
+    def select(self, timeout):
+        pending = [(data, True, False)
+                   for sock, (read, unused, data) in self._socks.items()
+                   if read and _pending(sock)]
+        if pending:
+            return pending
+        r, w, unused_x = select.select(
+            [s for s, (read, unused, unused) in self._socks.items() if read],
+            [s for s, (unused, write, unused) in self._socks.items() if write],
+            [], timeout)
+        return [(self._socks[s][2], s in r, s in w) for s in set(r + w)]
+
+    def close(self):
+        self._socks.clear()
+
+
+if selectors is not None:
+    Poller = _SelectorPoller
+    SocketSet = _SelectorSocketSet
+else:
+    Poller = _SelectPoller
+    SocketSet = _SelectSocketSet
@@ -41,6 +41,10 @@ except ImportError:
 
 import logging
 
+from . import (
+    _buffer,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -58,25 +62,23 @@ class AbstractReader(object):
     Subclasses must implement _load, and should implement _close if
     it's not an error for the server to close their socket without
     some termination condition being detected during _load.
+
+    Readers that can tell where the body ends keep any data loaded
+    past that point, which on a pipelined connection is the start of
+    the next response, for _takeexcess().
     """
     def __init__(self):
         self._finished = False
-        self._done_chunks = []
-        self.available_data = 0
-
-    def _addchunk(self, data):
-        self._done_chunks.append(data)
-        self.available_data += len(data)
-
-    def _pushchunk(self, data):
-        self._done_chunks.insert(0, data)
-        self.available_data += len(data)
+        self._buffer = _buffer.BufferQueue()
+        self._excess = b''
 
-    def _popchunk(self):
-        b = self._done_chunks.pop(0)
-        self.available_data -= len(b)
+    @property
+    def available_data(self):
+        """Number of body bytes loaded but not yet read."""
+        return len(self._buffer)
 
-        return b
+    def _addchunk(self, data, start=0, end=None):
+        self._buffer.append(data, start, end)
 
     def done(self):
         """Returns true if the response body is entirely read."""
@@ -86,55 +88,76 @@ class AbstractReader(object):
         """Read amt bytes from the response body."""
         if self.available_data < amt and not self._finished:
             raise ReadNotReady()
-        blocks = []
-        need = amt
-        while self._done_chunks:
-            b = self._popchunk()
-            if len(b) > need:
-                nb = b[:need]
-                self._pushchunk(b[need:])
-                b = nb
-            blocks.append(b)
-            need -= len(b)
-            if need == 0:
-                break
-        result = b''.join(blocks)
+        result = self._buffer.read(amt)
         assert len(result) == amt or (self._finished and len(result) < amt)
 
         return result
 
+    def readinto(self, view):
+        """Copy available body data into the writable memoryview view.
+
+        Returns the number of bytes copied, which may be less than
+        len(view) (including zero) if not enough data is loaded.
+        """
+        return self._buffer.readinto(view)
+
     def readto(self, delimstr, blocks = None):
         """return available data chunks up to the first one in which
         delimstr occurs. No data will be returned after delimstr --
         the chunk in which it occurs will be split and the remainder
-        pushed back onto the available data queue. If blocks is
-        supplied chunks will be added to blocks, otherwise a new list
-        will be allocated.
+        left on the available data queue. If blocks is supplied
+        chunks will be added to blocks, otherwise a new list will be
+        allocated.
         """
         if blocks is None:
             blocks = []
 
-        while self._done_chunks:
-            b = self._popchunk()
-            i = b.find(delimstr) + len(delimstr)
-            if i:
-                if i < len(b):
-                    self._pushchunk(b[i:])
-                blocks.append(b[:i])
-                break
-            else:
-                blocks.append(b)
+        self._buffer.readto(delimstr, blocks)
 
         return blocks
 
+    def _takeexcess(self):
+        """Returns (and forgets) any data loaded past the end of the body."""
+        excess, self._excess = self._excess, b''
+        return excess
+
     def _load(self, data): # pragma: no cover
         """Subclasses must implement this.
 
         As data is available to be read out of this object, it should
-        be placed into the _done_chunks list. Subclasses should not
-        rely on data remaining in _done_chunks forever, as it may be
-        reaped if the client is parsing data as it comes in.
+        be queued with _addchunk(). Subclasses should not rely on data
+        remaining queued forever, as it may be reaped if the client is
+        parsing data as it comes in.
+        """
+        raise NotImplementedError
+
+    def _directlimit(self, amt): # pylint: disable=W0613
+        """Returns how much body data may bypass this reader.
+
+        The response may receive up to this many bytes (at most amt)
+        from the socket straight into a caller-supplied buffer, and
+        then must report them with _directloaded(). Readers that need
+        to decode the body, or that still have queued data which
+        must be returned first, return 0.
+        """
+        return 0
+
+    def _directloaded(self, amt): # pragma: no cover
+        """Account for amt bytes received directly by the response."""
+        raise NotImplementedError
+
+    def _loadbuffer(self):
+        """Returns a writable memoryview for the response to fill, or None.
+
+        Readers that collect the body into storage of their own can
+        return the unfilled part of it here, so the response can
+        receive into it directly instead of calling _load(). The
+        response then reports how much it received with _bufferloaded().
         """
+        return None
+
+    def _bufferloaded(self, amt): # pragma: no cover
+        """Account for amt bytes received into the _loadbuffer() view."""
         raise NotImplementedError
 
     def _close(self):
@@ -166,6 +189,15 @@ class AbstractSimpleReader(AbstractReader):
                      self.name, len(data)) # pylint: disable=E1101
         self._addchunk(data)
 
+    def _directlimit(self, amt):
+        if self._finished or self.available_data:
+            return 0
+        return amt
+
+    def _directloaded(self, amt):
+        logger.debug('%s read an additional %d data directly',
+                     self.name, amt) # pylint: disable=E1101
+
 
 class CloseIsEndReader(AbstractSimpleReader):
     """Reader for responses that specify Connection: Close for length."""
@@ -177,62 +209,152 @@ class CloseIsEndReader(AbstractSimpleReader):
 
 
 class ContentLengthReader(AbstractSimpleReader):
-    """Reader for responses that specify an exact content length."""
+    """Reader for responses that specify an exact content length.
+
+    If preallocate is true, the body is collected into a single
+    bytearray of exactly the content length, and reading the whole
+    body in one go returns that bytearray without any joining.
+    """
     name = 'content-length'
 
-    def __init__(self, amount):
+    def __init__(self, amount, preallocate=False):
         AbstractSimpleReader.__init__(self)
         self._amount = amount
         if amount == 0:
             self._finished = True
         self._amount_seen = 0
+        self._body = None
+        if preallocate:
+            self._body = bytearray(amount)
 
     def _load(self, data):
-        AbstractSimpleReader._load(self, data)
-        self._amount_seen += len(data)
+        start = self._amount_seen
+        amt = min(len(data), self._amount - start)
+        if amt < len(data):
+            self._excess += data[amt:]
+        if not amt:
+            return
+        logger.debug('%s read an additional %d data', self.name, amt)
+        if self._body is None:
+            self._addchunk(data, 0, amt)
+            self._seen(amt)
+        else:
+            self._body[start:start + amt] = memoryview(data)[:amt]
+            self._bufferloaded(amt)
+
+    def _loadbuffer(self):
+        if self._body is None or self._finished:
+            return None
+        return memoryview(self._body)[self._amount_seen:]
+
+    def _bufferloaded(self, amt):
+        start = self._amount_seen
+        self._addchunk(self._body, start, start + amt)
+        self._seen(amt)
+
+    def _directlimit(self, amt):
+        return min(AbstractSimpleReader._directlimit(self, amt),
+                   self._amount - self._amount_seen)
+
+    def _directloaded(self, amt):
+        AbstractSimpleReader._directloaded(self, amt)
+        self._seen(amt)
+
+    def _seen(self, amt):
+        self._amount_seen += amt
         if self._amount_seen >= self._amount:
             self._finished = True
             logger.debug('content-length read complete')
 
 
+# States of the chunked transfer-encoding decoder.
+_CHUNK_SIZE = 'size'
+_CHUNK_DATA = 'data'
+_CHUNK_DATA_EOL = 'data-eol'
+_CHUNK_TRAILER = 'trailer'
+
+# Longest chunk-size or trailer line we're willing to buffer.
+MAX_CHUNK_LINE = 1 << 16
+
+
 class ChunkedReader(AbstractReader):
-    """Reader for chunked transfer encoding responses."""
+    """Reader for chunked transfer encoding responses.
+
+    Decoding is done incrementally by a small state machine, so input
+    that spans recv() boundaries is never concatenated or re-scanned:
+    only an incomplete size or trailer line is carried over between
+    loads, and chunk data is queued as offsets into the buffers it
+    arrived in. Chunk extensions are ignored. Trailer lines are kept
+    in trailer_lines once the body is complete.
+    """
     def __init__(self, eol):
         AbstractReader.__init__(self)
         self._eol = eol
-        self._leftover_skip_amt = 0
-        self._leftover_data = ''
+        self._state = _CHUNK_SIZE
+        # Bytes of chunk data (or of its trailing EOL) still expected.
+        self._left = 0
+        # Start of a size or trailer line that hasn't been terminated yet.
+        self._partial = b''
+        self.trailer_lines = []
+
+    def _takeline(self, data, position):
+        """Returns (line, new position), with line None if incomplete."""
+        eol = self._eol
+        partial = self._partial
+        if (partial and len(eol) > 1 and partial[-1:] == eol[:1]
+            and data[position:position + len(eol) - 1] == eol[1:]):
+            # The EOL itself was split between two loads.
+            self._partial = b''
+            return partial[:-1], position + len(eol) - 1
+        split = data.find(eol, position)
+        if split == -1:
+            self._partial = partial + data[position:]
+            if len(self._partial) > MAX_CHUNK_LINE:
+                raise httplib.LineTooLong('chunked encoding line')
+            return None, len(data)
+        self._partial = b''
+        if partial:
+            return partial + data[position:split], split + len(eol)
+        return data[position:split], split + len(eol)
 
     def _load(self, data):
-        assert not self._finished, 'tried to add data to a closed reader!'
+        if self._finished:
+            self._excess += data
+            return
         logger.debug('chunked read an additional %d data', len(data))
         position = 0
-        if self._leftover_data:
-            logger.debug(
-                'chunked reader trying to finish block from leftover data')
-            # TODO: avoid this string concatenation if possible
-            data = self._leftover_data + data
-            position = self._leftover_skip_amt
-            self._leftover_data = ''
-            self._leftover_skip_amt = 0
         datalen = len(data)
-        while position < datalen:
-            split = data.find(self._eol, position)
-            if split == -1:
-                self._leftover_data = data
-                self._leftover_skip_amt = position
+        while position < datalen and not self._finished:
+            state = self._state
+            if state == _CHUNK_DATA or state == _CHUNK_DATA_EOL:
+                amt = min(self._left, datalen - position)
+                if state == _CHUNK_DATA:
+                    self._addchunk(data, position, position + amt)
+                position += amt
+                self._left -= amt
+                if self._left:
+                    continue
+                if state == _CHUNK_DATA:
+                    self._state = _CHUNK_DATA_EOL
+                    self._left = len(self._eol)
+                else:
+                    self._state = _CHUNK_SIZE
+                continue
+            line, position = self._takeline(data, position)
+            if line is None:
                 return
-            amt = int(data[position:split], base=16)
-            block_start = split + len(self._eol)
-            # If the whole data chunk plus the eol trailer hasn't
-            # loaded, we'll wait for the next load.
-            if block_start + amt + len(self._eol) > len(data):
-                self._leftover_data = data
-                self._leftover_skip_amt = position
-                return
-            if amt == 0:
+            if state == _CHUNK_SIZE:
+                amt = int(line.split(b';', 1)[0], base=16)
+                if amt == 0:
+                    logger.debug('chunk of length 0 seen, reading trailers')
+                    self._state = _CHUNK_TRAILER
+                else:
+                    self._state = _CHUNK_DATA
+                    self._left = amt
+            elif line:
+                self.trailer_lines.append(line)
+            else:
                 self._finished = True
-                logger.debug('closing chunked reader due to chunk of length 0')
-                return
-            self._addchunk(data[block_start:block_start + amt])
-            position = block_start + amt + len(self._eol)
+                logger.debug('closing chunked reader after end of trailers')
+        if position < datalen:
+            self._excess += data[position:]
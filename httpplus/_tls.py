@@ -0,0 +1,238 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Shared SSL contexts.
+
+ssl.wrap_socket() makes a new SSLContext every time it's called,
+loading CA certificates and setting up ciphers from scratch for each
+connection. wrap_socket() here takes the same arguments, but wraps
+sockets with a context made once per distinct set of them.
+
+It also keeps the sessions from finished handshakes, and offers them
+to the server when connecting to the same place again, so that
+reconnecting can resume a session instead of doing a full handshake.
+
+This module is package-private. It is not expected that these will
+have any clients outside of httpplus.
+"""
+from __future__ import absolute_import
+
+import collections
+import socket
+import ssl
+import threading
+import weakref
+
+# ssl.wrap_socket() arguments that apply to the socket being wrapped,
+# rather than to the context.
+_SOCKET_ARGS = ('server_side', 'do_handshake_on_connect',
+                'suppress_ragged_eofs')
+
+_contexts = {}
+_lock = threading.Lock()
+
+
+def _newcontext(keyfile=None, certfile=None, cert_reqs=ssl.CERT_NONE,
+                ssl_version=None, ca_certs=None, ciphers=None):
+    """Make a context configured as ssl.wrap_socket() would."""
+    if ssl_version is None:
+        context = ssl.SSLContext(getattr(ssl, 'PROTOCOL_TLS_CLIENT',
+                                         ssl.PROTOCOL_SSLv23))
+    else:
+        context = ssl.SSLContext(ssl_version)
+    # ssl.wrap_socket() doesn't check host names, only certificates
+    # (if cert_reqs says to).
+    context.check_hostname = False
+    context.verify_mode = cert_reqs
+    if ca_certs:
+        context.load_verify_locations(ca_certs)
+    if certfile:
+        context.load_cert_chain(certfile, keyfile)
+    if ciphers:
+        context.set_ciphers(ciphers)
+    return context
+
+
+def context(**ssl_opts):
+    """Returns the shared context for ssl.wrap_socket() style options."""
+    key = tuple(sorted(ssl_opts.items()))
+    try:
+        return _contexts[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # Some option isn't hashable, so there's no sharing this.
+        return _newcontext(**ssl_opts)
+    with _lock:
+        if key not in _contexts:
+            _contexts[key] = _newcontext(**ssl_opts)
+        return _contexts[key]
+
+
+class SessionCache(object):
+    """Sessions from past TLS handshakes, to offer when reconnecting.
+
+    Sessions are kept per (host, address, context). The context stands
+    in for the ssl options it was made from, and OpenSSL won't resume
+    a session under any other context anyway.
+
+    Attributes:
+      resumed: The number of handshakes that resumed a cached session.
+      full: The number of handshakes that didn't.
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.resumed = 0
+        self.full = 0
+        self._sessions = collections.OrderedDict()
+        # Live sockets -> [key, whether a session has been saved from
+        # the socket yet].
+        self._sockets = weakref.WeakKeyDictionary()
+        # Live sockets still to do their handshake -> key.
+        self._handshaking = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, key):
+        """Returns the session to offer for key, or None."""
+        with self._lock:
+            return self._sessions.get(key)
+
+    def wrapped(self, sock, key):
+        """Notes the key for sock, whose handshake is yet to be done."""
+        with self._lock:
+            self._handshaking[sock] = key
+
+    def handshaken(self, sock, key=None):
+        """Counts sock's handshake, and saves its session under key.
+
+        If key is None, it's the one given to wrapped() for sock, and
+        sockets that weren't are ignored.
+        """
+        with self._lock:
+            if key is None:
+                key = self._handshaking.pop(sock, None)
+                if key is None:
+                    return
+            if getattr(sock, 'session_reused', False):
+                self.resumed += 1
+            else:
+                self.full += 1
+            self._sockets[sock] = [key, False]
+        self.save(sock)
+
+    def save(self, sock):
+        """Saves sock's session, if it has one that can be resumed.
+
+        With TLS 1.3 the server sends its session tickets after the
+        handshake, and they're only picked up once data is read, so
+        this is called again when responses arrive and before sockets
+        are closed. Sockets this cache doesn't know are ignored, as
+        are ones whose session has already been saved.
+        """
+        if sock is None:
+            return
+        entry = self._sockets.get(sock)
+        if entry is None or entry[1]:
+            return
+        session = getattr(sock, 'session', None)
+        if session is None:
+            return
+        if not session.has_ticket and sock.version() == 'TLSv1.3':
+            # Not resumable until a ticket shows up.
+            return
+        with self._lock:
+            entry[1] = True
+            key = entry[0]
+            self._sessions.pop(key, None)
+            self._sessions[key] = session
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+
+    def clear(self):
+        """Forgets all sessions and resets the counters."""
+        with self._lock:
+            self._sessions.clear()
+            self._sockets.clear()
+            self._handshaking.clear()
+            self.resumed = self.full = 0
+
+
+sessions = SessionCache()
+
+
+def wrap_socket(sock, server_hostname=None, ssl_context=None, **ssl_opts):
+    """Like ssl.wrap_socket(), but using a shared context.
+
+    Unlike ssl.wrap_socket(), server_hostname is sent to the server
+    (for SNI), though as with ssl.wrap_socket() it isn't checked
+    against the server's certificate. If ssl_context is given,
+    sockets are wrapped with it instead of one made from ssl_opts.
+
+    The last session saved for the same host, address and context
+    is offered to the server for resumption. If do_handshake_on_connect
+    is False, do the handshake with do_handshake() below.
+    """
+    wrapargs = dict((k, ssl_opts.pop(k)) for k in _SOCKET_ARGS
+                    if k in ssl_opts)
+    if (isinstance(server_hostname, bytes)
+            and not isinstance(server_hostname, str)):
+        # Python 3.6's ssl doesn't decode bytes host names itself.
+        server_hostname = server_hostname.decode('ascii')
+    if ssl_context is None:
+        ssl_context = context(**ssl_opts)
+    try:
+        peer = sock.getpeername()
+    except (AttributeError, socket.error):
+        peer = None
+    key = (server_hostname, peer, ssl_context)
+    session = sessions.get(key)
+    if session is not None:
+        # Only passed when there's one, since SSLContexts that predate
+        # sessions don't take the argument.
+        wrapargs['session'] = session
+    sock = ssl_context.wrap_socket(sock, server_hostname=server_hostname,
+                                   **wrapargs)
+    if wrapargs.get('do_handshake_on_connect', True):
+        sessions.handshaken(sock, key)
+    else:
+        sessions.wrapped(sock, key)
+    return sock
+
+
+def do_handshake(sock):
+    """Do (or continue) the handshake of a non-blocking ssl socket.
+
+    Raises ssl.SSLError with SSL_ERROR_WANT_READ or
+    SSL_ERROR_WANT_WRITE until the handshake is done, as
+    sock.do_handshake() does, and then keeps the session.
+    """
+    sock.do_handshake()
+    sessions.handshaken(sock)
@@ -0,0 +1,356 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Writer objects to abstract out sending different request body types.
+
+This module is package-private. It is not expected that these will
+have any clients outside of httpplus.
+"""
+from __future__ import absolute_import
+
+import collections
+import logging
+import mmap
+import os
+import socket
+import ssl
+import stat
+
+from . import _buffer
+
+logger = logging.getLogger(__name__)
+
+EOL = b'\r\n'
+
+# Most segments we'll hand to a single sendmsg() call. This is well
+# below IOV_MAX everywhere.
+_MAX_SEGMENTS = 64
+
+# Bounds on how much data we offer the socket in one call. The upper
+# bound is raised to the socket's send buffer size if that's larger.
+_MIN_WRITE_SIZE = 1 << 12
+_MAX_WRITE_SIZE = 1 << 22
+
+# Not every platform has MSG_MORE; there we just don't cork.
+_MSG_MORE = getattr(socket, 'MSG_MORE', 0)
+
+
+def _sndbuf(sock):
+    """Returns the size of sock's send buffer, or 0 if unknown."""
+    try:
+        return sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+    except (AttributeError, socket.error):
+        return 0
+
+
+def _cansendmsg(sock):
+    # SSL sockets have a sendmsg() method, but it always raises.
+    return (getattr(sock, 'sendmsg', None) is not None
+            and not isinstance(sock, ssl.SSLSocket))
+
+
+def _cansendfile(sock):
+    # sendfile() bypasses the SSL layer entirely, so it's only usable
+    # on plaintext sockets backed by a real file descriptor.
+    return (getattr(os, 'sendfile', None) is not None
+            and getattr(sock, 'fileno', None) is not None
+            and not isinstance(sock, ssl.SSLSocket))
+
+
+def isiterable(body):
+    """Returns True if body should be sent by iterating over it.
+
+    That's anything iterable that isn't itself a block of bytes: a
+    generator, an iterator, or a list or tuple of blocks.
+    """
+    if isinstance(body, (list, tuple)):
+        return True
+    return (getattr(body, '__iter__', None) is not None
+            and getattr(body, '__len__', None) is None
+            and getattr(body, 'read', None) is None)
+
+
+def filerange(body):
+    """Find the unread part of a file body on disk.
+
+    Returns (fd, offset, length) if body is backed by a regular file,
+    or None if it's anything else (a pipe, a socket, an in-memory
+    file, ...) and has to be read to find out how long it is.
+    """
+    try:
+        fd = body.fileno()
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        offset = body.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+    return fd, offset, max(0, st.st_size - offset)
+
+
+class RequestWriter(object):
+    """Queue of request data waiting to be written to a socket.
+
+    The serialized headers, any chunked transfer-encoding framing and
+    the body are queued as separate memoryview segments and never
+    concatenated. Where the socket supports it, pending segments are
+    handed to the kernel with a single sendmsg() call, so a small
+    request goes out as one write. Other sockets (notably SSL ones)
+    get small segments copied together into one buffer per send()
+    instead. After a partial write, the unsent part of a segment is a
+    slice of the same memoryview, so no data is ever re-copied.
+
+    The amount offered per write (and read from file bodies at once)
+    starts at blocksize and adapts to what the socket actually
+    accepts: it doubles while writes are taken whole, up to the
+    socket's send buffer size, and drops to the accepted amount after
+    a short write.
+
+    A body that is a regular file of known length (see filerange())
+    and isn't being chunked is never read into Python at all: on a
+    plaintext socket it is handed to os.sendfile(), and otherwise it
+    is memory-mapped and queued as one more segment.
+
+    A body that is an iterable of bytes-like blocks (see isiterable())
+    is pulled from lazily, one write's worth at a time, with each
+    block becoming a chunk when the body is chunked.
+    """
+    def __init__(self, headers, body, chunked, blocksize):
+        self._segments = collections.deque()
+        self._queued = 0
+        self._headers_left = len(headers)
+        self._chunked = chunked
+        self._blocksize = blocksize
+        self._writesize = blocksize
+        self._maxwritesize = None
+        self._source = None
+        self._iterator = None
+        self._file = None
+        self._filerange = None
+        self._queue(headers)
+        if not body:
+            return
+        if getattr(body, 'read', False):
+            rng = None if chunked else filerange(body)
+            if rng is None:
+                self._source = body
+            else:
+                self._file = body
+                self._filerange = list(rng)
+        elif isiterable(body):
+            self._iterator = iter(body)
+        else:
+            self._queue(body)
+
+    def _queue(self, data):
+        view = memoryview(data)
+        if view.itemsize != 1:
+            view = view.cast('B')
+        if len(view):
+            self._segments.append(view)
+            self._queued += len(view)
+
+    def headerssent(self):
+        """Returns True once all of the request headers have been written."""
+        return not self._headers_left
+
+    def done(self):
+        """Returns True once the entire request has been written."""
+        return (not self._segments and self._source is None
+                and self._iterator is None and self._file is None)
+
+    def _mapfile(self):
+        """Queue a memory map of a file body in place of sendfile()."""
+        body, (fd, offset, length) = self._file, self._filerange
+        self._file = None
+        if not length:
+            return
+        # mmap offsets have to be aligned, so map from the start of
+        # the page holding offset and skip to it in the view.
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        try:
+            mapped = mmap.mmap(fd, offset + length - start, offset=start,
+                               access=mmap.ACCESS_READ)
+            # Python 2's mmaps can't be viewed with a memoryview.
+            view = memoryview(mapped)
+        except (EnvironmentError, TypeError, ValueError):
+            logger.debug('unable to mmap request body, reading it instead')
+            self._source = body
+            return
+        self._queue(view[offset - start:])
+        body.seek(offset + length)
+
+    def _sendfile(self, sock, limit):
+        """Send up to limit bytes of a file body with os.sendfile()."""
+        fd, offset, left = self._filerange
+        amt = os.sendfile(sock.fileno(), fd, offset, min(limit, left))
+        if not amt:
+            raise IOError('request body file shrank while being sent')
+        self._filerange = [fd, offset + amt, left - amt]
+        if amt == left:
+            self._file.seek(offset + amt)
+            self._file = None
+        return amt
+
+    def _fill(self):
+        """Pull more of a streamed body, if there is one and we're low on data.
+
+        Several blocks may be pulled from an iterable body, since
+        generators often yield small pieces, but never much more than
+        one write's worth: memory use stays bounded however long the
+        body is.
+        """
+        while (self._queued < self._writesize
+               and len(self._segments) < _MAX_SEGMENTS):
+            if self._source is not None:
+                # pylint guesses the type of _source incorrectly here
+                # pylint: disable=E1103
+                data = self._source.read(self._writesize)
+                if not data:
+                    self._source = None
+            elif self._iterator is not None:
+                data = self._nextitem()
+                if data is None:
+                    self._iterator = None
+            else:
+                return
+            if not data:
+                if self._chunked:
+                    self._queue(b'0' + EOL + EOL)
+                return
+            if self._chunked:
+                # This encode is okay because we know hex() is building
+                # us only 0-9 and a-f digits.
+                self._queue(hex(len(data))[2:].encode('ascii') + EOL)
+                self._queue(data)
+                self._queue(EOL)
+            else:
+                self._queue(data)
+
+    def _nextitem(self):
+        """Returns the next non-empty block of an iterable body, or None."""
+        for data in self._iterator:
+            # An empty chunk would end a chunked body early, so skip them.
+            if len(data):
+                if isinstance(data, memoryview) and data.itemsize != 1:
+                    data = data.cast('B')
+                return data
+        return None
+
+    def write(self, sock, headers_only=False):
+        """Write as much queued data as sock accepts in one call.
+
+        If headers_only is true, no body data is written. Returns the
+        number of bytes written; socket errors are left to the caller.
+        """
+        if self._maxwritesize is None:
+            self._maxwritesize = max(self._blocksize, _sndbuf(sock))
+            if self._file is not None and not _cansendfile(sock):
+                self._mapfile()
+        limit = self._writesize
+        if headers_only:
+            if not self._headers_left:
+                return 0
+            data = self._segments[0][:limit]
+            offered = len(data)
+            amt = sock.send(data)
+        else:
+            self._fill()
+            if not self._segments:
+                if self._file is None:
+                    return 0
+                offered = min(limit, self._filerange[2])
+                amt = self._sendfile(sock, limit)
+                self._adapt(offered, amt)
+                return amt
+            # If a sendfile() is going to follow, tell the kernel to
+            # hold what we send now so that the headers and the start
+            # of the file can still go out in one packet.
+            flags = _MSG_MORE if self._file is not None else 0
+            if _cansendmsg(sock) and (len(self._segments) > 1 or flags):
+                segments = self._take(limit)
+                offered = sum(len(seg) for seg in segments)
+                if flags:
+                    amt = sock.sendmsg(segments, [], flags)
+                else:
+                    amt = sock.sendmsg(segments)
+            else:
+                data = self._coalesce(limit)
+                offered = len(data)
+                amt = sock.send(data)
+        self._consume(amt)
+        self._adapt(offered, amt)
+        return amt
+
+    def _adapt(self, offered, amt):
+        """Resize future writes based on how much of one was accepted."""
+        if amt < offered:
+            self._writesize = max(_MIN_WRITE_SIZE, amt)
+        elif offered >= self._writesize:
+            self._writesize = min(self._writesize * 2, self._maxwritesize,
+                                  _MAX_WRITE_SIZE)
+
+    def _take(self, limit):
+        """Returns leading segments totalling at most limit bytes."""
+        segments = []
+        for seg in self._segments:
+            if len(seg) >= limit:
+                segments.append(seg[:limit])
+                break
+            segments.append(seg)
+            limit -= len(seg)
+            if len(segments) == _MAX_SEGMENTS:
+                break
+        return segments
+
+    def _coalesce(self, limit):
+        """Returns the next block of at most limit bytes to pass to send().
+
+        Small segments are copied together, so that (for example)
+        headers, chunk framing and the start of the body can share one
+        send() and so one TLS record. A single segment is passed on
+        without copying.
+        """
+        segments = self._take(limit)
+        if len(segments) == 1:
+            return segments[0]
+        return _buffer.joinbytes(segments)
+
+    def _consume(self, amt):
+        logger.debug('sent %d', amt)
+        self._queued -= amt
+        self._headers_left = max(0, self._headers_left - amt)
+        segments = self._segments
+        while amt:
+            seg = segments[0]
+            if len(seg) <= amt:
+                segments.popleft()
+                amt -= len(seg)
+            else:
+                segments[0] = seg[amt:]
+                amt = 0
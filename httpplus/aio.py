@@ -0,0 +1,484 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""HTTP client for asyncio.
+
+AsyncHTTPConnection does its I/O with asyncio streams, but the HTTP
+handling is httpplus's own: requests are framed and serialized
+exactly as HTTPConnection does it, and responses are parsed by an
+HTTPResponse that is fed data from the stream instead of reading a
+socket itself. That includes 100-continue handling, and noticing
+when the server responds before the whole request has been sent.
+
+  con = AsyncHTTPConnection('example.com', use_ssl=True)
+  await con.request('GET', '/')
+  resp = await con.getresponse()
+  async for block in resp:
+      ...
+
+This module requires Python 3.7 or later.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import contextlib
+import http.client as httplib
+import logging
+import ssl
+
+from . import (
+    HTTPConnection,
+    HTTPRemoteClosedError,
+    HTTPResponse,
+    HTTPTimeoutException,
+    HTTP_VER_1_1,
+    INCOMING_BUFFER_SIZE,
+    OUTGOING_BUFFER_SIZE,
+    TIMEOUT_ASSUME_CONTINUE,
+    TIMEOUT_DEFAULT,
+    _ensurebytes,
+    _foldheaders,
+    _framebody,
+    _writers,
+    pool,
+)
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['AsyncHTTPConnection', 'AsyncHTTPConnectionPool',
+           'AsyncHTTPResponse']
+
+
+async def _withtimeout(awaitable, timeout, what):
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise HTTPTimeoutException('timeout %s' % what)
+
+
+async def _readsome(reader, response, timeout):
+    """Feed the next data from reader to response.
+
+    Returns False if the server closed the connection.
+    """
+    data = await _withtimeout(reader.read(INCOMING_BUFFER_SIZE),
+                              timeout, 'reading data')
+    # We're a friend of the response class, so let us use the private
+    # attributes.
+    # pylint: disable=W0212
+    if not data:
+        response._close()
+        return False
+    response._load_response(data)
+    return True
+
+
+_default_context = None
+
+
+def _defaultcontext():
+    """Returns the SSL context shared by connections not given one."""
+    global _default_context # pylint: disable=W0603
+    if _default_context is None:
+        _default_context = ssl.create_default_context()
+    return _default_context
+
+
+class _StreamSocket(object):
+    """Gives an asyncio StreamWriter the send() a RequestWriter expects.
+
+    Writes are buffered by the stream, so everything offered is
+    accepted; the caller awaits drain() between writes. written says
+    whether anything has been, and so may have reached the server.
+    """
+    def __init__(self, writer):
+        self._writer = writer
+        self.written = False
+
+    def send(self, data):
+        if self._writer.transport.is_closing():
+            # The transport would silently drop the data.
+            raise ConnectionResetError('connection lost before writing')
+        self._writer.write(data)
+        self.written = True
+        return len(data)
+
+
+class AsyncHTTPResponse(object):
+    """Response from an AsyncHTTPConnection.
+
+    The parsing is done by an HTTPResponse, which status, reason,
+    headers and the like come from. The body can be read with read()
+    or readline(), or iterated over asynchronously, which yields
+    blocks of it as they arrive.
+    """
+    def __init__(self, response, reader, writer, timeout):
+        self._response = response
+        self._streamreader = reader
+        self._streamwriter = writer
+        self._timeout = timeout
+
+    status = property(lambda self: self._response.status)
+    reason = property(lambda self: self._response.reason)
+    http_version = property(lambda self: self._response.http_version)
+    will_close = property(lambda self: self._response.will_close)
+    headers = property(lambda self: self._response.headers)
+    trailers = property(lambda self: self._response.trailers)
+
+    def getheader(self, header, default=None):
+        return self._response.getheader(header, default=default)
+
+    def getheaders(self):
+        return self._response.getheaders()
+
+    def complete(self):
+        """Returns true if this response is completely loaded."""
+        return self._response.complete()
+
+    async def _fill(self):
+        if not await _readsome(self._streamreader, self._response,
+                               self._timeout):
+            if not self.complete():
+                raise HTTPRemoteClosedError()
+
+    def _done(self):
+        if self.complete() and self.will_close:
+            self._streamwriter.close()
+
+    async def read(self, amt=None):
+        """Read data from the response body.
+
+        With no amt, this waits for the whole body.
+        """
+        # We're a friend of the response class here.
+        # pylint: disable=W0212
+        reader = self._response._reader
+        while (not self.complete()
+               and (not amt or amt > reader.available_data)):
+            await self._fill()
+        if not amt:
+            amt = reader.available_data
+        data = reader.read(amt)
+        self._done()
+        return data
+
+    async def readline(self):
+        """Read a single line from the response body."""
+        # We're a friend of the response class here.
+        # pylint: disable=W0212
+        reader = self._response._reader
+        blocks = []
+        while True:
+            reader.readto(b'\n', blocks)
+            if blocks and blocks[-1][-1:] == b'\n' or self.complete():
+                break
+            await self._fill()
+        self._done()
+        return b''.join(blocks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # We're a friend of the response class here.
+        # pylint: disable=W0212
+        reader = self._response._reader
+        while not reader.available_data and not self.complete():
+            await self._fill()
+        data = reader.read(reader.available_data)
+        self._done()
+        if not data:
+            raise StopAsyncIteration
+        return data
+
+
+class AsyncHTTPConnection(object):
+    """Connection to a single http server, for use with asyncio.
+
+    This mirrors HTTPConnection, except that request(), getresponse()
+    and reading responses are coroutines. Proxies aren't supported.
+
+    For SSL connections, ssl_context is used if given; otherwise the
+    default context from ssl.create_default_context() is, which
+    (unlike HTTPConnection's default) verifies the server's
+    certificate.
+    """
+    http_version = HTTP_VER_1_1
+    response_class = HTTPResponse
+
+    def __init__(self, host, port=None, use_ssl=None,
+                 timeout=TIMEOUT_DEFAULT,
+                 continue_timeout=TIMEOUT_ASSUME_CONTINUE,
+                 ssl_context=None, proxy_hostport=None):
+        if proxy_hostport is not None:
+            raise ValueError('AsyncHTTPConnection does not support proxies')
+        # Requests are serialized by an HTTPConnection that never
+        # connects, so they come out exactly as they would from one.
+        self._template = HTTPConnection(host, port, use_ssl=use_ssl)
+        self.host = self._template.host
+        self.port = self._template.port
+        self.ssl = self._template.ssl
+        self.timeout = timeout
+        self.continue_timeout = continue_timeout
+        self._ssl_context = ssl_context
+        self._reader = self._writer = None
+        self._current_response = None
+        self._current_response_taken = False
+
+    @property
+    def sock(self):
+        """The stream being written to, or None if not connected.
+
+        This is named for compatibility with HTTPConnection (and so
+        HTTPConnectionPool).
+        """
+        return self._writer
+
+    async def _connect(self):
+        context = None
+        host = self.host.decode('ascii')
+        if self.ssl:
+            context = self._ssl_context or _defaultcontext()
+        logger.info('connecting to %s on port %s', host, self.port)
+        self._reader, self._writer = await _withtimeout(
+            asyncio.open_connection(host, self.port, ssl=context,
+                                    server_hostname=context and host),
+            self.timeout, 'connecting')
+
+    def close(self):
+        """Close the connection to the server.
+
+        This is a no-op if the connection is already closed.
+        """
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._reader = self._writer = None
+        self._current_response = None
+        logger.info('closed connection to %s on %s', self.host, self.port)
+
+    def busy(self):
+        """Returns True if a response on this connection is still pending."""
+        cr = self._current_response
+        if cr is None:
+            return False
+        if self._current_response_taken and cr.complete():
+            self._current_response = None
+            if cr.will_close:
+                self._reader = self._writer = None
+            return False
+        return True
+
+    async def request(self, method, path, body=None, headers={},
+                      expect_continue=False):
+        """Send a request to the server.
+
+        The arguments are as for HTTPConnection.request(); body may
+        also be an iterable of blocks. Use getresponse() to retrieve
+        the response.
+        """
+        if self.busy():
+            raise httplib.CannotSendRequest(
+                'Can not send another request before '
+                'current response is read!')
+        method = _ensurebytes(method)
+        path = _ensurebytes(path)
+        hdrs = _foldheaders(headers)
+        chunked = _framebody(body, hdrs)
+        # pylint: disable=W0212
+        expect_continue, unused_pheaders = self._template._specialheaders(
+            hdrs, expect_continue)
+        outgoing_headers = self._template._buildheaders(
+            method, path, hdrs, self.http_version)
+
+        logger.info('sending %s request for %s to %s on port %s',
+                    method, path, self.host, self.port)
+        reused = self._writer is not None
+        if reused and self._reader.at_eof():
+            # The server closed the connection while it was idle.
+            self.close()
+            reused = False
+        if not reused:
+            await self._connect()
+        out = _StreamSocket(self._writer)
+        try:
+            await self._send(out, method, outgoing_headers, body, chunked,
+                             expect_continue)
+        except (ConnectionResetError, BrokenPipeError):
+            # Most likely a keepalive the server gave up on. Once any
+            # of the request may have reached the server, it's not
+            # safe to send it again.
+            if not reused or out.written:
+                raise
+            logger.info('connection reset writing to reused connection, '
+                        'will retry')
+            self.close()
+            await self._connect()
+            await self._send(_StreamSocket(self._writer), method,
+                             outgoing_headers, body, chunked, expect_continue)
+
+    async def _send(self, out, method, outgoing_headers, body, chunked,
+                    expect_continue):
+        response = self.response_class(None, self.timeout, method)
+        self._current_response = response
+        self._current_response_taken = False
+        writer = _writers.RequestWriter(outgoing_headers, body, chunked,
+                                        OUTGOING_BUFFER_SIZE)
+        while not writer.headerssent():
+            writer.write(out, headers_only=True)
+        await _withtimeout(self._writer.drain(), self.timeout,
+                           'sending data')
+        if expect_continue:
+            await self._awaitcontinue(response)
+            # We're a friend of the response class here.
+            # pylint: disable=W0212
+            if response._raw_headers is not None:
+                # The server answered without wanting the body (a 417,
+                # say), so don't send it. The connection can't be
+                # reused, since the server may not expect it either.
+                logger.info('got a final response to continue expectation,'
+                            ' not sending request body')
+                response.will_close = True
+                return
+        if writer.done():
+            return
+        # Keep reading while the body is sent, in case the server
+        # responds before it has all of it.
+        reading = asyncio.ensure_future(
+            _readsome(self._reader, response, self.timeout))
+        try:
+            while not writer.done():
+                if reading.done():
+                    if not reading.result() or response.complete():
+                        logger.info('stopped sending request early, '
+                                    'will close the socket to be safe.')
+                        response.will_close = True
+                        return
+                    reading = asyncio.ensure_future(
+                        _readsome(self._reader, response, self.timeout))
+                writer.write(out)
+                drain = asyncio.ensure_future(self._writer.drain())
+                done, unused_pending = await asyncio.wait(
+                    [drain, reading], timeout=self.timeout,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    drain.cancel()
+                    raise HTTPTimeoutException('timeout sending data')
+                if drain in done:
+                    drain.result()
+                else:
+                    # The server said something; look at it before
+                    # waiting on the write any longer.
+                    drain.cancel()
+        finally:
+            if not reading.done():
+                reading.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await reading
+            elif not reading.cancelled():
+                reading.result()
+
+    async def _awaitcontinue(self, response):
+        """Wait a while for the server to accept or refuse the body."""
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.continue_timeout
+        # pylint: disable=W0212
+        while not response.continued and response._raw_headers is None:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                if not await asyncio.wait_for(
+                        _readsome(self._reader, response, None), remaining):
+                    break
+            except asyncio.TimeoutError:
+                break
+        else:
+            return
+        logger.info('no response to continue expectation from '
+                    'server, optimistically sending request body')
+
+    async def getresponse(self):
+        """Returns the response to the most recent request."""
+        r = self._current_response
+        if r is None:
+            raise httplib.ResponseNotReady()
+        # We're a friend of the response class, so let us use the
+        # private attributes.
+        # pylint: disable=W0212
+        while r._raw_headers is None:
+            if (not await _readsome(self._reader, r, self.timeout)
+                    and not r.complete()):
+                raise HTTPRemoteClosedError()
+        self._current_response_taken = True
+        response = AsyncHTTPResponse(r, self._reader, self._writer,
+                                     self.timeout)
+        if r.will_close:
+            # The response owns the stream now.
+            self._reader = self._writer = None
+            self._current_response = None
+        self.busy()
+        return response
+
+
+class AsyncHTTPConnectionPool(pool.HTTPConnectionPool):
+    """HTTPConnectionPool of AsyncHTTPConnections.
+
+    Its connection() is an asynchronous context manager which, rather
+    than raising PoolExhaustedError, waits for a connection to be
+    returned to the pool.
+    """
+    connection_class = AsyncHTTPConnection
+
+    def __init__(self, *args, **kwargs):
+        pool.HTTPConnectionPool.__init__(self, *args, **kwargs)
+        self._returned = None
+
+    @contextlib.asynccontextmanager
+    async def connection(self, host, port=None, use_ssl=None,
+                         proxy_hostport=None):
+        if self._returned is None:
+            self._returned = asyncio.Condition()
+        returned = self._returned
+        async with returned:
+            while True:
+                try:
+                    con = self.get(host, port, use_ssl, proxy_hostport)
+                    break
+                except pool.PoolExhaustedError:
+                    await returned.wait()
+        try:
+            yield con
+        except BaseException:
+            self.discard(con)
+            raise
+        else:
+            self.put(con)
+        finally:
+            async with returned:
+                returned.notify_all()
@@ -0,0 +1,222 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Caching of host name lookups.
+
+Every new socket needs the server's addresses, and getaddrinfo()
+blocks for as long as the system's resolver takes, every time.
+HTTPConnections instead look servers up through a CachingResolver,
+by default the one shared by all of them, `default`:
+
+  dnscache.default.ttl = 300
+  dnscache.prefetch(['api.example.com', 'cdn.example.com'])
+
+Lookups are cached for ttl seconds; failed lookups for negative_ttl
+seconds. Once an entry expires it may still be used for up to
+max_stale seconds more, while it is looked up again in a background
+thread. At most maxsize hosts are remembered.
+"""
+from __future__ import absolute_import
+
+import collections
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['CachingResolver', 'default', 'prefetch']
+
+_now = getattr(time, 'monotonic', time.time)
+
+
+class _Entry(object):
+    """Result of looking up a host: addresses, or the error raised."""
+    def __init__(self, infos, error, expires):
+        self.infos = infos
+        self.error = error
+        self.expires = expires
+
+
+def _hostname(host):
+    """Normalize a host name, so that each host has one cache entry."""
+    if isinstance(host, bytes):
+        host = host.decode('ascii')
+    return host.lower()
+
+
+def _withport(infos, port):
+    """Fill port into getaddrinfo() results looked up without one."""
+    return [(af, socktype, proto, canon, (sa[0], port) + tuple(sa[2:]))
+            for af, socktype, proto, canon, sa in infos]
+
+
+class CachingResolver(object):
+    """Looks up host names, caching the results.
+
+    Hosts are looked up without a port, so one entry serves
+    connections to any port on the host.
+
+    Attributes:
+      ttl: seconds a successful lookup is used for. 0 disables
+        caching, of failed lookups as well.
+      negative_ttl: seconds a failed lookup is remembered for, during
+        which looking the host up again fails straight away.
+      max_stale: seconds after expiring that a successful lookup may
+        still be used, while it's refreshed in the background.
+      maxsize: the most hosts to remember. The ones looked up longest
+        ago are forgotten first.
+      hits, misses: lookups answered from the cache, and not.
+    """
+    def __init__(self, ttl=60, negative_ttl=5, max_stale=60, maxsize=1000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_stale = max_stale
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        # In the order the hosts were looked up in. Only changed with
+        # _lock held; getaddrinfo() reads it without.
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Hosts being looked up in the background.
+        self._refreshing = set()
+
+    def getaddrinfo(self, host, port):
+        """Returns socket.getaddrinfo() results for a stream to host:port.
+
+        Raises socket.gaierror if the host can't be found.
+        """
+        host = _hostname(host)
+        entry = self._cache.get(host)
+        if entry is not None:
+            now = _now()
+            if now < entry.expires:
+                self.hits += 1
+                if entry.error is not None:
+                    raise socket.gaierror(*entry.error.args)
+                return _withport(entry.infos, port)
+            if (entry.error is None
+                    and now < entry.expires + self.max_stale):
+                self.hits += 1
+                self._refresh([host])
+                return _withport(entry.infos, port)
+        self.misses += 1
+        return _withport(self._lookup(host), port)
+
+    def _lookup(self, host, keepstale=False):
+        """Look host up and cache the result.
+
+        If keepstale is True, a failure doesn't replace addresses
+        already cached, even expired ones.
+        """
+        try:
+            infos = socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            stale = self._cache.get(host)
+            if keepstale and stale is not None and stale.error is None:
+                # The stale addresses are better than nothing, until
+                # they expire for good.
+                raise
+            if self.ttl and self.negative_ttl:
+                self._store(host, _Entry(None, e, _now() + self.negative_ttl))
+            raise
+        if self.ttl:
+            self._store(host, _Entry(infos, None, _now() + self.ttl))
+        return infos
+
+    def _store(self, host, entry):
+        with self._lock:
+            self._cache.pop(host, None)
+            self._cache[host] = entry
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def _refresh(self, hosts):
+        """Look hosts up again, one after another, in a background thread.
+
+        Hosts already being looked up in the background are skipped.
+        """
+        with self._lock:
+            todo = []
+            for host in hosts:
+                if host not in self._refreshing:
+                    self._refreshing.add(host)
+                    todo.append(host)
+        if not todo:
+            return
+        def refresh():
+            try:
+                for host in todo:
+                    try:
+                        self._lookup(host, keepstale=True)
+                    except socket.gaierror as e:
+                        logger.info('looking up %r in the background '
+                                    'failed: %s', host, e)
+                    with self._lock:
+                        self._refreshing.discard(host)
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(todo)
+        self._spawn(refresh)
+
+    def _spawn(self, fn): # pylint: disable=no-self-use
+        t = threading.Thread(target=fn, name='httpplus dnscache')
+        t.daemon = True
+        t.start()
+
+    def prefetch(self, hosts, wait=False):
+        """Look up hosts (names, without ports) ahead of time.
+
+        The lookups are done one after another, in a single
+        background thread unless wait is True. Hosts that can't be
+        found are cached as such; no error is raised.
+        """
+        hosts = [_hostname(host) for host in hosts]
+        if not wait:
+            self._refresh(hosts)
+            return
+        for host in hosts:
+            try:
+                self._lookup(host)
+            except socket.gaierror as e:
+                logger.info('prefetching %r failed: %s', host, e)
+
+    def clear(self):
+        """Forget everything cached."""
+        with self._lock:
+            self._cache.clear()
+
+
+# Shared by every HTTPConnection not given a resolver of its own.
+default = CachingResolver()
+
+
+def prefetch(hosts, wait=False):
+    """Look up hosts ahead of time, in the default resolver."""
+    default.prefetch(hosts, wait=wait)
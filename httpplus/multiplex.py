@@ -0,0 +1,644 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Driving many HTTPConnections from a single thread.
+
+HTTPConnection.request() and HTTPResponse.read() each wait on their
+own socket, so a thread can only make progress on one transfer at a
+time. A Multiplexer instead waits on the sockets of all the
+connections it has been given requests for at once, and advances
+each transfer as its socket becomes ready:
+
+  mux = multiplex.Multiplexer()
+  for con in connections:
+      mux.request(con, 'GET', '/')
+  results = []
+  for transfer in mux.as_completed():
+      if transfer.error is None:
+          results.append((transfer.response.status, transfer.body))
+
+Requests for the same connection are sent one after another, reusing
+its socket if the server allows it. Connections are opened when
+their first request starts, alongside the other transfers rather than
+holding them up, apart from connecting through a proxy and the
+handshake of a custom ssl_wrap_socket. While a transfer is in
+progress its connection is busy() and must not be used directly.
+
+fetch_many() builds on this to fetch lots of URLs over a bounded
+number of pooled keepalive connections:
+
+  for url, transfer in multiplex.fetch_many(urls, max_concurrency=20):
+      ...
+"""
+from __future__ import absolute_import
+
+import collections
+import errno
+import logging
+import socket
+import ssl
+import time
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+try:
+    import httplib
+    httplib.HTTPException
+except ImportError:
+    import http.client as httplib
+
+from . import (
+    HTTPRemoteClosedError,
+    HTTPStateError,
+    HTTPTimeoutException,
+    INCOMING_BUFFER_SIZE,
+    OUTGOING_BUFFER_SIZE,
+    _canresend,
+    _ensurebytes,
+    _foldheaders,
+    _framebody,
+    _hostport,
+    _poll,
+    _tls,
+    _writers,
+    pool,
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    _now = time.monotonic
+except AttributeError:
+    _now = time.time
+
+# How long fetch_many waits before asking an exhausted pool again, when
+# it has no transfers of its own to wait for.
+_POOL_RETRY_DELAY = 0.05
+
+# Transfer states.
+_QUEUED, _CONNECTING, _SENDING, _RECEIVING, _DONE = range(5)
+
+
+class Transfer(object):
+    """A request being made by a Multiplexer, and eventually its result.
+
+    Attributes:
+      connection: the HTTPConnection the request is sent on.
+      method, path: of the request.
+      response: the HTTPResponse, once the transfer has finished
+        successfully. It has been completely read.
+      body: the response body, once the transfer has finished
+        successfully.
+      error: the exception that stopped the transfer, if it failed.
+      queued, started, responded, finished: times (from a monotonic
+        clock) at which the request was made, began to be sent
+        (including connecting, if need be), got the first byte of
+        its response, and finished.
+    """
+    def __init__(self, mux, connection, method, path, body, headers,
+                 expect_continue, callback):
+        self._mux = mux
+        self.connection = connection
+        self.method = _ensurebytes(method)
+        self.path = _ensurebytes(path)
+        self.response = None
+        self.body = None
+        self.error = None
+        self.queued = _now()
+        self.started = self.responded = self.finished = None
+        self._callback = callback
+        self._state = _QUEUED
+
+        hdrs = _foldheaders(headers)
+        self._chunked = _framebody(body, hdrs)
+        # We're a friend of the connection class here.
+        # pylint: disable=W0212
+        self._expect_continue, self._pheaders = (
+            connection._specialheaders(hdrs, expect_continue))
+        self._headers = connection._buildheaders(
+            self.method, self.path, hdrs, connection.http_version)
+        self._body = body
+        self._sock = None
+        self._writer = None
+        # The race to connect, while there is one, and then which way
+        # the ssl handshake (if any) is waiting for the socket.
+        self._connector = None
+        self._handshakewrite = False
+        self._reused = False
+        self._deadline = self._continue_deadline = None
+
+    def done(self):
+        """Returns True once the transfer has finished, either way."""
+        return self._state == _DONE
+
+    @property
+    def elapsed(self):
+        """Seconds from starting to send the request to finishing."""
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def _start(self):
+        """Connect if need be and begin sending the request."""
+        con = self.connection
+        # We're a friend of the connection class here.
+        # pylint: disable=W0212
+        if con.sock is not None and con._isstale():
+            logger.info('server closed idle connection, reconnecting')
+            con._closesock()
+        self._reused = con.sock is not None
+        if self.started is None:
+            self.started = _now()
+        if con.sock is None and con._proxy_host is None:
+            # Connect without blocking, so other transfers carry on
+            # while this one waits for the server.
+            self._state = _CONNECTING
+            self._sock = self._deadline = None
+            self._connector = con._startconnection()
+            self._connector.watch(self._mux._sockets, self)
+            self._onconnecting()
+            return
+        con._connect(self._pheaders)
+        self._send()
+
+    def _onconnecting(self):
+        """Advance the race to connect, or the ssl handshake after it."""
+        con = self.connection
+        # We're a friend of the connection class here.
+        # pylint: disable=W0212
+        if self._connector is not None:
+            try:
+                sock = self._connector.poll()
+            except socket.timeout:
+                raise HTTPTimeoutException(
+                    'timeout connecting to %r' % ((con.host, con.port),))
+            if sock is None:
+                return
+            self._connector = None
+            if not (con.ssl and con._ssl_deferrable):
+                if con.ssl:
+                    # A custom ssl_wrap_socket does the handshake
+                    # itself, blocking.
+                    sock = con._wrapssl(sock)
+                    sock.setblocking(0)
+                con.sock = sock
+                self._send()
+                return
+            sock = con._wrapssl(sock, do_handshake_on_connect=False)
+            sock.setblocking(0)
+            con.sock = self._sock = sock
+            self._progress()
+        try:
+            _tls.do_handshake(self._sock)
+        except ssl.SSLError as e:
+            if e.args[0] == ssl.SSL_ERROR_WANT_READ:
+                self._handshakewrite = False
+                return
+            if e.args[0] == ssl.SSL_ERROR_WANT_WRITE:
+                self._handshakewrite = True
+                return
+            raise
+        if con._ssl_validator:
+            con._ssl_validator(self._sock)
+        self._send()
+
+    def _send(self):
+        """Begin sending the request on the connected socket."""
+        con = self.connection
+        # We're a friend of the connection class here.
+        # pylint: disable=W0212
+        self._sock = con.sock
+        response = con.response_class(con.sock, con.timeout, self.method)
+        con._current_response = response
+        con._current_response_taken = False
+        self.response = response
+        self._writer = _writers.RequestWriter(
+            self._headers, self._body, self._chunked,
+            OUTGOING_BUFFER_SIZE)
+        self._state = _SENDING
+        self._continue_deadline = None
+        self._progress()
+        self._update()
+
+    def _progress(self):
+        if self.connection.timeout is not None:
+            self._deadline = _now() + self.connection.timeout
+
+    def _waitingforcontinue(self):
+        response = self.response
+        # pylint: disable=W0212
+        return (self._expect_continue and self._writer.headerssent()
+                and not response.continued
+                and response._raw_headers is None)
+
+    def _update(self):
+        """Tell the multiplexer what our socket is waiting for."""
+        if self._state == _CONNECTING:
+            # While racing to connect, the connector registers the
+            # sockets itself.
+            if self._connector is None:
+                self._mux._sockets.set(self._sock, not self._handshakewrite,
+                                       self._handshakewrite, self)
+            return
+        write = (self._state == _SENDING and not self._waitingforcontinue())
+        self._mux._sockets.set(self._sock, True, write, self)
+
+    def _canretry(self):
+        """Returns True if the request may be sent again on a new socket.
+
+        That's only the case if the socket was left over from an
+        earlier request (so the server most likely closed it while
+        it was idle) and the server hasn't said anything at all.
+        """
+        # pylint: disable=W0212
+        response = self.response
+        # raw_response goes away once the headers have been parsed.
+        return (self._reused and not getattr(response, 'raw_response', None)
+                and response._raw_headers is None
+                and not response.continued
+                and _canresend(self._body))
+
+    def _retry(self):
+        logger.info('connection closed on reused socket, will retry')
+        self._disconnect()
+        self._start()
+
+    def _disconnect(self):
+        self._mux._sockets.discard(self._sock)
+        self.connection.close()
+
+    def _onwritable(self):
+        writer = self._writer
+        try:
+            writer.write(self._sock, headers_only=(
+                self._expect_continue and not writer.headerssent()))
+        except socket.error as e:
+            if e.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN):
+                return
+            if self.connection.ssl and e.args[0] == ssl.SSL_ERROR_WANT_WRITE:
+                return
+            if (e.args[0] in (errno.ECONNRESET, errno.EPIPE)
+                    and self._canretry()):
+                self._retry()
+                return
+            raise
+        self._progress()
+        if self._waitingforcontinue() and self._continue_deadline is None:
+            self._continue_deadline = (
+                _now() + self.connection.continue_timeout)
+        if writer.done():
+            self._state = _RECEIVING
+
+    def _onreadable(self):
+        response = self.response
+        try:
+            data = self._sock.recv(INCOMING_BUFFER_SIZE)
+        except ssl.SSLError as e:
+            if e.args[0] != ssl.SSL_ERROR_WANT_READ:
+                raise
+            return
+        except socket.error as e:
+            if e.args[0] != errno.ECONNRESET:
+                raise
+            data = b''
+        # We're a friend of the response class here.
+        # pylint: disable=W0212
+        if not data:
+            response._close()
+            if response.complete():
+                self._finish()
+            elif self._canretry():
+                self._retry()
+            else:
+                raise HTTPRemoteClosedError()
+            return
+        self._progress()
+        if self.responded is None:
+            self.responded = _now()
+        response._load_response(data)
+        if response.complete():
+            self._finish()
+
+    def _ontimeout(self, now):
+        if self._connector is not None:
+            wakeup = self._connector.wakeup()
+            if wakeup is not None and now >= wakeup:
+                self._onconnecting()
+            return
+        if self._continue_deadline is not None and now >= self._continue_deadline:
+            logger.info('no response to continue expectation from '
+                        'server, optimistically sending request body')
+            self._expect_continue = False
+            self._continue_deadline = None
+        if self._deadline is not None and now >= self._deadline:
+            raise HTTPTimeoutException('timeout %s' % {
+                _CONNECTING: 'during ssl handshake',
+                _SENDING: 'sending data',
+            }.get(self._state, 'reading data'))
+
+    def _nextdeadline(self):
+        deadlines = [d for d in (self._deadline, self._continue_deadline)
+                     if d is not None]
+        if self._connector is not None:
+            wakeup = self._connector.wakeup()
+            if wakeup is not None:
+                deadlines.append(wakeup)
+        return deadlines and min(deadlines) or None
+
+    def _finish(self):
+        con = self.connection
+        response = self.response
+        if not self._writer.done():
+            logger.info('stopped sending request early, '
+                        'will close the socket to be safe.')
+            response.will_close = True
+        self.body = response.read()
+        # We're a friend of the connection class here.
+        # pylint: disable=W0212
+        con._current_response = None
+        if response.will_close:
+            self._disconnect()
+        else:
+            self._mux._sockets.discard(self._sock)
+        self._state = _DONE
+
+    def _fail(self, error):
+        logger.info('%s request for %s failed: %s',
+                    self.method, self.path, error)
+        self.error = error
+        self.response = self.body = None
+        # We're a friend of the connection class here.
+        # pylint: disable=W0212
+        self.connection._current_response = None
+        if self._connector is not None:
+            self._connector.close()
+            self._connector = None
+        if self._sock is not None:
+            self._disconnect()
+        self._state = _DONE
+
+
+class Multiplexer(object):
+    """Makes requests on many HTTPConnections concurrently, in one thread.
+
+    request() queues a request and returns its Transfer. The
+    transfers make progress whenever poll() (or run() or
+    as_completed(), which call it) is running. Finished transfers
+    are returned from poll(), and passed to their callback if they
+    have one. Errors are not raised, but recorded on the transfer
+    that encountered them.
+    """
+    def __init__(self):
+        self._sockets = _poll.SocketSet()
+        # Transfers not yet finished, for each connection; the first
+        # is the one in progress.
+        self._queues = collections.OrderedDict()
+
+    def __len__(self):
+        """The number of transfers not yet finished."""
+        return sum(len(q) for q in self._queues.values())
+
+    def request(self, connection, method, path, body=None, headers={},
+                expect_continue=False, callback=None):
+        """Queue a request to be sent on connection.
+
+        The arguments are as for HTTPConnection.request(), except for
+        callback, which if given is called with the Transfer once it
+        finishes. Returns the Transfer.
+        """
+        if connection not in self._queues and connection.busy():
+            raise httplib.CannotSendRequest(
+                'connection has an unread response')
+        transfer = Transfer(self, connection, method, path, body, headers,
+                            expect_continue, callback)
+        self._queues.setdefault(connection, collections.deque()).append(
+            transfer)
+        return transfer
+
+    def _step(self, transfer, fn, *args):
+        """Run one step of a transfer, recording any error."""
+        # We're a friend of the Transfer class here.
+        # pylint: disable=W0212
+        try:
+            fn(*args)
+            if not transfer.done():
+                transfer._update()
+        except (socket.error, httplib.HTTPException) as e:
+            transfer._fail(e)
+
+    def poll(self, timeout=None):
+        """Make whatever progress is possible, waiting up to timeout.
+
+        Returns a list of the transfers that finished, which is empty
+        if none did before the timeout.
+        """
+        # We're a friend of the Transfer class here.
+        # pylint: disable=W0212
+        for queue in self._queues.values():
+            if queue[0]._state == _QUEUED:
+                self._step(queue[0], queue[0]._start)
+        active = [q[0] for q in self._queues.values() if not q[0].done()]
+        deadlines = [t._nextdeadline() for t in active]
+        deadlines = [d for d in deadlines if d is not None]
+        if deadlines:
+            wait = max(0, min(deadlines) - _now())
+            if timeout is not None:
+                wait = min(wait, timeout)
+        else:
+            wait = timeout
+        if active:
+            for transfer, readable, writable in self._sockets.select(wait):
+                if transfer._state == _CONNECTING:
+                    self._step(transfer, transfer._onconnecting)
+                    continue
+                sock, state = transfer._sock, transfer._state
+                if writable and state == _SENDING:
+                    self._step(transfer, transfer._onwritable)
+                # Writing may have failed and started the request
+                # again on a new socket, which this event isn't about.
+                if (readable and transfer._sock is sock
+                        and transfer._state == state):
+                    self._step(transfer, transfer._onreadable)
+            now = _now()
+            for transfer in active:
+                if not transfer.done():
+                    self._step(transfer, transfer._ontimeout, now)
+        elif wait:
+            time.sleep(wait)
+        return self._reap()
+
+    def _reap(self):
+        # pylint: disable=W0212
+        finished = []
+        for con, queue in list(self._queues.items()):
+            while queue and queue[0].done():
+                finished.append(queue.popleft())
+            if not queue:
+                del self._queues[con]
+        now = _now()
+        for transfer in finished:
+            transfer.finished = now
+            if transfer._callback is not None:
+                transfer._callback(transfer)
+        return finished
+
+    def run(self):
+        """Wait for every queued transfer to finish.
+
+        Returns the transfers in the order they finished.
+        """
+        return list(self.as_completed())
+
+    def as_completed(self):
+        """Yield transfers as they finish, until none are left.
+
+        Requests queued while iterating are waited for too.
+        """
+        while self._queues:
+            for transfer in self.poll():
+                yield transfer
+
+    def close(self):
+        """Abandon unfinished transfers, closing their connections."""
+        # pylint: disable=W0212
+        for queue in self._queues.values():
+            for transfer in queue:
+                if not transfer.done():
+                    transfer._fail(HTTPStateError(
+                        'multiplexer closed'))
+        self._queues.clear()
+        self._sockets.close()
+
+
+def _parseurl(url):
+    """Returns (host, port, use_ssl, path) for an http or https URL."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('not an http or https URL: %r' % (url,))
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return parts.hostname, parts.port, parts.scheme == 'https', path
+
+
+def fetch_many(requests, max_concurrency=10, per_host=2, ordered=False,
+               connection_pool=None, **connection_kwargs):
+    """Make many requests concurrently over reused connections.
+
+    Each of requests is a URL, or a tuple of (method, url) with
+    optionally a body and headers following. At most max_concurrency
+    requests are in flight at once, and at most per_host to any one
+    server; each of those has its own connection, which is reused
+    for later requests to the same server. Connections come from
+    connection_pool if one is given (and are left in it afterwards);
+    otherwise a pool is made using connection_kwargs, and closed when
+    all the requests are done. If connection_pool has no connections
+    to spare, requests wait until someone puts one back.
+
+    This is a generator of (request, transfer) pairs, one for each
+    request, where transfer is the finished Transfer: see it for the
+    response or error, and the request's timing. They come in the
+    order the requests finish, or the order of requests if ordered
+    is True.
+    """
+    owned = connection_pool is None
+    if owned:
+        connection_pool = pool.HTTPConnectionPool(
+            maxperhost=per_host, maxtotal=max_concurrency,
+            **connection_kwargs)
+    mux = Multiplexer()
+    # Requests yet to be started, by server.
+    waiting = collections.OrderedDict()
+    for index, request in enumerate(requests):
+        if isinstance(request, tuple):
+            method, url = request[:2]
+            body = len(request) > 2 and request[2] or None
+            headers = len(request) > 3 and request[3] or {}
+        else:
+            method, url, body, headers = 'GET', request, None, {}
+        host, port, use_ssl, path = _parseurl(url)
+        key = _hostport(host, port, use_ssl)
+        waiting.setdefault(key, collections.deque()).append(
+            (index, request, method, path, body, headers))
+    inflight = collections.Counter()
+    transfers = {}
+    results = {}
+    nextresult = 0
+
+    def schedule():
+        for key in list(waiting):
+            queue = waiting[key]
+            while (queue and len(transfers) < max_concurrency
+                   and inflight[key] < per_host):
+                try:
+                    con = connection_pool.get(*key)
+                except pool.PoolExhaustedError:
+                    if len(connection_pool) >= connection_pool.maxtotal:
+                        return
+                    # Only this server's connections are all in use;
+                    # others may still have some to spare.
+                    break
+                index, request, method, path, body, headers = queue.popleft()
+                try:
+                    transfer = mux.request(con, method, path, body=body,
+                                           headers=headers)
+                except BaseException:
+                    connection_pool.discard(con)
+                    raise
+                transfers[transfer] = (index, request, key)
+                inflight[key] += 1
+            if not queue:
+                del waiting[key]
+
+    try:
+        while waiting or transfers:
+            schedule()
+            # If the pool's connections are all lent out elsewhere,
+            # nothing may be in flight; poll() would then return at
+            # once, so wait a little before asking the pool again.
+            timeout = None if transfers else _POOL_RETRY_DELAY
+            for transfer in mux.poll(timeout):
+                index, request, key = transfers.pop(transfer)
+                inflight[key] -= 1
+                connection_pool.put(transfer.connection)
+                if not ordered:
+                    yield request, transfer
+                    continue
+                results[index] = (request, transfer)
+                while nextresult in results:
+                    yield results.pop(nextresult)
+                    nextresult += 1
+    finally:
+        for transfer in transfers:
+            connection_pool.discard(transfer.connection)
+        mux.close()
+        if owned:
+            connection_pool.close()
@@ -0,0 +1,474 @@
+# Copyright 2011, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Pool of reusable keepalive connections.
+
+A single HTTPConnection only saves on connection setup if the same
+object happens to be reused for the next request to its server.
+HTTPConnectionPool keeps idle connections around for whoever asks for
+the same server next:
+
+  pool = HTTPConnectionPool(maxperhost=4)
+  with pool.connection('example.com', use_ssl=True) as con:
+      con.request('GET', '/')
+      body = con.getresponse().read()
+
+Connections are only reused once their last response has been read
+completely. HTTPConnectionPool is meant for use by one thread at a
+time; SharedHTTPConnectionPool can be used by many at once.
+"""
+from __future__ import absolute_import
+
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+try:
+    import httplib
+    httplib.HTTPException
+except ImportError:
+    import http.client as httplib
+
+from . import (
+    HTTPConnection,
+    _hostport,
+)
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['HTTPConnectionPool', 'PoolExhaustedError',
+           'SharedHTTPConnectionPool']
+
+# Idle times are measured with a clock that can't go backwards, where
+# there is one.
+_now = getattr(time, 'monotonic', time.time)
+
+
+class PoolExhaustedError(httplib.HTTPException):
+    """All the connections the pool may open are in use."""
+
+
+class HTTPConnectionPool(object):
+    """Hands out HTTPConnections, reusing idle ones where possible.
+
+    Connections are kept per server, where a server is the (host,
+    port, use_ssl, proxy_hostport) a connection was made for. Idle
+    connections are reused most recently returned first, since those
+    are the least likely to have been closed by the server.
+
+    Attributes:
+      maxperhost: most connections (in use or idle) to one server.
+      maxtotal: most connections (in use or idle) overall. When this
+        is reached, the longest idle connection to another server is
+        closed to make room.
+      idle_timeout: seconds after which an idle connection is closed
+        rather than reused, or None to keep them indefinitely.
+      hits: number of get() calls satisfied with an idle connection.
+      misses: number of get() calls that had to make a new one.
+      evictions: number of idle connections closed by the pool.
+    """
+    connection_class = HTTPConnection
+
+    def __init__(self, maxperhost=10, maxtotal=100, idle_timeout=60,
+                 **connection_kwargs):
+        """Create a new pool.
+
+        Any extra keyword arguments are passed on to the constructor
+        of each connection the pool makes.
+        """
+        self.maxperhost = maxperhost
+        self.maxtotal = maxtotal
+        self.idle_timeout = idle_timeout
+        self._connection_kwargs = connection_kwargs
+        self.hits = self.misses = self.evictions = 0
+        # Idle connections for each server, in the order they were
+        # returned to the pool...
+        self._idle = {}
+        # ...and across all servers, mapping connection to (key, when
+        # it was returned).
+        self._idleorder = collections.OrderedDict()
+        # Connections handed out by get(), and the key of each.
+        self._inuse = {}
+        self._count = collections.defaultdict(int)
+        self._total = 0
+
+    def __len__(self):
+        """Returns the number of connections the pool has open or lent out."""
+        return self._total
+
+    def idle(self):
+        """Returns the number of idle connections held by the pool."""
+        return len(self._idleorder)
+
+    def get(self, host, port=None, use_ssl=None, proxy_hostport=None):
+        """Returns a connection to the given server.
+
+        The arguments are interpreted as by HTTPConnection. The
+        connection must be given back with put() (or discard()) once
+        it is no longer needed.
+
+        Raises PoolExhaustedError if maxperhost connections to the
+        server, or maxtotal connections overall, are already in use.
+        """
+        host, port, use_ssl = _hostport(host, port, use_ssl)
+        key = (host, port, use_ssl, proxy_hostport)
+        self._evictidle()
+        idle = self._idle.get(key)
+        if idle:
+            con = idle.pop()
+            del self._idleorder[con]
+            self._inuse[con] = key
+            self.hits += 1
+            return con
+        if self._count[key] >= self.maxperhost:
+            raise PoolExhaustedError(
+                'all %d connections to %s:%d are in use' % (
+                    self.maxperhost, host.decode('ascii', 'replace'), port))
+        if self._total >= self.maxtotal:
+            if not self._idleorder:
+                raise PoolExhaustedError(
+                    'all %d connections are in use' % self.maxtotal)
+            self._evict(next(iter(self._idleorder)))
+        self.misses += 1
+        con = self.connection_class(host, port, use_ssl=use_ssl,
+                                    proxy_hostport=proxy_hostport,
+                                    **self._connection_kwargs)
+        self._inuse[con] = key
+        self._count[key] += 1
+        self._total += 1
+        return con
+
+    def put(self, con):
+        """Return a connection obtained from get() to the pool.
+
+        The connection is kept for reuse if it is still open and its
+        response has been read completely; otherwise it is closed.
+        """
+        key = self._inuse.pop(con)
+        # busy() has to come first, since it notices if the last
+        # response closed the socket.
+        if con.busy() or con.sock is None:
+            logger.debug('connection to %r not reusable, closing it', key)
+            self._forget(con, key)
+            return
+        self._idle.setdefault(key, collections.deque()).append(con)
+        self._idleorder[con] = (key, _now())
+        self._evictidle()
+
+    def discard(self, con):
+        """Close a connection obtained from get() instead of reusing it."""
+        self._forget(con, self._inuse.pop(con))
+
+    @contextlib.contextmanager
+    def connection(self, host, port=None, use_ssl=None, proxy_hostport=None):
+        """Context manager that lends out a connection from get().
+
+        The connection is put() back afterwards, unless an exception
+        escaped from the block, in which case it's in an unknown state
+        and gets discarded instead.
+        """
+        con = self.get(host, port, use_ssl, proxy_hostport)
+        try:
+            yield con
+        except BaseException:
+            self.discard(con)
+            raise
+        self.put(con)
+
+    def close(self):
+        """Close all idle connections.
+
+        Connections that are in use are left alone, and are still
+        accounted for when they are returned.
+        """
+        while self._idleorder:
+            self._evict(next(iter(self._idleorder)))
+
+    def _evictidle(self):
+        """Close connections that have been idle for too long."""
+        if self.idle_timeout is None:
+            return
+        cutoff = _now() - self.idle_timeout
+        idleorder = self._idleorder
+        while idleorder:
+            con = next(iter(idleorder))
+            if idleorder[con][1] > cutoff:
+                break
+            self._evict(con)
+
+    def _evict(self, con):
+        key, unused_since = self._idleorder.pop(con)
+        # Connections go idle in order, so the one being evicted (the
+        # least recently used overall) is the oldest for its server.
+        idle = self._idle[key]
+        if idle[0] is con:
+            idle.popleft()
+        else:
+            idle.remove(con)
+        if not idle:
+            del self._idle[key]
+        self.evictions += 1
+        logger.debug('evicting idle connection to %r', key)
+        self._forget(con, key)
+
+    def _forget(self, con, key):
+        con.close()
+        self._count[key] -= 1
+        if not self._count[key]:
+            del self._count[key]
+        self._total -= 1
+
+
+class _ThreadIdle(object):
+    """A thread's idle connections in a SharedHTTPConnectionPool.
+
+    thread is None for the connections adopted from threads that
+    have exited.
+    """
+    def __init__(self, thread=None):
+        self.thread = thread
+        # Deques of (connection, when it was returned) for each
+        # server. The owning thread appends and pops at the right;
+        # other threads steal from the left. Both are atomic, so
+        # neither needs a lock.
+        self.idle = {}
+        self.hits = 0
+
+
+class SharedHTTPConnectionPool(HTTPConnectionPool):
+    """HTTPConnectionPool that can be used from many threads at once.
+
+    Each thread returns connections to its own lists of idle
+    connections, and get() looks there first, so the common case of
+    a thread reusing a connection it used before takes no lock. Only
+    when the thread has no idle connection to the server does get()
+    take the pool's lock, to take ("steal") the one idle the longest
+    from another thread, or failing that to open a new one.
+
+    When a thread exits, its idle connections are adopted by the
+    pool, and can be stolen like any others.
+
+    Connections themselves are not thread-safe: each must only be
+    used by the thread that got it, until it is returned.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # Connections left idle by threads that have exited.
+        self._orphans = _ThreadIdle()
+        # Every live thread's _ThreadIdle, and _orphans, for stealing
+        # from. This list is replaced rather than modified, so it can
+        # be read without the lock.
+        self._threads = [self._orphans]
+        self._hitsoffset = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        HTTPConnectionPool.__init__(self, *args, **kwargs)
+
+    @property
+    def hits(self):
+        # Counted per thread, since the fast path of get() takes no
+        # lock: its one shared write, to _inuse, is a single dict
+        # assignment, but incrementing a shared count isn't atomic.
+        return self._hitsoffset + sum(t.hits for t in self._threads)
+
+    @hits.setter
+    def hits(self, value):
+        self._hitsoffset = value - sum(t.hits for t in self._threads)
+
+    def _mine(self):
+        """Returns the calling thread's _ThreadIdle."""
+        try:
+            return self._local.idle
+        except AttributeError:
+            mine = self._local.idle = _ThreadIdle(threading.current_thread())
+            with self._lock:
+                self._prune()
+                self._threads = self._threads + [mine]
+            return mine
+
+    def _prune(self):
+        """Adopt the idle connections of threads that have exited.
+
+        Must be called with the lock held.
+        """
+        live = []
+        for other in self._threads:
+            if other.thread is None or other.thread.is_alive():
+                live.append(other)
+                continue
+            for key, idle in other.idle.items():
+                if not idle:
+                    continue
+                # Keep them oldest first, for _steal() and _oldest().
+                adopted = list(self._orphans.idle.get(key, ())) + list(idle)
+                adopted.sort(key=lambda entry: entry[1])
+                self._orphans.idle[key] = collections.deque(adopted)
+        if len(live) < len(self._threads):
+            dead = [t for t in self._threads if t not in live]
+            self._threads = live
+            self._hitsoffset += sum(t.hits for t in dead)
+
+    def idle(self):
+        return sum(len(d) for t in self._threads for d in t.idle.values())
+
+    def _cutoff(self):
+        """Returns the time before which connections are too stale to use."""
+        if self.idle_timeout is None:
+            return None
+        return _now() - self.idle_timeout
+
+    def get(self, host, port=None, use_ssl=None, proxy_hostport=None):
+        host, port, use_ssl = _hostport(host, port, use_ssl)
+        key = (host, port, use_ssl, proxy_hostport)
+        mine = self._mine()
+        idle = mine.idle.get(key)
+        cutoff = self._cutoff()
+        while idle:
+            try:
+                con, since = idle.pop()
+            except IndexError:
+                # Another thread stole the last one.
+                break
+            if cutoff is not None and since <= cutoff:
+                # Everything older is stale too, and gets dropped
+                # the same way.
+                self._drop(con, key, evicted=True)
+                continue
+            self._inuse[con] = key
+            mine.hits += 1
+            return con
+        stale = []
+        try:
+            with self._lock:
+                con = self._steal(key, cutoff, stale)
+                if con is not None:
+                    self._inuse[con] = key
+                    mine.hits += 1
+                    return con
+                if self._count[key] >= self.maxperhost:
+                    raise PoolExhaustedError(
+                        'all %d connections to %s:%d are in use' % (
+                            self.maxperhost,
+                            host.decode('ascii', 'replace'), port))
+                if self._total >= self.maxtotal:
+                    victim = self._oldest()
+                    if victim is None:
+                        raise PoolExhaustedError(
+                            'all %d connections are in use' % self.maxtotal)
+                    stale.append(victim)
+                self.misses += 1
+                self._count[key] += 1
+                self._total += 1
+        finally:
+            for victim, victimkey in stale:
+                self._drop(victim, victimkey, evicted=True)
+        con = self.connection_class(host, port, use_ssl=use_ssl,
+                                    proxy_hostport=proxy_hostport,
+                                    **self._connection_kwargs)
+        self._inuse[con] = key
+        return con
+
+    def _steal(self, key, cutoff, stale):
+        """Take an idle connection to key from any thread.
+
+        Stale connections found on the way are added to stale, as
+        (connection, key) pairs. Must be called with the lock held.
+        """
+        for other in self._threads:
+            idle = other.idle.get(key)
+            while idle:
+                try:
+                    con, since = idle.popleft()
+                except IndexError:
+                    break
+                if cutoff is not None and since <= cutoff:
+                    stale.append((con, key))
+                    continue
+                return con
+        return None
+
+    def _oldest(self):
+        """Take the connection idle the longest, to any server.
+
+        Returns a (connection, key) pair, or None if there are no
+        idle connections. Must be called with the lock held.
+        """
+        while True:
+            oldest = None
+            for other in self._threads:
+                for key, idle in list(other.idle.items()):
+                    try:
+                        since = idle[0][1]
+                    except IndexError:
+                        continue
+                    if oldest is None or since < oldest[0]:
+                        oldest = (since, key, idle)
+            if oldest is None:
+                return None
+            unused_since, key, idle = oldest
+            try:
+                return idle.popleft()[0], key
+            except IndexError:
+                # Its owner took it in the meantime; look again.
+                continue
+
+    def _drop(self, con, key, evicted=False):
+        """Close a connection and stop counting it."""
+        with self._lock:
+            self._count[key] -= 1
+            if not self._count[key]:
+                del self._count[key]
+            self._total -= 1
+            if evicted:
+                self.evictions += 1
+        if evicted:
+            logger.debug('evicting idle connection to %r', key)
+        con.close()
+
+    def put(self, con):
+        key = self._inuse.pop(con)
+        if con.busy() or con.sock is None:
+            logger.debug('connection to %r not reusable, closing it', key)
+            self._drop(con, key)
+            return
+        self._mine().idle.setdefault(key, collections.deque()).append(
+            (con, _now()))
+
+    def discard(self, con):
+        self._drop(con, self._inuse.pop(con))
+
+    def close(self):
+        while True:
+            with self._lock:
+                self._prune()
+                victim = self._oldest()
+            if victim is None:
+                break
+            self._drop(victim[0], victim[1], evicted=True)
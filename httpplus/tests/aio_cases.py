@@ -0,0 +1,332 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""Tests for httpplus.aio, loaded by test_aio where they can run."""
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import asyncio
+import socket
+import struct
+import unittest
+
+import httpplus
+from httpplus import aio
+
+
+class _Server(object):
+    """Minimal HTTP/1.1 server for exercising the client."""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = []
+        # What followed a refused request on its connection.
+        self.after_refusal = None
+        self.refused = asyncio.Event()
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def readbody(self, reader, headers):
+        if headers.get('transfer-encoding') == 'chunked':
+            body = b''
+            while True:
+                size = int((await reader.readline()).strip(), 16)
+                if not size:
+                    await reader.readline()
+                    return body
+                body += await reader.readexactly(size)
+                await reader.readline()
+        return await reader.readexactly(int(headers.get('content-length', 0)))
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                method, path, unused_version = line.decode().split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line == b'\r\n':
+                        break
+                    k, v = line.decode().split(':', 1)
+                    headers[k.strip().lower()] = v.strip()
+                self.requests.append((method, path, headers))
+                if path == '/early':
+                    writer.write(b'HTTP/1.1 413 Too Large\r\n'
+                                 b'Content-Length: 4\r\n'
+                                 b'Connection: close\r\n\r\nnope')
+                    await writer.drain()
+                    return
+                if path == '/reset':
+                    # Drop the connection, with a RST, without reading
+                    # the body.
+                    sock = writer.get_extra_info('socket')
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                    struct.pack('ii', 1, 0))
+                    writer.transport.abort()
+                    return
+                if path == '/refuse':
+                    writer.write(b'HTTP/1.1 417 Expectation Failed\r\n'
+                                 b'Content-Length: 0\r\n\r\n')
+                    await writer.drain()
+                    self.after_refusal = await reader.read()
+                    self.refused.set()
+                    return
+                if headers.get('expect') == '100-continue':
+                    writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                body = await self.readbody(reader, headers)
+                if path == '/chunked':
+                    writer.write(b'HTTP/1.1 200 OK\r\n'
+                                 b'Transfer-Encoding: chunked\r\n\r\n')
+                    for piece in (b'one\n', b'two\n', b'three\n'):
+                        writer.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+                        await writer.drain()
+                    writer.write(b'0\r\n\r\n')
+                elif path == '/close':
+                    writer.write(b'HTTP/1.1 200 OK\r\n'
+                                 b'Connection: close\r\n\r\nbye')
+                    await writer.drain()
+                    return
+                else:
+                    if path != '/echo':
+                        body = b'hello ' + path.encode()
+                    writer.write(b'HTTP/1.1 200 OK\r\n'
+                                 b'Content-Length: %d\r\n\r\n%s'
+                                 % (len(body), body))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class AsyncHTTPConnectionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = _Server()
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    def connection(self, **kwargs):
+        return aio.AsyncHTTPConnection('127.0.0.1', self.server.port,
+                                       use_ssl=False, **kwargs)
+
+    async def testGetKeepalive(self):
+        con = self.connection()
+        for path in ('/a', '/b'):
+            await con.request('GET', path)
+            resp = await con.getresponse()
+            self.assertEqual(200, resp.status)
+            self.assertEqual(b'hello ' + path.encode(), await resp.read())
+            self.assertFalse(con.busy())
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual(('GET', '/b'), self.server.requests[1][:2])
+        self.assertEqual('127.0.0.1:%d' % self.server.port,
+                         self.server.requests[1][2]['host'])
+        con.close()
+
+    async def testBusyUntilRead(self):
+        con = self.connection()
+        await con.request('GET', '/')
+        self.assertTrue(con.busy())
+        with self.assertRaises(httpplus.httplib.CannotSendRequest):
+            await con.request('GET', '/')
+        resp = await con.getresponse()
+        await resp.read()
+        self.assertFalse(con.busy())
+        con.close()
+
+    async def testPartialReads(self):
+        con = self.connection()
+        await con.request('GET', '/0123456789')
+        resp = await con.getresponse()
+        self.assertEqual(b'hel', await resp.read(3))
+        self.assertEqual(b'lo /01', await resp.read(6))
+        self.assertEqual(b'23456789', await resp.read())
+        con.close()
+
+    async def testIterChunked(self):
+        con = self.connection()
+        await con.request('GET', '/chunked')
+        resp = await con.getresponse()
+        blocks = [block async for block in resp]
+        self.assertEqual(b'one\ntwo\nthree\n', b''.join(blocks))
+        await con.request('GET', '/chunked')
+        resp = await con.getresponse()
+        self.assertEqual(b'one\n', await resp.readline())
+        self.assertEqual(b'two\n', await resp.readline())
+        self.assertEqual(b'three\n', await resp.readline())
+        self.assertEqual(b'', await resp.readline())
+        self.assertEqual(1, self.server.connections)
+        con.close()
+
+    async def testConnectionClose(self):
+        con = self.connection()
+        await con.request('GET', '/close')
+        resp = await con.getresponse()
+        self.assertTrue(resp.will_close)
+        self.assertIsNone(con.sock)
+        self.assertFalse(con.busy())
+        self.assertEqual(b'bye', await resp.read())
+        await con.request('GET', '/again')
+        resp = await con.getresponse()
+        self.assertEqual(b'hello /again', await resp.read())
+        self.assertEqual(2, self.server.connections)
+        con.close()
+
+    async def testPostBodies(self):
+        con = self.connection()
+        big = b'x' * (1 << 20)
+        await con.request('POST', '/echo', body=big)
+        resp = await con.getresponse()
+        self.assertEqual(big, await resp.read())
+
+        def gen():
+            yield b'abc'
+            yield b'def'
+        await con.request('POST', '/echo', body=gen())
+        resp = await con.getresponse()
+        self.assertEqual(b'abcdef', await resp.read())
+        self.assertEqual('chunked',
+                         self.server.requests[1][2]['transfer-encoding'])
+        con.close()
+
+    async def testExpectContinue(self):
+        con = self.connection()
+        await con.request('POST', '/echo', body=b'payload',
+                          expect_continue=True)
+        resp = await con.getresponse()
+        self.assertEqual(b'payload', await resp.read())
+        con.close()
+
+    async def testExpectContinueRefused(self):
+        con = self.connection()
+        for body in (b'payload', b'x' * (8 << 20)):
+            self.server.refused.clear()
+            await con.request('POST', '/refuse', body=body,
+                              expect_continue=True)
+            resp = await con.getresponse()
+            self.assertEqual(417, resp.status)
+            self.assertTrue(resp.will_close)
+            self.assertEqual(b'', await resp.read())
+            await asyncio.wait_for(self.server.refused.wait(), 5)
+            self.assertEqual(b'', self.server.after_refusal)
+        self.assertEqual(2, self.server.connections)
+        con.close()
+
+    async def testResetAfterWritingNotRetried(self):
+        con = self.connection()
+        await con.request('GET', '/a')
+        await (await con.getresponse()).read()
+        with self.assertRaises((ConnectionResetError, BrokenPipeError)):
+            await con.request('POST', '/reset', body=b'x' * (8 << 20))
+        self.assertEqual(['/a', '/reset'],
+                         [path for unused, path, unused in
+                          self.server.requests])
+        con.close()
+
+    async def testClosedKeepaliveRetried(self):
+        con = self.connection()
+        await con.request('GET', '/a')
+        await (await con.getresponse()).read()
+        # The transport has noticed the connection is gone, but the
+        # stream doesn't know yet.
+        con.sock.transport.abort()
+        await con.request('GET', '/b')
+        self.assertEqual(b'hello /b', await (await con.getresponse()).read())
+        self.assertEqual(2, self.server.connections)
+        con.close()
+
+    async def testEarlyResponse(self):
+        con = self.connection()
+        await con.request('POST', '/early', body=b'x' * (8 << 20))
+        resp = await con.getresponse()
+        self.assertEqual(413, resp.status)
+        self.assertTrue(resp.will_close)
+        self.assertEqual(b'nope', await resp.read())
+        con.close()
+
+    async def testTimeout(self):
+        hang = await asyncio.start_server(
+            lambda r, w: asyncio.sleep(10), '127.0.0.1', 0)
+        port = hang.sockets[0].getsockname()[1]
+        con = aio.AsyncHTTPConnection('127.0.0.1', port, use_ssl=False,
+                                      timeout=0.1)
+        await con.request('GET', '/')
+        with self.assertRaises(httpplus.HTTPTimeoutException):
+            await con.getresponse()
+        con.close()
+        hang.close()
+
+
+class AsyncHTTPConnectionPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = _Server()
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def testManyConcurrentRequests(self):
+        p = aio.AsyncHTTPConnectionPool(maxperhost=4)
+
+        async def fetch(i):
+            async with p.connection('127.0.0.1', self.server.port,
+                                    use_ssl=False) as con:
+                await con.request('GET', '/%d' % i)
+                resp = await con.getresponse()
+                return await resp.read()
+
+        results = await asyncio.gather(*[fetch(i) for i in range(200)])
+        self.assertEqual([b'hello /%d' % i for i in range(200)], results)
+        self.assertEqual(4, self.server.connections)
+        self.assertEqual(4, p.misses)
+        self.assertEqual(196, p.hits)
+        p.close()
+
+    async def testDiscardOnError(self):
+        p = aio.AsyncHTTPConnectionPool()
+        with self.assertRaises(ValueError):
+            async with p.connection('127.0.0.1', self.server.port,
+                                    use_ssl=False) as con:
+                await con.request('GET', '/')
+                raise ValueError()
+        self.assertEqual(0, len(p))
+        self.assertIsNone(con.sock)
@@ -30,8 +30,11 @@
 # pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
 from __future__ import absolute_import
 
+import array
+import io
 import socket
 import sys
+import tempfile
 import unittest
 
 import httpplus
@@ -51,6 +54,41 @@ class SimpleHttpTest(util.HttpTestBase, unittest.TestCase):
         self.assertStringEqual(expected_req, con.sock.sent)
         self.assertEqual(expected_data, con.getresponse().read())
 
+    def test_prepared_request(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        prepared = con.prepare('POST', '/upload',
+                               headers={'X-Token': 'abc'})
+        for body in (b'first', b'second body'):
+            sock = con.sock
+            sock.sent = b''
+            sock.read_wait_sentinel = body
+            sock.data = [b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Length: 2\r\n\r\nok']
+            con.sendprepared(prepared, body=body)
+            self.assertStringEqual(
+                b'POST /upload HTTP/1.1\r\n'
+                b'Host: 1.2.3.4\r\n'
+                b'X-Token: abc\r\n'
+                b'accept-encoding: identity\r\n'
+                b'content-length: %d\r\n'
+                b'\r\n%s' % (len(body), body), sock.sent)
+            self.assertEqual(b'ok', con.getresponse().read())
+        other = httpplus.HTTPConnection('1.2.3.4:8080')
+        self.assertRaises(ValueError, other.sendprepared, prepared)
+
+    def test_prepared_request_no_body(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        con.sock.data = [b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Length: 2\r\n\r\nok']
+        con.sendprepared(con.prepare('GET', '/'))
+        self.assertStringEqual(b'GET / HTTP/1.1\r\n'
+                               b'Host: 1.2.3.4\r\n'
+                               b'accept-encoding: identity\r\n\r\n',
+                               con.sock.sent)
+        self.assertEqual(b'ok', con.getresponse().read())
+
     def test_broken_data_obj(self):
         con = httpplus.HTTPConnection('1.2.3.4:80')
         con._connect({})
@@ -153,11 +191,31 @@ dotencode
         self.assertEqual(expected_req, con.sock.sent)
         resp = con.getresponse()
         self.assertEqual(b'1234567890', resp.read())
+        # Headers are only parsed once they're asked for.
+        self.assertEqual(None, resp._headers)
         self.assertEqual(['Value', 'Other Value', 'One More!'],
                          resp.headers.getheaders('multiheader'))
         self.assertEqual(['BogusServer 1.0'],
                          resp.headers.getheaders('server'))
 
+    def testPollerIsReusedAcrossRequests(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        sock = con.sock
+        pollers = []
+        for _ in range(2):
+            sock.sent = b''
+            sock.data = [b'HTTP/1.1 200 OK\r\n',
+                         b'Content-Length: 2\r\n\r\n',
+                         b'hi']
+            con.request('GET', '/')
+            resp = con.getresponse()
+            self.assertEqual(b'hi', resp.read())
+            pollers.append(resp._poller)
+        self.assertTrue(pollers[0] is pollers[1] is con._poller)
+        con.close()
+        self.assertTrue(pollers[0].closed)
+
     def testHeaderlessResponse(self):
         con = httpplus.HTTPConnection('1.2.3.4', use_ssl=False)
         con._connect({})
@@ -260,6 +318,108 @@ dotencode
             else:
                 self.assertEqual(expect, r.read(read_amt))
 
+    def testReadinto(self):
+        con = httpplus.HTTPConnection('1.2.3.4')
+        con._connect({})
+        con.sock.data = [b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Length: 16\r\n'
+                         b'\r\n'
+                         b'0123',
+                         b'456789',
+                         b'abcdef']
+        con.request('GET', '/')
+        r = con.getresponse()
+        buf = bytearray(5)
+        # Buffered data comes out of the reader first, then we
+        # receive straight into the buffer.
+        self.assertEqual(4, r.readinto(buf))
+        self.assertEqual(b'0123', bytes(buf[:4]))
+        self.assertEqual(5, r.readinto(buf))
+        self.assertEqual(b'45678', bytes(buf))
+        self.assertEqual(1, r.readinto(buf))
+        self.assertEqual(b'9', bytes(buf[:1]))
+        self.assertEqual(5, r.readinto(memoryview(buf)))
+        self.assertEqual(b'abcde', bytes(buf))
+        self.assertEqual(1, r.readinto(buf))
+        self.assertTrue(r.complete())
+        self.assertEqual(0, r.readinto(buf))
+        self.assertEqual(b'', r.read())
+        self.assertEqual(con.sock.closed, False)
+
+    def testBufferedReader(self):
+        con = httpplus.HTTPConnection('1.2.3.4')
+        con._connect({})
+        con.sock.data = [b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Length: 16\r\n'
+                         b'\r\n'
+                         b'01\n3',
+                         b'456789',
+                         b'abcdef']
+        con.request('GET', '/')
+        r = con.getresponse()
+        f = io.BufferedReader(r, buffer_size=4)
+        self.assertEqual(b'01\n', f.readline())
+        self.assertEqual(b'3456', f.read(4))
+        self.assertEqual(b'789abcdef', f.read())
+        self.assertEqual(b'', f.read())
+        self.assertFalse(r.closed)
+        f.close()
+        self.assertTrue(r.closed)
+        self.assertEqual(con.sock.closed, False)
+
+    def testCloseIncompleteResponse(self):
+        con = httpplus.HTTPConnection('1.2.3.4')
+        con._connect({})
+        con.sock.data = [b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Length: 16\r\n'
+                         b'\r\n'
+                         b'0123']
+        con.request('GET', '/')
+        r = con.getresponse()
+        sock = con.sock
+        r.close()
+        self.assertTrue(r.closed)
+        self.assertTrue(sock.closed)
+        self.assertFalse(con.busy())
+        self.assertEqual(None, con.sock)
+
+    def testReadintoCloseIsEnd(self):
+        con = httpplus.HTTPConnection('1.2.3.4')
+        con._connect({})
+        con.sock.data = [b'HTTP/1.1 200 OK\r\n'
+                         b'Connection: Close\r\n'
+                         b'\r\n',
+                         b'1234567890']
+        con.sock.close_on_empty = True
+        con.request('GET', '/')
+        r = con.getresponse()
+        buf = bytearray(100)
+        self.assertEqual(10, r.readinto(buf))
+        self.assertEqual(b'1234567890', bytes(buf[:10]))
+        self.assertEqual(0, r.readinto(buf))
+        self.assertTrue(r.complete())
+        self.assertTrue(r.sock.closed)
+
+    def testPreallocatedBody(self):
+        class PreallocResponse(httpplus.HTTPResponse):
+            preallocate_limit = 1 << 20
+
+        con = httpplus.HTTPConnection('1.2.3.4')
+        con.response_class = PreallocResponse
+        con._connect({})
+        con.sock.data = [b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Length: 16\r\n'
+                         b'\r\n'
+                         b'0123',
+                         b'456789',
+                         b'abcdef']
+        con.request('GET', '/')
+        r = con.getresponse()
+        body = r.read()
+        self.assertEqual(b'0123456789abcdef', body)
+        self.assertTrue(isinstance(body, bytearray))
+        self.assertTrue(r.complete())
+
     def testZeroLengthBody(self):
         con = httpplus.HTTPConnection('1.2.3.4')
         con._connect({})
@@ -388,6 +548,133 @@ dotencode
         self.assertEqual(b"You can do that.", con.getresponse().read())
         self.assertEqual(sock.closed, False)
 
+    def testPostIsOneVectoredWrite(self):
+        calls = []
+        class VectoredSocket(util.MockSocket):
+            def sendmsg(self, buffers):
+                calls.append(len(buffers))
+                return self.send(
+                    b''.join(memoryview(b).tobytes() for b in buffers))
+        socket.socket = VectoredSocket
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        sock = con.sock
+        sock.read_wait_sentinel = b'POST data'
+        sock.data = [b'HTTP/1.1 200 OK\r\n',
+                     b'Content-Length: 16',
+                     b'\r\n\r\n',
+                     b"You can do that."]
+        con.request('POST', '/', body=b'This is some POST data')
+        self.assertEqual([2], calls)
+        self.assertStringEqual(b'POST / HTTP/1.1\r\n'
+                               b'Host: 1.2.3.4\r\n'
+                               b'accept-encoding: identity\r\n'
+                               b'content-length: 22\r\n'
+                               b'\r\n'
+                               b'This is some POST data', sock.sent)
+        self.assertEqual(b"You can do that.", con.getresponse().read())
+
+    def testPostFileHasContentLength(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        sock = con.sock
+        sock.read_wait_sentinel = b'end of file'
+        sock.data = [b'HTTP/1.1 200 OK\r\n',
+                     b'Content-Length: 16',
+                     b'\r\n\r\n',
+                     b"You can do that."]
+        with tempfile.TemporaryFile() as f:
+            f.write(b'skipped, then end of file')
+            f.seek(9)
+            con.request('POST', '/', body=f)
+        self.assertStringEqual(b'POST / HTTP/1.1\r\n'
+                               b'Host: 1.2.3.4\r\n'
+                               b'accept-encoding: identity\r\n'
+                               b'content-length: 16\r\n'
+                               b'\r\n'
+                               b'then end of file', sock.sent)
+        self.assertEqual(b"You can do that.", con.getresponse().read())
+
+    def testPostGenerator(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        sock = con.sock
+        sock.read_wait_sentinel = b'0\r\n\r\n'
+        sock.data = [b'HTTP/1.1 200 OK\r\n',
+                     b'Content-Length: 16',
+                     b'\r\n\r\n',
+                     b"You can do that."]
+        con.request('POST', '/', body=(b for b in [b'some ', b'data']))
+        self.assertStringEqual(b'POST / HTTP/1.1\r\n'
+                               b'Host: 1.2.3.4\r\n'
+                               b'accept-encoding: identity\r\n'
+                               b'transfer-encoding: chunked\r\n'
+                               b'\r\n'
+                               b'5\r\nsome \r\n'
+                               b'4\r\ndata\r\n'
+                               b'0\r\n\r\n', sock.sent)
+        self.assertEqual(b"You can do that.", con.getresponse().read())
+
+    def testPostGeneratorWithLength(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        sock = con.sock
+        sock.read_wait_sentinel = b'some data'
+        sock.data = [b'HTTP/1.1 200 OK\r\n',
+                     b'Content-Length: 16',
+                     b'\r\n\r\n',
+                     b"You can do that."]
+        con.request('POST', '/', body=(b for b in [b'some ', b'data']),
+                    headers={'Content-Length': '9'})
+        self.assertStringEqual(b'POST / HTTP/1.1\r\n'
+                               b'Content-Length: 9\r\n'
+                               b'Host: 1.2.3.4\r\n'
+                               b'accept-encoding: identity\r\n'
+                               b'\r\n'
+                               b'some data', sock.sent)
+        self.assertEqual(b"You can do that.", con.getresponse().read())
+
+    def testPostList(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        sock = con.sock
+        sock.read_wait_sentinel = b'some data'
+        sock.data = [b'HTTP/1.1 200 OK\r\n',
+                     b'Content-Length: 16',
+                     b'\r\n\r\n',
+                     b"You can do that."]
+        con.request('POST', '/', body=[b'some ', b'data'])
+        self.assertStringEqual(b'POST / HTTP/1.1\r\n'
+                               b'Host: 1.2.3.4\r\n'
+                               b'accept-encoding: identity\r\n'
+                               b'content-length: 9\r\n'
+                               b'\r\n'
+                               b'some data', sock.sent)
+        self.assertEqual(b"You can do that.", con.getresponse().read())
+
+    @unittest.skipIf(sys.version_info < (3, 0),
+                     "Python 2's arrays can't be viewed with a memoryview")
+    def testPostWideMemoryviews(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        sock = con.sock
+        sock.read_wait_sentinel = b'end'
+        sock.data = [b'HTTP/1.1 200 OK\r\n',
+                     b'Content-Length: 16',
+                     b'\r\n\r\n',
+                     b"You can do that."]
+        words = memoryview(array.array('H', [0x6261, 0x6463]))
+        con.request('POST', '/', body=[words, b'end'])
+        self.assertStringEqual(b'POST / HTTP/1.1\r\n'
+                               b'Host: 1.2.3.4\r\n'
+                               b'accept-encoding: identity\r\n'
+                               b'content-length: 7\r\n'
+                               b'\r\n' + words.tobytes() + b'end', sock.sent)
+        self.assertEqual(b"You can do that.", con.getresponse().read())
+        hdrs = {}
+        self.assertFalse(httpplus._framebody(words, hdrs))
+        self.assertEqual(b'4', hdrs['content-length'][1])
+
     def testServerWithoutContinue(self):
         con = httpplus.HTTPConnection('1.2.3.4:80')
         con._connect({})
@@ -423,6 +710,44 @@ dotencode
         self.assertEqual(200, resp.status)
         self.assertEqual(sock.closed, False)
 
+    def testContinueAndResponseInOneRead(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        sock = con.sock
+        sock.read_wait_sentinel = b'POST data'
+        sock.data = [b'HTTP/1.1 100 Continue\r\n\r\n'
+                     b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Length: 16\r\n\r\n'
+                     b"You can do that."]
+        expected_req = self.doPost(con, expect_body=True)
+        self.assertEqual(expected_req, sock.sent)
+        resp = con.getresponse()
+        self.assertEqual(200, resp.status)
+        self.assertEqual(b"You can do that.", resp.read())
+
+    def testHeadersTooLarge(self):
+        class SmallResponse(httpplus.HTTPResponse):
+            max_header_size = 100
+
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con.response_class = SmallResponse
+        con._connect({})
+        con.sock.data = [b'HTTP/1.1 200 OK\r\n'] + [
+            b'X-Filler: %d\r\n' % i for i in range(10)]
+        con.request('GET', '/')
+        self.assertRaises(httpplus.HTTPHeadersTooLargeError,
+                          con.getresponse)
+
+    def testTooManyHeaders(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        con.sock.data = [b'HTTP/1.1 200 OK\r\n'
+                         + b'X-Filler: 1\r\n' * 101
+                         + b'Content-Length: 0\r\n\r\n']
+        # The whole response arrives while the request is being sent.
+        self.assertRaises(httpplus.HTTPHeadersTooLargeError,
+                          con.request, 'GET', '/')
+
     def testSlowConnection(self):
         con = httpplus.HTTPConnection('1.2.3.4:80')
         con._connect({})
@@ -499,6 +824,75 @@ dotencode
         con.request('GET', '/')
         self.assertEqual(2, len(sockets))
 
+    def test_stale_keepalive_is_not_written_to(self):
+        socks = self.mocksockets(
+            [b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\none'],
+            [b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\ntwo'])
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con.request('GET', '/')
+        self.assertEqual(b'one', con.getresponse().read())
+        # The server hangs up while the connection is idle.
+        socks[0].remote_closed = True
+        sent = socks[0].sent
+        con.request('GET', '/')
+        self.assertEqual(b'two', con.getresponse().read())
+        self.assertEqual(2, len(socks))
+        self.assertEqual(sent, socks[0].sent)
+        self.assertTrue(socks[0].closed)
+
+    def test_unsolicited_data_makes_keepalive_stale(self):
+        socks = self.mocksockets(
+            [b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\none'],
+            [b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\ntwo'])
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con.request('GET', '/')
+        self.assertEqual(b'one', con.getresponse().read())
+        socks[0].data = [b'HTTP/1.1 408 Request Timeout\r\n\r\n']
+        con.request('GET', '/')
+        self.assertEqual(b'two', con.getresponse().read())
+        self.assertEqual(2, len(socks))
+        self.assertTrue(socks[0].closed)
+
+    def test_closed_keepalive_resends_request(self):
+        socks = self.mocksockets(
+            [b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\none', b''],
+            [b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\ntwo'],
+            per_request=True)
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con.request('GET', '/')
+        self.assertEqual(b'one', con.getresponse().read())
+        # The server hangs up only once it gets the second request.
+        con.request('POST', '/', body=b'data')
+        self.assertEqual(b'two', con.getresponse().read())
+        self.assertEqual(2, len(socks))
+        self.assertTrue(socks[1].sent.endswith(b'\r\n\r\ndata'))
+
+    def test_closed_keepalive_used_up_body_not_resent(self):
+        socks = self.mocksockets(
+            [b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\none', b''],
+            [b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\ntwo'],
+            per_request=True)
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con.request('GET', '/')
+        self.assertEqual(b'one', con.getresponse().read())
+        body = (block for block in [b'da', b'ta'])
+        self.assertRaises(httpplus.HTTPRemoteClosedError,
+                          con.request, 'POST', '/', body=body)
+        self.assertEqual(1, len(socks))
+
+    def test_live_keepalive_is_reused(self):
+        socks = self.mocksockets(
+            [b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\none'])
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con.request('GET', '/')
+        self.assertEqual(b'one', con.getresponse().read())
+        socks[0].data = [b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\n',
+                         b'two']
+        socks[0].sent = b''
+        con.request('GET', '/')
+        self.assertEqual(b'two', con.getresponse().read())
+        self.assertEqual(1, len(socks))
+
     def test_server_closes_before_end_of_body(self):
         con = httpplus.HTTPConnection('1.2.3.4:80')
         con._connect({})
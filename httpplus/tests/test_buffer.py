@@ -0,0 +1,76 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import unittest
+
+from httpplus import _buffer
+
+
+class BufferQueueTest(unittest.TestCase):
+    def test_read_across_chunks(self):
+        q = _buffer.BufferQueue()
+        for c in (b'abc', b'defg', b'h'):
+            q.append(c)
+        self.assertEqual(8, len(q))
+        self.assertEqual(b'a', q.read(1))
+        self.assertEqual(b'bcde', q.read(4))
+        self.assertEqual(3, len(q))
+        self.assertEqual(b'fgh', q.read(100))
+        self.assertEqual(0, len(q))
+        self.assertEqual(b'', q.read(5))
+
+    def test_whole_chunk_is_not_copied(self):
+        q = _buffer.BufferQueue()
+        data = b'x' * 100
+        q.append(data)
+        self.assertTrue(q.read(100) is data)
+
+    def test_append_bounds(self):
+        q = _buffer.BufferQueue()
+        q.append(b'0123456789', 2, 5)
+        q.append(b'abc', 3)
+        q.append(b'defgh', 1, 4)
+        self.assertEqual(6, len(q))
+        self.assertEqual(b'234efg', q.read(6))
+
+    def test_readto(self):
+        q = _buffer.BufferQueue()
+        for c in (b'1\n2', b'\nabc', b'defg\n4\n5'):
+            q.append(c)
+        for expected in (b'1\n', b'2\n', b'abcdefg\n', b'4\n'):
+            blocks = []
+            self.assertTrue(q.readto(b'\n', blocks))
+            self.assertEqual(expected, b''.join(blocks))
+        blocks = []
+        self.assertFalse(q.readto(b'\n', blocks))
+        self.assertEqual([b'5'], blocks)
+        self.assertEqual(0, len(q))
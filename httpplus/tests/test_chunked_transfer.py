@@ -116,6 +116,46 @@ class ChunkedTransferTest(util.HttpTestBase, unittest.TestCase):
         for amt, expect in [(1, b'h'), (5, b'i the'), (100, b're')]:
             self.assertEqual(expect, resp.read(amt))
 
+    def testChunkedDownloadTrailers(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        sock = con.sock
+        sock.data = [b'HTTP/1.1 200 OK\r\n',
+                     b'transfer-encoding: chunked',
+                     b'\r\n\r\n',
+                     chunkedblock(b'hi '),
+                     chunkedblock(b'there'),
+                     b'0\r\nX-Checksum: 1234\r\n',
+                     b'\r\n',
+                     ]
+        con.request('GET', '/')
+        resp = con.getresponse()
+        self.assertEqual(None, resp.trailers)
+        self.assertEqual(b'hi there', resp.read())
+        self.assertEqual('1234', resp.trailers.getheader('x-checksum'))
+
+    def testChunkedDownloadReadinto(self):
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con._connect({})
+        sock = con.sock
+        sock.data = [b'HTTP/1.1 200 OK\r\n',
+                     b'transfer-encoding: chunked',
+                     b'\r\n\r\n',
+                     chunkedblock(b'hi '),
+                     ] + tricklebytes(chunkedblock(b'there')) + [
+                     chunkedblock(b''),
+                     ]
+        con.request('GET', '/')
+        resp = con.getresponse()
+        buf = bytearray(4)
+        got = []
+        while True:
+            amt = resp.readinto(buf)
+            if not amt:
+                break
+            got.append(bytes(buf[:amt]))
+        self.assertEqual(b'hi there', b''.join(got))
+
     def testChunkedDownloadBadEOL(self):
         con = httpplus.HTTPConnection('1.2.3.4:80')
         con._connect({})
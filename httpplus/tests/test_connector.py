@@ -0,0 +1,205 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import errno
+import socket
+import unittest
+
+import httpplus
+from httpplus import _connector
+
+# relative import to ease embedding the library
+from . import util
+
+V4 = (socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '',
+      ('1.2.3.4', 80))
+V4B = (socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '',
+       ('1.2.3.5', 80))
+V6 = (socket.AF_INET6, socket.SOCK_STREAM, socket.IPPROTO_TCP, '',
+      ('::1', 80, 0, 0))
+V6B = (socket.AF_INET6, socket.SOCK_STREAM, socket.IPPROTO_TCP, '',
+       ('::2', 80, 0, 0))
+
+
+class InterleaveTest(unittest.TestCase):
+    def test_alternates_families(self):
+        self.assertEqual([V6, V4, V6B, V4B],
+                         _connector._interleave([V6, V6B, V4, V4B]))
+
+    def test_preferred_family_first(self):
+        self.assertEqual([V4, V6, V4B, V6B],
+                         _connector._interleave([V6, V6B, V4, V4B],
+                                                socket.AF_INET))
+
+    def test_uneven(self):
+        self.assertEqual([V6, V4, V6B],
+                         _connector._interleave([V6, V6B, V4]))
+
+
+class CreateConnectionTest(util.HttpTestBase, unittest.TestCase):
+    def setUp(self):
+        super(CreateConnectionTest, self).setUp()
+        self.addresses = [V6, V4]
+        socket.getaddrinfo = lambda host, port, family, socktype: list(
+            self.addresses)
+        # How each address behaves: hangs, or fails with an errno.
+        self.behavior = {}
+        self.made = []
+        self.unsupported = set()
+        socket.socket = self.factory
+        _connector._families.clear()
+
+    def tearDown(self):
+        _connector._families.clear()
+        super(CreateConnectionTest, self).tearDown()
+
+    def factory(self, af, socktype, proto):
+        if af in self.unsupported:
+            raise socket.error(errno.EAFNOSUPPORT,
+                               'Address family not supported by protocol')
+        sock = util.MockSocket(af, socktype, proto)
+        orig = sock.connect_ex
+        def connect_ex(sa):
+            how = self.behavior.get(sa[0], 0)
+            if how == 'raise':
+                raise socket.error(errno.ENETUNREACH, 'Network is unreachable')
+            sock.connect_hangs = how == 'hang'
+            if how != 'hang':
+                sock.connect_error = how
+            return orig(sa)
+        sock.connect_ex = connect_ex
+        self.made.append(sock)
+        return sock
+
+    def test_first_address(self):
+        sock = _connector.create_connection(('h', 80), delay=10)
+        self.assertEqual(('::1', 80, 0, 0), sock.sa)
+        self.assertTrue(sock.blocking)
+        self.assertEqual(1, len(self.made))
+        self.assertEqual(socket.AF_INET6, _connector._families['h'])
+
+    def test_hung_address_is_raced(self):
+        self.behavior['::1'] = 'hang'
+        sock = _connector.create_connection(('h', 80), delay=0.01)
+        self.assertEqual(('1.2.3.4', 80), sock.sa)
+        self.assertEqual(2, len(self.made))
+        self.assertTrue(self.made[0].closed)
+        self.assertFalse(sock.closed)
+        # The winning family goes first next time.
+        self.assertEqual(socket.AF_INET, _connector._families['h'])
+        del self.behavior['::1']
+        sock = _connector.create_connection(('h', 80), delay=10)
+        self.assertEqual(('1.2.3.4', 80), sock.sa)
+
+    def test_failure_starts_next_attempt_at_once(self):
+        self.behavior['::1'] = errno.ECONNREFUSED
+        sock = _connector.create_connection(('h', 80), delay=10)
+        self.assertEqual(('1.2.3.4', 80), sock.sa)
+        self.assertTrue(self.made[0].closed)
+
+    def test_unsupported_family_skipped(self):
+        self.unsupported.add(socket.AF_INET6)
+        self.addresses = [V6, V6B, V4]
+        sock = _connector.create_connection(('h', 80), delay=10)
+        self.assertEqual(('1.2.3.4', 80), sock.sa)
+        self.assertEqual(1, len(self.made))
+
+    def test_socket_error_from_connect_ex(self):
+        self.behavior['::1'] = 'raise'
+        sock = _connector.create_connection(('h', 80), delay=10)
+        self.assertEqual(('1.2.3.4', 80), sock.sa)
+        self.assertTrue(self.made[0].closed)
+
+    def test_all_unsupported(self):
+        self.unsupported.update([socket.AF_INET, socket.AF_INET6])
+        try:
+            _connector.create_connection(('h', 80), delay=10)
+        except socket.error as e:
+            self.assertEqual(errno.EAFNOSUPPORT, e.errno)
+        else:
+            self.fail('expected socket.error')
+
+    def test_all_fail(self):
+        self.behavior['::1'] = errno.ECONNREFUSED
+        self.behavior['1.2.3.4'] = errno.EHOSTUNREACH
+        try:
+            _connector.create_connection(('h', 80), delay=10)
+        except socket.error as e:
+            self.assertEqual(errno.EHOSTUNREACH, e.errno)
+        else:
+            self.fail('expected socket.error')
+        self.assertTrue(all(s.closed for s in self.made))
+        self.assertEqual({}, _connector._families)
+
+    def test_timeout(self):
+        self.behavior['::1'] = self.behavior['1.2.3.4'] = 'hang'
+        self.assertRaises(socket.timeout, _connector.create_connection,
+                          ('h', 80), timeout=0.02, delay=0.01)
+        self.assertEqual(2, len(self.made))
+        self.assertTrue(all(s.closed for s in self.made))
+
+    def test_connection_connect_timeout(self):
+        self.addresses = [V4]
+        self.behavior['1.2.3.4'] = 'hang'
+        con = httpplus.HTTPConnection('1.2.3.4:80', connect_timeout=0.01)
+        self.assertRaises(httpplus.HTTPTimeoutException,
+                          con.request, 'GET', '/')
+
+
+class RealCreateConnectionTest(unittest.TestCase):
+    def test_connect(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        try:
+            sock = _connector.create_connection(listener.getsockname(), 1)
+            try:
+                server, unused_addr = listener.accept()
+                sock.sendall(b'x')
+                self.assertEqual(b'x', server.recv(1))
+                server.close()
+            finally:
+                sock.close()
+        finally:
+            listener.close()
+
+    def test_refused(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        address = listener.getsockname()
+        listener.close()
+        self.assertRaises(socket.error, _connector.create_connection,
+                          address, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
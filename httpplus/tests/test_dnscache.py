@@ -0,0 +1,199 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import socket
+import unittest
+
+import httpplus
+from httpplus import dnscache
+
+# relative import to ease embedding the library
+from . import util
+
+
+class CachingResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.orig_getaddrinfo = socket.getaddrinfo
+        socket.getaddrinfo = self.getaddrinfo
+        self.orig_now = dnscache._now
+        self.now = 1000.0
+        dnscache._now = lambda: self.now
+        self.lookups = []
+        self.addresses = {'example.com': '1.2.3.4'}
+        self.resolver = dnscache.CachingResolver(ttl=60, negative_ttl=5,
+                                                 max_stale=30)
+        # Run background lookups when the test says so.
+        self.background = []
+        self.resolver._spawn = self.background.append
+
+    def tearDown(self):
+        socket.getaddrinfo = self.orig_getaddrinfo
+        dnscache._now = self.orig_now
+
+    def getaddrinfo(self, host, port, family, socktype):
+        self.assertEqual((None, 0, socket.SOCK_STREAM),
+                         (port, family, socktype))
+        self.lookups.append(host)
+        if host not in self.addresses:
+            raise socket.gaierror(socket.EAI_NONAME, 'not found')
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '',
+                 (self.addresses[host], 0))]
+
+    def address(self, host, port=80):
+        return self.resolver.getaddrinfo(host, port)[0][4]
+
+    def test_cached(self):
+        self.assertEqual(('1.2.3.4', 80), self.address('example.com'))
+        self.assertEqual(('1.2.3.4', 443), self.address(b'EXAMPLE.com', 443))
+        self.assertEqual(['example.com'], self.lookups)
+        self.assertEqual((1, 1), (self.resolver.hits, self.resolver.misses))
+
+    def test_negative(self):
+        self.assertRaises(socket.gaierror, self.address, 'nowhere')
+        self.assertRaises(socket.gaierror, self.address, 'nowhere')
+        self.assertEqual(['nowhere'], self.lookups)
+        self.now += 6
+        self.addresses['nowhere'] = '5.6.7.8'
+        self.assertEqual(('5.6.7.8', 80), self.address('nowhere'))
+
+    def test_stale_while_revalidate(self):
+        self.address('example.com')
+        self.now += 61
+        self.addresses['example.com'] = '1.2.3.5'
+        # The stale entry is used while it's refreshed.
+        self.assertEqual(('1.2.3.4', 80), self.address('example.com'))
+        self.assertEqual(('1.2.3.4', 80), self.address('example.com'))
+        self.assertEqual(1, len(self.background))
+        self.background.pop()()
+        self.assertEqual(('1.2.3.5', 80), self.address('example.com'))
+        self.assertEqual(['example.com'] * 2, self.lookups)
+
+    def test_failed_refresh_keeps_stale(self):
+        self.address('example.com')
+        self.now += 61
+        del self.addresses['example.com']
+        self.address('example.com')
+        self.background.pop()()
+        self.assertEqual(('1.2.3.4', 80), self.address('example.com'))
+
+    def test_too_stale(self):
+        self.address('example.com')
+        self.now += 91
+        self.addresses['example.com'] = '1.2.3.5'
+        self.assertEqual(('1.2.3.5', 80), self.address('example.com'))
+        self.assertEqual([], self.background)
+
+    def test_ttl_zero_disables(self):
+        self.resolver.ttl = 0
+        self.address('example.com')
+        self.address('example.com')
+        self.assertEqual(['example.com'] * 2, self.lookups)
+
+    def test_ttl_zero_disables_negative_caching(self):
+        self.resolver.ttl = 0
+        self.assertRaises(socket.gaierror, self.address, 'nowhere')
+        self.assertRaises(socket.gaierror, self.address, 'nowhere')
+        self.assertEqual(['nowhere'] * 2, self.lookups)
+
+    def test_maxsize(self):
+        self.resolver.maxsize = 2
+        self.addresses.update({'a.com': '1.1.1.1', 'b.com': '2.2.2.2'})
+        for host in ('example.com', 'a.com', 'b.com'):
+            self.address(host)
+        self.assertEqual(['a.com', 'b.com'], list(self.resolver._cache))
+        # Looking a host up again makes it the newest.
+        self.now += 61 + 30
+        self.address('a.com')
+        self.address('example.com')
+        self.assertEqual(['a.com', 'example.com'], list(self.resolver._cache))
+
+    def test_prefetch(self):
+        self.resolver.prefetch(['example.com', 'nowhere'], wait=True)
+        self.assertEqual(['example.com', 'nowhere'], self.lookups)
+        self.address('example.com')
+        self.assertRaises(socket.gaierror, self.address, 'nowhere')
+        self.assertEqual(2, len(self.lookups))
+
+    def test_prefetch_in_background(self):
+        self.resolver.prefetch(['example.com'])
+        self.assertEqual([], self.lookups)
+        self.background.pop()()
+        self.address('example.com')
+        self.assertEqual(['example.com'], self.lookups)
+
+    def test_prefetch_uses_one_thread(self):
+        self.addresses['a.com'] = '1.1.1.1'
+        self.resolver.prefetch(['example.com', 'nowhere', 'a.com'])
+        self.assertEqual(1, len(self.background))
+        # Hosts already being looked up aren't queued again.
+        self.resolver.prefetch(['a.com', 'example.com'])
+        self.assertEqual(1, len(self.background))
+        self.background.pop()()
+        self.assertEqual(['example.com', 'nowhere', 'a.com'], self.lookups)
+        self.assertEqual(set(), self.resolver._refreshing)
+        self.address('a.com')
+        self.assertEqual(3, len(self.lookups))
+
+    def test_clear(self):
+        self.address('example.com')
+        self.resolver.clear()
+        self.address('example.com')
+        self.assertEqual(2, len(self.lookups))
+
+
+class ConnectionUsesCacheTest(util.HttpTestBase, unittest.TestCase):
+    def setUp(self):
+        super(ConnectionUsesCacheTest, self).setUp()
+        self.default_misses = dnscache.default.misses
+    def test_shared_by_connections(self):
+        lookups = []
+        def getaddrinfo(host, port, family, socktype):
+            lookups.append(host)
+            return util.mockgetaddrinfo(host, port, family, socktype)
+        socket.getaddrinfo = getaddrinfo
+        for _ in range(2):
+            con = httpplus.HTTPConnection('1.2.3.4:8080')
+            con._connect({})
+            self.assertEqual((b'1.2.3.4', 8080), con.sock.sa)
+        self.assertEqual(1, len(lookups))
+
+    def test_own_resolver(self):
+        resolver = dnscache.CachingResolver()
+        con = httpplus.HTTPConnection('1.2.3.4:80', resolver=resolver)
+        con._connect({})
+        self.assertEqual(1, resolver.misses)
+        self.assertEqual(0, dnscache.default.misses
+                         - self.default_misses)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import email
+import sys
+import unittest
+
+from httpplus import _headers
+
+_BLOCK = (b'Server: BogusServer 1.0\r\n'
+          b'Content-Length: 10\r\n'
+          b'MultiHeader: Value\r\n'
+          b'multiheader: Other Value  \r\n'
+          b'Folded: first\r\n'
+          b'\tsecond\r\n'
+          b'  third\r\n'
+          b'Empty:\r\n'
+          b'Latin: caf\xe9')
+
+
+class HeaderMapTest(unittest.TestCase):
+    def test_lookup(self):
+        h = _headers.parse(_BLOCK)
+        self.assertTrue('content-length' in h)
+        self.assertTrue('CONTENT-LENGTH' in h)
+        self.assertFalse('transfer-encoding' in h)
+        self.assertEqual('10', h['Content-Length'])
+        self.assertEqual(None, h['transfer-encoding'])
+        self.assertEqual('Value', h.getheader('multiheader'))
+        self.assertEqual(['Value', 'Other Value  '],
+                         h.getheaders('MultiHeader'))
+        self.assertEqual(None, h.getheaders('missing'))
+        self.assertEqual('nope', h.getheader('missing', 'nope'))
+        self.assertEqual(7, len(h))
+
+    def test_matches_email_parser(self):
+        if sys.version_info < (3, 0):
+            return
+        ours = _headers.parse(_BLOCK)
+        theirs = email.message_from_string(_BLOCK.decode('iso-8859-1'))
+        self.assertEqual(theirs.items(), ours.items())
+        for name in ('multiheader', 'folded', 'empty', 'latin', 'missing'):
+            self.assertEqual(theirs.get_all(name), ours.get_all(name))
+
+    def test_empty(self):
+        h = _headers.parse(b'')
+        self.assertEqual({}, dict(h))
+        self.assertEqual([], h.items())
+
+
+class FramingTest(unittest.TestCase):
+    def test_framing(self):
+        block = (b'Server: BogusServer 1.0\r\n'
+                 b'X-Content-Length: 99\r\n'
+                 b'content-LENGTH:  10 \r\n'
+                 b'Content-Length: 11\r\n'
+                 b'Connection: close\r\n'
+                 b'X: transfer-encoding: chunked')
+        self.assertEqual({'content-length': '10', 'connection': 'close'},
+                         _headers.framing(block))
+        self.assertEqual({}, _headers.framing(b''))
@@ -0,0 +1,430 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import errno
+import socket
+import unittest
+
+import httpplus
+from httpplus import multiplex
+from httpplus import pool
+
+# relative import to ease embedding the library
+from . import util
+
+
+def response(body, extra=b''):
+    return (b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n%s\r\n'
+            % (len(body), extra) + body)
+
+
+class ClosingSocket(util.MockSocket):
+    """Closed by the server part way through a POST."""
+    def send(self, data):
+        if self.remote_closed:
+            raise socket.error(errno.EPIPE, 'Broken pipe')
+        sent = util.MockSocket.send(self, data)
+        if b'POST' in self.sent:
+            self.remote_closed = True
+        return sent
+
+
+class AnsweringSocket(util.MockSocket):
+    """Answers part of a POST and then fails writes."""
+    def send(self, data):
+        if b'POST' in self.sent and not self.data:
+            raise socket.error(errno.EPIPE, 'Broken pipe')
+        return util.MockSocket.send(self, data)
+
+
+class MultiplexerTest(util.HttpTestBase, unittest.TestCase):
+    def test_many_connections(self):
+        socks = self.mocksockets(*[[response(b'body %d' % i)]
+                                   for i in range(10)])
+        mux = multiplex.Multiplexer()
+        cons = [httpplus.HTTPConnection('1.2.3.%d' % i) for i in range(10)]
+        transfers = [mux.request(con, 'GET', '/%d' % i)
+                     for i, con in enumerate(cons)]
+        self.assertEqual(10, len(mux))
+        self.assertEqual([], socks)
+        done = mux.run()
+        self.assertEqual(sorted(transfers, key=id), sorted(done, key=id))
+        self.assertEqual(0, len(mux))
+        for i, t in enumerate(transfers):
+            self.assertIsNone(t.error)
+            self.assertEqual(200, t.response.status)
+            self.assertEqual(b'body %d' % i, t.body)
+            self.assertTrue(t.finished >= t.started)
+            self.assertFalse(cons[i].busy())
+        self.assertEqual(10, len(socks))
+        self.assertStringEqual(b'GET /3 HTTP/1.1\r\n'
+                               b'Host: 1.2.3.3\r\n'
+                               b'accept-encoding: identity\r\n\r\n',
+                               socks[3].sent)
+
+    def test_requests_on_one_connection_reuse_socket(self):
+        socks = self.mocksockets([response(b'one'), response(b'two')],
+                                 per_request=True)
+        mux = multiplex.Multiplexer()
+        con = httpplus.HTTPConnection('1.2.3.4')
+        first = mux.request(con, 'GET', '/a')
+        second = mux.request(con, 'GET', '/b')
+        self.assertEqual([first, second], list(mux.as_completed()))
+        self.assertEqual(b'one', first.body)
+        self.assertEqual(b'two', second.body)
+        self.assertEqual(1, len(socks))
+        self.assertFalse(socks[0].closed)
+        self.assertIs(socks[0], con.sock)
+
+    def test_callback_and_poll(self):
+        self.mocksockets([response(b'one')])
+        mux = multiplex.Multiplexer()
+        got = []
+        t = mux.request(httpplus.HTTPConnection('1.2.3.4'), 'GET', '/',
+                        callback=got.append)
+        done = []
+        while len(mux):
+            done.extend(mux.poll())
+        self.assertEqual([t], got)
+        self.assertEqual([t], done)
+
+    def test_busy_while_in_progress(self):
+        self.mocksockets([response(b'one')])
+        mux = multiplex.Multiplexer()
+        con = httpplus.HTTPConnection('1.2.3.4')
+        mux.request(con, 'GET', '/')
+        mux.poll(0)
+        self.assertTrue(con.busy())
+        mux.run()
+        self.assertFalse(con.busy())
+
+    def test_post(self):
+        socks = self.mocksockets([response(b'ok')])
+        body = b'x' * 100000 + b'end'
+        con = httpplus.HTTPConnection('1.2.3.4')
+        con._connect({})
+        socks[0].read_wait_sentinel = b'end'
+        mux = multiplex.Multiplexer()
+        t = mux.request(con, 'POST', '/', body=body)
+        mux.run()
+        self.assertEqual(b'ok', t.body)
+        self.assertTrue(socks[0].sent.endswith(b'\r\n\r\n' + body))
+
+    def test_expect_continue(self):
+        socks = self.mocksockets([b'HTTP/1.1 100 Continue\r\n\r\n',
+                                  response(b'ok')])
+        mux = multiplex.Multiplexer()
+        t = mux.request(httpplus.HTTPConnection('1.2.3.4'), 'POST', '/',
+                        body=b'data', expect_continue=True)
+        mux.run()
+        self.assertEqual(b'ok', t.body)
+        self.assertTrue(socks[0].sent.endswith(b'\r\n\r\ndata'))
+
+    def test_early_response(self):
+        socks = self.mocksockets([b'HTTP/1.1 413 Too Large\r\n'
+                                  b'Content-Length: 4\r\n\r\nnope'])
+        con = httpplus.HTTPConnection('1.2.3.4')
+        mux = multiplex.Multiplexer()
+        t = mux.request(con, 'POST', '/', body=b'x' * 100000)
+        mux.run()
+        self.assertEqual(413, t.response.status)
+        self.assertEqual(b'nope', t.body)
+        self.assertTrue(t.response.will_close)
+        self.assertTrue(socks[0].closed)
+        self.assertIsNone(con.sock)
+
+    def test_connection_close(self):
+        socks = self.mocksockets([response(b'one', b'Connection: close\r\n')],
+                                 [response(b'two')])
+        con = httpplus.HTTPConnection('1.2.3.4')
+        mux = multiplex.Multiplexer()
+        first = mux.request(con, 'GET', '/a')
+        second = mux.request(con, 'GET', '/b')
+        mux.run()
+        self.assertEqual(b'one', first.body)
+        self.assertEqual(b'two', second.body)
+        self.assertEqual(2, len(socks))
+        self.assertTrue(socks[0].closed)
+
+    def test_retry_on_closed_keepalive(self):
+        socks = self.mocksockets([response(b'one')], [response(b'two')])
+        con = httpplus.HTTPConnection('1.2.3.4')
+        mux = multiplex.Multiplexer()
+        mux.request(con, 'GET', '/a')
+        mux.run()
+        # The server hangs up on the idle connection.
+        socks[0].close_on_empty = socks[0].remote_closed = True
+        socks[0].send = lambda data: len(data)
+        t = mux.request(con, 'GET', '/b')
+        mux.run()
+        self.assertIsNone(t.error)
+        self.assertEqual(b'two', t.body)
+        self.assertEqual(2, len(socks))
+
+    def test_retry_on_write_failure_ignores_old_socket(self):
+        socks = self.mocksockets([response(b'one')], [response(b'two')],
+                                 per_request=True)
+        factory = socket.socket
+        def closing(*args):
+            sock = factory(*args)
+            if len(socks) == 1:
+                sock.__class__ = ClosingSocket
+            return sock
+        socket.socket = closing
+        con = httpplus.HTTPConnection('1.2.3.4')
+        mux = multiplex.Multiplexer()
+        first = mux.request(con, 'GET', '/')
+        second = mux.request(con, 'POST', '/', body=b'x' * 20000)
+        mux.run()
+        self.assertEqual((None, None), (first.error, second.error))
+        self.assertEqual(b'two', second.body)
+        self.assertEqual(2, len(socks))
+        self.assertTrue(socks[0].closed)
+        self.assertTrue(socks[1].sent.startswith(b'POST / HTTP/1.1\r\n'))
+
+    def test_write_failure_after_response_data_not_retried(self):
+        partial = b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\npart'
+        socks = self.mocksockets([response(b'one'), partial],
+                                 per_request=True)
+        factory = socket.socket
+        def answering(*args):
+            sock = factory(*args)
+            sock.__class__ = AnsweringSocket
+            return sock
+        socket.socket = answering
+        con = httpplus.HTTPConnection('1.2.3.4')
+        mux = multiplex.Multiplexer()
+        mux.request(con, 'GET', '/')
+        second = mux.request(con, 'POST', '/', body=b'x' * 20000)
+        mux.run()
+        self.assertEqual(errno.EPIPE, second.error.args[0])
+        self.assertEqual(1, len(socks))
+
+    def test_closed_without_response_is_error(self):
+        # The empty string is the server closing the connection.
+        socks = self.mocksockets([b''])
+        mux = multiplex.Multiplexer()
+        con = httpplus.HTTPConnection('1.2.3.4')
+        t = mux.request(con, 'GET', '/')
+        done = mux.run()
+        self.assertEqual([t], done)
+        self.assertIsInstance(t.error, httpplus.HTTPRemoteClosedError)
+        self.assertIsNone(t.body)
+        self.assertIsNone(con.sock)
+        self.assertFalse(con.busy())
+        self.assertTrue(socks[0].closed)
+
+    def test_timeout(self):
+        socks = self.mocksockets([response(b'one')])
+        con = httpplus.HTTPConnection('1.2.3.4', timeout=0.01)
+        mux = multiplex.Multiplexer()
+        t = mux.request(con, 'GET', '/')
+        mux.poll(0)
+        # Never let the response arrive.
+        socks[0].read_wait_sentinel = b'never'
+        mux.run()
+        self.assertIsInstance(t.error, httpplus.HTTPTimeoutException)
+
+    def test_blackholed_host_does_not_hold_up_others(self):
+        socks = self.mocksockets([], [response(b'live')])
+        factory = socket.socket
+        def blackholed(*args):
+            sock = factory(*args)
+            sock.connect_hangs = len(socks) == 1
+            return sock
+        socket.socket = blackholed
+        mux = multiplex.Multiplexer()
+        dead = mux.request(httpplus.HTTPConnection('1.1.1.1',
+                                                   connect_timeout=0.05),
+                           'GET', '/')
+        live = mux.request(httpplus.HTTPConnection('2.2.2.2'), 'GET', '/')
+        self.assertEqual([live, dead], mux.run())
+        self.assertEqual(b'live', live.body)
+        self.assertIsInstance(dead.error, httpplus.HTTPTimeoutException)
+        self.assertTrue(socks[0].closed)
+        self.assertEqual(0, len(mux._sockets))
+
+    def test_ssl_handshake(self):
+        self.mocksockets([response(b'ok')])
+        validated = []
+        con = httpplus.HTTPConnection('1.1.1.1:443',
+                                      ssl_validator=validated.append)
+        mux = multiplex.Multiplexer()
+        transfer = mux.request(con, 'GET', '/')
+        mux.run()
+        self.assertEqual(b'ok', transfer.body)
+        self.assertIsInstance(con.sock, util.MockSSLSocket)
+        self.assertEqual(2, con.sock.handshakes)
+        self.assertEqual([con.sock], validated)
+
+    def test_close_abandons_transfers(self):
+        socks = self.mocksockets([response(b'one')])
+        mux = multiplex.Multiplexer()
+        con = httpplus.HTTPConnection('1.2.3.4')
+        t = mux.request(con, 'GET', '/')
+        mux.poll(0)
+        mux.close()
+        self.assertIsInstance(t.error, httpplus.HTTPStateError)
+        self.assertTrue(socks[0].closed)
+        self.assertEqual(0, len(mux))
+
+
+class LendingPool(pool.HTTPConnectionPool):
+    """A pool whose one connection is lent out for its first two gets."""
+
+    def __init__(self, *args, **kwargs):
+        pool.HTTPConnectionPool.__init__(self, *args, **kwargs)
+        self.gets = -1
+        self.lent = self.get('2.2.2.2')
+
+    def get(self, *args, **kwargs):
+        self.gets += 1
+        if self.gets == 3:
+            self.discard(self.lent)
+        return pool.HTTPConnectionPool.get(self, *args, **kwargs)
+
+
+class FetchManyTest(util.HttpTestBase, unittest.TestCase):
+    def test_reuses_connections_per_host(self):
+        socks = self.mocksockets(
+            [response(b'a%d' % i) for i in range(3)],
+            [response(b'b%d' % i) for i in range(3)], per_request=True)
+        urls = []
+        for i in range(3):
+            urls.append('http://1.1.1.1/%d' % i)
+            urls.append('http://2.2.2.2:8080/%d?q=%d' % (i, i))
+        results = list(multiplex.fetch_many(urls, per_host=1, ordered=True))
+        self.assertEqual(urls, [url for url, unused in results])
+        self.assertEqual([b'a0', b'b0', b'a1', b'b1', b'a2', b'b2'],
+                         [t.body for unused, t in results])
+        self.assertEqual(2, len(socks))
+        self.assertTrue(socks[1].sent.startswith(b'GET /0?q=0 HTTP/1.1\r\n'))
+        self.assertIn(b'Host: 2.2.2.2:8080\r\n', socks[1].sent)
+        # The pool was closed afterwards.
+        self.assertTrue(socks[0].closed)
+        for unused, t in results:
+            self.assertTrue(t.queued <= t.started <= t.responded <= t.finished)
+            self.assertTrue(t.elapsed >= 0)
+
+    def test_max_concurrency(self):
+        socks = self.mocksockets([response(b'ok')] * 2, [response(b'ok')] * 2,
+                                 per_request=True)
+        urls = ['http://1.1.1.1/%d' % i for i in range(4)]
+        results = list(multiplex.fetch_many(urls, max_concurrency=2,
+                                            per_host=4))
+        self.assertEqual(4, len(results))
+        self.assertEqual(2, len(socks))
+        for sock in socks:
+            self.assertEqual(2, sock.sent.count(b'GET /'))
+
+    def test_request_tuples(self):
+        socks = self.mocksockets([response(b'ok')])
+        request = ('POST', 'http://1.1.1.1/', b'data', {'X-Foo': 'bar'})
+        results = list(multiplex.fetch_many([request]))
+        self.assertEqual([request], [r for r, unused in results])
+        self.assertEqual(b'ok', results[0][1].body)
+        self.assertTrue(socks[0].sent.startswith(b'POST / HTTP/1.1\r\n'))
+        self.assertIn(b'X-Foo: bar\r\n', socks[0].sent)
+        self.assertTrue(socks[0].sent.endswith(b'\r\n\r\ndata'))
+
+    def test_errors_are_returned(self):
+        self.mocksockets([b''], [response(b'ok')])
+        results = list(multiplex.fetch_many(
+            ['http://1.1.1.1/', 'http://2.2.2.2/'], ordered=True))
+        self.assertIsInstance(results[0][1].error,
+                              httpplus.HTTPRemoteClosedError)
+        self.assertEqual(b'ok', results[1][1].body)
+
+    def test_shared_pool(self):
+        socks = self.mocksockets([response(b'one'), response(b'two')],
+                                 per_request=True)
+        p = pool.HTTPConnectionPool()
+        list(multiplex.fetch_many(['http://1.1.1.1/a'], connection_pool=p))
+        list(multiplex.fetch_many(['http://1.1.1.1/b'], connection_pool=p))
+        self.assertEqual(1, len(socks))
+        self.assertEqual(1, p.hits)
+        self.assertEqual(1, len(p))
+        p.close()
+
+    def test_waits_for_exhausted_pool(self):
+        self.mocksockets([response(b'ok')])
+        p = LendingPool(maxtotal=1)
+        sleeps = []
+        orig = multiplex.time.sleep
+        multiplex.time.sleep = sleeps.append
+        try:
+            results = list(multiplex.fetch_many(['http://1.1.1.1/'],
+                                                connection_pool=p))
+        finally:
+            multiplex.time.sleep = orig
+        self.assertEqual(b'ok', results[0][1].body)
+        self.assertEqual([multiplex._POOL_RETRY_DELAY] * 2, sleeps)
+        p.close()
+
+    def test_saturated_host_does_not_hold_up_others(self):
+        socks = self.mocksockets([response(b'two')], [response(b'one')])
+        p = pool.HTTPConnectionPool(maxperhost=1)
+        held = p.get('1.1.1.1')
+        # Sockets made by the time fetch_many waits for the pool.
+        made = []
+        def sleep(unused_seconds):
+            if not made:
+                p.discard(held)
+            made.append(len(socks))
+        orig = multiplex.time.sleep
+        multiplex.time.sleep = sleep
+        try:
+            results = list(multiplex.fetch_many(
+                ['http://1.1.1.1/', 'http://2.2.2.2/'], connection_pool=p))
+        finally:
+            multiplex.time.sleep = orig
+        self.assertEqual([1], made)
+        self.assertEqual([('http://2.2.2.2/', b'two'),
+                          ('http://1.1.1.1/', b'one')],
+                         [(r, t.body) for r, t in results])
+        p.close()
+
+    def test_connection_discarded_when_request_fails(self):
+        p = pool.HTTPConnectionPool()
+        # A body can't be a number.
+        requests = [('POST', 'http://1.1.1.1/', 12)]
+        self.assertRaises(httpplus.BadRequestData, list,
+                          multiplex.fetch_many(requests, connection_pool=p))
+        self.assertEqual(0, len(p))
+
+    def test_bad_url(self):
+        self.assertRaises(ValueError, list,
+                          multiplex.fetch_many(['ftp://1.1.1.1/']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import unittest
+
+import httpplus
+
+# relative import to ease embedding the library
+from . import util
+
+
+def response(body):
+    return (b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(body)
+            + body)
+
+
+class MultiSocketTest(util.HttpTestBase, unittest.TestCase):
+    def test_second_socket(self):
+        socks = self.mocksockets([response(b'one')], [response(b'two')])
+        con = httpplus.HTTPConnection('1.2.3.4:80', max_sockets=2)
+        con.request('GET', '/a')
+        con.request('GET', '/b')
+        self.assertEqual(2, len(socks))
+        self.assertTrue(socks[0].sent.startswith(b'GET /a '))
+        self.assertTrue(socks[1].sent.startswith(b'GET /b '))
+        first = con.getresponse()
+        second = con.getresponse()
+        self.assertEqual(b'two', second.read())
+        self.assertEqual(b'one', first.read())
+        self.assertRaises(httpplus.httplib.ResponseNotReady, con.getresponse)
+
+    def test_idle_socket_is_reused(self):
+        socks = self.mocksockets([response(b'one')],
+                                 [response(b'two'), response(b'three')])
+        con = httpplus.HTTPConnection('1.2.3.4:80', max_sockets=2)
+        con.request('GET', '/a')
+        con.request('GET', '/b')
+        self.assertEqual(b'one', con.getresponse().read())
+        second = con.getresponse()
+        # The first socket is free again, even though the second
+        # response hasn't been read.
+        self.assertFalse(con.busy())
+        socks[0].data = [response(b'four')]
+        socks[0].sent = b''
+        con.request('GET', '/c')
+        self.assertEqual(2, len(socks))
+        self.assertTrue(socks[0].sent.startswith(b'GET /c '))
+        self.assertEqual(b'four', con.getresponse().read())
+        self.assertEqual(b'two', second.read())
+
+    def test_socket_limit(self):
+        self.mocksockets([response(b'one')], [response(b'two')])
+        con = httpplus.HTTPConnection('1.2.3.4:80', max_sockets=2)
+        con.request('GET', '/a')
+        self.assertFalse(con.busy())
+        con.request('GET', '/b')
+        self.assertTrue(con.busy())
+        self.assertRaises(httpplus.httplib.CannotSendRequest,
+                          con.request, 'GET', '/c')
+
+    def test_pipelines_when_all_sockets_busy(self):
+        socks = self.mocksockets([response(b'one') + response(b'three')],
+                                 [response(b'two')])
+        con = httpplus.HTTPConnection('1.2.3.4:80', max_sockets=2,
+                                      pipeline_depth=2)
+        con.request('GET', '/a')
+        con.request('GET', '/b')
+        con.request('GET', '/c')
+        self.assertEqual(2, len(socks))
+        self.assertEqual([b'one', b'two', b'three'],
+                         [con.getresponse().read() for _ in range(3)])
+
+    def test_close_closes_all_sockets(self):
+        socks = self.mocksockets([response(b'one')], [response(b'two')])
+        con = httpplus.HTTPConnection('1.2.3.4:80', max_sockets=2)
+        con.request('GET', '/a')
+        con.request('GET', '/b')
+        con.close()
+        self.assertTrue(socks[0].closed)
+        self.assertTrue(socks[1].closed)
+        self.assertEqual([], con._children)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import unittest
+
+import httpplus
+
+# relative import to ease embedding the library
+from . import util
+
+
+def response(body, *headers):
+    return b''.join([b'HTTP/1.1 200 OK\r\n',
+                     b'Content-Length: %d\r\n' % len(body)]
+                    + [h + b'\r\n' for h in headers]
+                    + [b'\r\n', body])
+
+
+class PipeliningTest(util.HttpTestBase, unittest.TestCase):
+    def test_responses_in_order(self):
+        one, two, three = (response(b'one'), response(b'two'),
+                           response(b'three'))
+        # Responses arrive split at arbitrary points, so each read
+        # overlaps the next response.
+        socks = self.mocksockets([one + two[:10], two[10:] + three])
+        con = httpplus.HTTPConnection('1.2.3.4:80', pipeline_depth=3)
+        con.request('GET', '/a')
+        socks[0].read_wait_sentinel = b'GET /c'
+        con.request('GET', '/b')
+        con.request('GET', '/c')
+        self.assertEqual(3, socks[0].sent.count(b'GET /'))
+        self.assertEqual(b'one', con.getresponse().read())
+        self.assertEqual(b'two', con.getresponse().read())
+        self.assertEqual(b'three', con.getresponse().read())
+        self.assertFalse(con.busy())
+        self.assertRaises(httpplus.httplib.ResponseNotReady, con.getresponse)
+        self.assertEqual(1, len(socks))
+
+    def test_getresponse_before_reading_previous(self):
+        body = b'x' * 100
+        socks = self.mocksockets([response(body), response(b'two')])
+        con = httpplus.HTTPConnection('1.2.3.4:80', pipeline_depth=2)
+        con.request('GET', '/a')
+        socks[0].read_wait_sentinel = b'GET /b'
+        con.request('GET', '/b')
+        first = con.getresponse()
+        second = con.getresponse()
+        # The rest of the first body was buffered to get past it.
+        self.assertEqual(b'two', second.read())
+        self.assertEqual(body, first.read())
+
+    def test_data_arrives_while_pipelining(self):
+        socks = self.mocksockets([response(b'one'), response(b'two')])
+        con = httpplus.HTTPConnection('1.2.3.4:80', pipeline_depth=2)
+        con.request('GET', '/a')
+        # The first response is read while the second request is
+        # being written.
+        con.request('GET', '/b')
+        self.assertTrue(con._current_response.complete())
+        self.assertEqual(b'one', con.getresponse().read())
+        self.assertEqual(b'two', con.getresponse().read())
+        self.assertEqual(2, socks[0].sent.count(b'GET /'))
+
+    def test_depth_limit(self):
+        self.mocksockets([])
+        con = httpplus.HTTPConnection('1.2.3.4:80', pipeline_depth=2)
+        con.request('GET', '/a')
+        con.sock.read_wait_sentinel = b'never'
+        con.request('GET', '/b')
+        self.assertRaises(httpplus.httplib.CannotSendRequest,
+                          con.request, 'GET', '/c')
+
+    def test_disabled_by_default(self):
+        self.mocksockets([])
+        con = httpplus.HTTPConnection('1.2.3.4:80')
+        con.request('GET', '/a')
+        self.assertRaises(httpplus.httplib.CannotSendRequest,
+                          con.request, 'GET', '/b')
+
+    def test_unsafe_requests_not_pipelined(self):
+        self.mocksockets([])
+        con = httpplus.HTTPConnection('1.2.3.4:80', pipeline_depth=4)
+        con.request('GET', '/a')
+        con.sock.read_wait_sentinel = b'never'
+        self.assertRaises(httpplus.httplib.CannotSendRequest,
+                          con.request, 'POST', '/b', body=b'data')
+        self.assertRaises(httpplus.httplib.CannotSendRequest,
+                          con.request, 'PUT', '/b',
+                          body=(b for b in [b'data']))
+        self.assertRaises(httpplus.httplib.CannotSendRequest,
+                          con.request, 'PUT', '/b', body=b'data',
+                          expect_continue=True)
+        con.request('PUT', '/b', body=b'data')
+
+    def test_resent_after_connection_close(self):
+        socks = self.mocksockets([response(b'one', b'Connection: close')],
+                             [response(b'two')])
+        con = httpplus.HTTPConnection('1.2.3.4:80', pipeline_depth=2)
+        con.request('GET', '/a')
+        con.request('GET', '/b')
+        first = con.getresponse()
+        self.assertEqual(2, len(socks))
+        self.assertTrue(socks[1].sent.startswith(b'GET /b '))
+        self.assertEqual(b'one', first.read())
+        self.assertTrue(socks[0].closed)
+        self.assertEqual(b'two', con.getresponse().read())
+
+    def test_resent_after_unannounced_close(self):
+        socks = self.mocksockets([response(b'one')], [response(b'two')])
+        con = httpplus.HTTPConnection('1.2.3.4:80', pipeline_depth=2)
+        con.request('GET', '/a')
+        socks[0].close_on_empty = True
+        socks[0].read_wait_sentinel = b'GET /b'
+        con.request('GET', '/b')
+        self.assertEqual(b'one', con.getresponse().read())
+        self.assertEqual(b'two', con.getresponse().read())
+        self.assertEqual(2, len(socks))
+        self.assertTrue(socks[1].sent.startswith(b'GET /b '))
+
+
+if __name__ == '__main__':
+    unittest.main()
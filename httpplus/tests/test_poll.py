@@ -0,0 +1,183 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import os
+import socket
+import unittest
+
+from httpplus import _poll
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class BufferedSocket(object):
+    """Looks like an SSL socket holding decrypted data."""
+    def __init__(self, sock):
+        self.fileno = sock.fileno
+
+    def pending(self): # pylint: disable=no-self-use
+        return 5
+
+
+class PollerTestMixin(object):
+    poller_class = None
+
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+        self.poller = self.poller_class(self.a)
+
+    def tearDown(self):
+        self.poller.close()
+        self.a.close()
+        self.b.close()
+
+    def test_timeout(self):
+        self.assertEqual((False, False), self.poller.wait(True, False, 0))
+
+    def test_writable(self):
+        self.assertEqual((False, True), self.poller.wait(True, True, 0))
+
+    def test_readable(self):
+        self.b.send(b'x')
+        self.assertEqual((True, False), self.poller.wait(True, False, 1))
+        self.assertEqual((True, True), self.poller.wait(True, True, 1))
+        self.assertEqual((True, False), self.poller.wait(True, False, 1))
+
+    def test_pending_data_is_readable(self):
+        poller = self.poller_class(BufferedSocket(self.a))
+        try:
+            self.assertEqual((True, False), poller.wait(True, True, 0))
+        finally:
+            poller.close()
+
+
+@unittest.skipIf(_poll.selectors is None, 'selectors is not available')
+class SelectorPollerTest(PollerTestMixin, unittest.TestCase):
+    poller_class = _poll._SelectorPoller
+
+    def test_registered_once(self):
+        calls = []
+        selector = self.poller._selector
+        orig_modify = selector.modify
+        def modify(*args):
+            calls.append(args)
+            return orig_modify(*args)
+        selector.modify = modify
+        for _ in range(3):
+            self.poller.wait(True, False, 0)
+        self.assertEqual([], calls)
+        self.poller.wait(True, True, 0)
+        self.poller.wait(True, True, 0)
+        self.assertEqual(1, len(calls))
+
+    def test_fd_above_fd_setsize(self):
+        if resource is None:
+            raise unittest.SkipTest('no resource module')
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < 2048:
+            if hard != resource.RLIM_INFINITY and hard < 2048:
+                raise unittest.SkipTest('fd limit too low')
+            resource.setrlimit(resource.RLIMIT_NOFILE, (2048, hard))
+        try:
+            fd = os.dup2(self.a.fileno(), 2000) or 2000
+            high = socket.socket(fileno=fd)
+            try:
+                poller = self.poller_class(high)
+                try:
+                    self.b.send(b'x')
+                    self.assertEqual((True, True), poller.wait(True, True, 1))
+                finally:
+                    poller.close()
+            finally:
+                high.close()
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+
+class SelectPollerTest(PollerTestMixin, unittest.TestCase):
+    poller_class = _poll._SelectPoller
+
+
+class SocketSetTestMixin(object):
+    set_class = None
+
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+        self.c, self.d = socket.socketpair()
+        self.set = self.set_class()
+
+    def tearDown(self):
+        self.set.close()
+        for s in (self.a, self.b, self.c, self.d):
+            s.close()
+
+    def test_timeout(self):
+        self.set.set(self.a, True, False, 'a')
+        self.set.set(self.c, True, False, 'c')
+        self.assertEqual([], self.set.select(0))
+
+    def test_ready(self):
+        self.set.set(self.a, True, True, 'a')
+        self.set.set(self.c, True, False, 'c')
+        self.d.send(b'x')
+        self.assertEqual([('a', False, True), ('c', True, False)],
+                         sorted(self.set.select(1)))
+        self.set.set(self.a, True, False, 'a')
+        self.assertEqual([('c', True, False)], self.set.select(1))
+
+    def test_discard(self):
+        self.set.set(self.a, True, False, 'a')
+        self.set.set(self.c, True, False, 'c')
+        self.assertEqual(2, len(self.set))
+        self.set.discard(self.c)
+        self.set.discard(self.c)
+        self.assertEqual(1, len(self.set))
+        self.d.send(b'x')
+        self.assertEqual([], self.set.select(0))
+
+    def test_pending_data_is_readable(self):
+        buffered = BufferedSocket(self.a)
+        self.set.set(buffered, True, False, 'a')
+        self.set.set(self.c, True, True, 'c')
+        self.assertEqual([('a', True, False)], self.set.select(0))
+
+
+@unittest.skipIf(_poll.selectors is None, 'selectors is not available')
+class SelectorSocketSetTest(SocketSetTestMixin, unittest.TestCase):
+    set_class = _poll._SelectorSocketSet
+
+
+class SelectSocketSetTest(SocketSetTestMixin, unittest.TestCase):
+    set_class = _poll._SelectSocketSet
@@ -0,0 +1,289 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import threading
+import unittest
+
+from httpplus import pool
+
+# relative import to ease embedding the library
+from . import util
+
+
+class HTTPConnectionPoolTest(util.HttpTestBase, unittest.TestCase):
+    pool_class = pool.HTTPConnectionPool
+
+    def setUp(self):
+        super(HTTPConnectionPoolTest, self).setUp()
+        self.orig_now = pool._now
+        self.now = 1000.0
+        pool._now = lambda: self.now
+
+    def tearDown(self):
+        pool._now = self.orig_now
+        super(HTTPConnectionPoolTest, self).tearDown()
+
+    def doGet(self, con, body=b'hi', close=False):
+        con._connect({})
+        con.sock.sent = b''
+        con.sock.data = [b'HTTP/1.1 200 OK\r\n',
+                         b'Content-Length: %d\r\n' % len(body)]
+        if close:
+            con.sock.data.append(b'Connection: close\r\n')
+        con.sock.data.extend([b'\r\n', body])
+        con.request('GET', '/')
+        return con.getresponse()
+
+    def test_reuse(self):
+        p = self.pool_class()
+        with p.connection('1.2.3.4:80') as con:
+            self.assertEqual(b'hi', self.doGet(con).read())
+        # An equivalent spelling of the same server gets the same
+        # connection back.
+        with p.connection('1.2.3.4', 80, use_ssl=False) as con2:
+            self.assertTrue(con2 is con)
+            self.assertEqual(b'hi', self.doGet(con2).read())
+        self.assertEqual((1, 1), (p.hits, p.misses))
+        self.assertEqual(1, p.idle())
+        self.assertEqual(1, len(p))
+
+    def test_servers_are_separate(self):
+        p = self.pool_class()
+        con = p.get('1.2.3.4:80')
+        self.doGet(con).read()
+        p.put(con)
+        other = p.get('1.2.3.4:8080')
+        self.assertFalse(other is con)
+        ssl = p.get('1.2.3.4', 80, use_ssl=True)
+        self.assertFalse(ssl is con)
+        proxied = p.get('1.2.3.4:80', proxy_hostport=('5.6.7.8', 3128))
+        self.assertFalse(proxied is con)
+        self.assertEqual((0, 4), (p.hits, p.misses))
+
+    def test_unread_response_is_not_reused(self):
+        p = self.pool_class()
+        con = p.get('1.2.3.4:80')
+        self.doGet(con, body=b'x' * 100)
+        sock = con.sock
+        p.put(con)
+        self.assertTrue(sock.closed)
+        self.assertEqual(0, p.idle())
+        self.assertEqual(0, len(p))
+        self.assertFalse(p.get('1.2.3.4:80') is con)
+
+    def test_closed_connection_is_not_reused(self):
+        p = self.pool_class()
+        con = p.get('1.2.3.4:80')
+        self.doGet(con, close=True).read()
+        p.put(con)
+        self.assertEqual(0, p.idle())
+        self.assertEqual(0, len(p))
+
+    def test_exception_discards(self):
+        p = self.pool_class()
+        def fail():
+            with p.connection('1.2.3.4:80') as con:
+                con._connect({})
+                raise ValueError()
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(0, len(p))
+
+    def test_per_host_limit(self):
+        p = self.pool_class(maxperhost=2)
+        p.get('1.2.3.4:80')
+        con = p.get('1.2.3.4:80')
+        self.assertRaises(pool.PoolExhaustedError, p.get, '1.2.3.4:80')
+        # Other servers aren't affected.
+        p.get('1.2.3.5:80')
+        p.discard(con)
+        p.get('1.2.3.4:80')
+
+    def test_total_limit_evicts_oldest_idle(self):
+        p = self.pool_class(maxtotal=2)
+        a = p.get('1.2.3.4:80')
+        b = p.get('1.2.3.5:80')
+        self.assertRaises(pool.PoolExhaustedError, p.get, '1.2.3.6:80')
+        for con in (a, b):
+            self.doGet(con).read()
+            p.put(con)
+        asock = a.sock
+        p.get('1.2.3.6:80')
+        self.assertTrue(asock.closed)
+        self.assertEqual(1, p.evictions)
+        self.assertTrue(p.get('1.2.3.5:80') is b)
+
+    def test_idle_timeout(self):
+        p = self.pool_class(idle_timeout=30)
+        con = p.get('1.2.3.4:80')
+        self.doGet(con).read()
+        p.put(con)
+        self.now += 29
+        self.assertTrue(p.get('1.2.3.4:80') is con)
+        p.put(con)
+        sock = con.sock
+        self.now += 31
+        self.assertFalse(p.get('1.2.3.4:80') is con)
+        self.assertTrue(sock.closed)
+        self.assertEqual(1, p.evictions)
+        self.assertEqual(1, len(p))
+
+    def test_most_recent_first(self):
+        p = self.pool_class()
+        a = p.get('1.2.3.4:80')
+        b = p.get('1.2.3.4:80')
+        for con in (a, b):
+            self.doGet(con).read()
+            p.put(con)
+        self.assertTrue(p.get('1.2.3.4:80') is b)
+
+    def test_close(self):
+        p = self.pool_class()
+        con = p.get('1.2.3.4:80')
+        self.doGet(con).read()
+        sock = con.sock
+        p.put(con)
+        inuse = p.get('1.2.3.5:80')
+        p.close()
+        self.assertTrue(sock.closed)
+        self.assertEqual(1, len(p))
+        p.discard(inuse)
+        self.assertEqual(0, len(p))
+
+
+class FakeConnection(object):
+    def __init__(self, host, port, use_ssl, proxy_hostport): # pylint: disable=W0613
+        self.sock = object()
+        self.users = 0
+
+    def busy(self): # pylint: disable=no-self-use
+        return False
+
+    def close(self):
+        self.sock = None
+
+
+class SharedHTTPConnectionPoolTest(HTTPConnectionPoolTest):
+    pool_class = pool.SharedHTTPConnectionPool
+
+    def test_reuse_takes_no_lock(self):
+        p = self.pool_class()
+        con = p.get('1.2.3.4:80')
+        self.doGet(con).read()
+        p.put(con)
+
+        class NoLock(object):
+            def __enter__(self):
+                raise AssertionError('lock taken')
+            def __exit__(self, *args):
+                pass
+        p._lock = NoLock()
+        self.assertTrue(p.get('1.2.3.4:80') is con)
+        p.put(con)
+        self.assertEqual(1, p.hits)
+
+    def test_steal_from_other_thread(self):
+        p = self.pool_class()
+        got = []
+        def other():
+            con = p.get('1.2.3.4:80')
+            self.doGet(con).read()
+            p.put(con)
+            got.append(con)
+        t = threading.Thread(target=other)
+        t.start()
+        t.join()
+        self.assertEqual(1, p.idle())
+        self.assertTrue(p.get('1.2.3.4:80') is got[0])
+        self.assertEqual((1, 1), (p.hits, p.misses))
+        self.assertEqual(0, p.idle())
+
+    def test_close_closes_other_threads_connections(self):
+        p = self.pool_class()
+        def other():
+            con = p.get('1.2.3.4:80')
+            self.doGet(con).read()
+            p.put(con)
+        t = threading.Thread(target=other)
+        t.start()
+        t.join()
+        p.close()
+        self.assertEqual(0, p.idle())
+        self.assertEqual(0, len(p))
+
+    def test_exited_threads_are_forgotten(self):
+        p = self.pool_class()
+        p.connection_class = FakeConnection
+        cons = []
+        def worker():
+            con = p.get('1.2.3.4:80')
+            cons.append(con)
+            p.put(con)
+        for _ in range(50):
+            t = threading.Thread(target=worker)
+            t.start()
+            t.join()
+        # Each thread adopted the connection the one before it left
+        # idle, and reused it.
+        self.assertEqual((49, 1), (p.hits, p.misses))
+        self.assertEqual(1, len(set(cons)))
+        self.assertEqual(2, len(p._threads))
+        self.assertTrue(p.get('1.2.3.4:80') is cons[0])
+        self.assertEqual(50, p.hits)
+        self.assertEqual([p._orphans, p._mine()], p._threads)
+
+    def test_many_threads(self):
+        p = self.pool_class(maxperhost=4)
+        p.connection_class = FakeConnection
+        errors = []
+        def worker():
+            try:
+                for _ in range(500):
+                    try:
+                        con = p.get('1.2.3.4:80')
+                    except pool.PoolExhaustedError:
+                        continue
+                    con.users += 1
+                    if con.users != 1:
+                        errors.append('connection shared between threads')
+                    con.users -= 1
+                    p.put(con)
+            except Exception as e: # pylint: disable=broad-except
+                errors.append(e)
+        threads = [threading.Thread(target=worker) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+        self.assertTrue(len(p) <= 4)
+        self.assertEqual(len(p), p.idle())
+        self.assertEqual(len(p), p.misses)
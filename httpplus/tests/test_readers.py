@@ -78,3 +78,83 @@ class ChunkedReaderTest(unittest.TestCase):
             if d:
                 rdr._load(d)
         self.assertEqual(corpus, rdr.read(len(corpus)+100))
+
+    def test_extensions_and_trailers(self):
+        data = (b'3;name=value\r\nfoo\r\n'
+                b'3 ; other="x;y"\r\nbar\r\n'
+                b'0;last\r\n'
+                b'Expires: never\r\n'
+                b'X-Checksum: abc\r\n'
+                b'\r\n')
+        for step in xrange(1, len(data)):
+            rdr = _readers.ChunkedReader(b'\r\n')
+            for start in xrange(0, len(data), step):
+                self.assertFalse(rdr.done())
+                rdr._load(data[start:start+step])
+            self.assertTrue(rdr.done())
+            self.assertEqual(b'foobar', rdr.read(100))
+            self.assertEqual([b'Expires: never', b'X-Checksum: abc'],
+                             rdr.trailer_lines)
+
+    def test_large_chunk_is_not_copied(self):
+        body = b'x' * 100000
+        wire = chunkedblock(body)
+        rdr = _readers.ChunkedReader(b'\r\n')
+        pieces = [wire[start:start + 1000]
+                  for start in xrange(0, len(wire), 1000)]
+        for p in pieces:
+            rdr._load(p)
+        rdr._load(chunkedblock(b''))
+        # Every piece after the size line is queued in place.
+        self.assertTrue(rdr._buffer._chunks[1][0] is pieces[1])
+        self.assertEqual(body, rdr.read(len(body)))
+
+    def test_overlong_size_line(self):
+        rdr = _readers.ChunkedReader(b'\r\n')
+        rdr._load(b'1' * 1000)
+        self.assertRaises(_readers.httplib.LineTooLong,
+                          rdr._load, b'1' * _readers.MAX_CHUNK_LINE)
+
+
+    def test_excess_is_kept(self):
+        rdr = _readers.ChunkedReader(b'\r\n')
+        rdr._load(b'3\r\nabc\r\n0\r\n\r\nHTTP/1.1 2')
+        rdr._load(b'00 OK\r\n')
+        self.assertTrue(rdr.done())
+        self.assertEqual(b'abc', rdr.read(3))
+        self.assertEqual(b'HTTP/1.1 200 OK\r\n', rdr._takeexcess())
+        self.assertEqual(b'', rdr._takeexcess())
+
+
+class ContentLengthReaderTest(unittest.TestCase):
+    def test_excess_is_kept(self):
+        for preallocate in (False, True):
+            rdr = _readers.ContentLengthReader(4, preallocate=preallocate)
+            rdr._load(b'ab')
+            rdr._load(b'cdHTTP')
+            rdr._load(b'/1.1')
+            self.assertTrue(rdr.done())
+            self.assertEqual(b'abcd', bytes(rdr.read(10)))
+            self.assertEqual(b'HTTP/1.1', rdr._takeexcess())
+
+    def test_preallocated(self):
+        rdr = _readers.ContentLengthReader(10, preallocate=True)
+        rdr._load(b'0123')
+        view = rdr._loadbuffer()
+        self.assertEqual(6, len(view))
+        view[:3] = b'456'
+        rdr._bufferloaded(3)
+        self.assertEqual(b'01', rdr.read(2))
+        self.assertFalse(rdr.done())
+        rdr._load(b'789xx')
+        self.assertTrue(rdr.done())
+        self.assertEqual(None, rdr._loadbuffer())
+        self.assertEqual(b'23456789', rdr.read(100))
+
+    def test_preallocated_whole_body_is_not_copied(self):
+        rdr = _readers.ContentLengthReader(6, preallocate=True)
+        rdr._load(b'abc')
+        rdr._load(b'def')
+        body = rdr.read(6)
+        self.assertEqual(bytearray(b'abcdef'), body)
+        self.assertTrue(body is rdr._body)
@@ -0,0 +1,289 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import os
+import socket
+import ssl
+import threading
+import unittest
+
+from wsgiref import simple_server
+
+import httpplus
+from httpplus import _tls
+from httpplus import multiplex
+
+# relative import to ease embedding the library
+from . import util
+
+
+class ContextCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.orig_contexts = dict(_tls._contexts)
+        _tls._contexts.clear()
+
+    def tearDown(self):
+        _tls._contexts.clear()
+        _tls._contexts.update(self.orig_contexts)
+
+    def test_shared_per_options(self):
+        a = _tls.context()
+        self.assertTrue(a is _tls.context())
+        b = _tls.context(cert_reqs=ssl.CERT_REQUIRED)
+        self.assertFalse(a is b)
+        self.assertTrue(b is _tls.context(cert_reqs=ssl.CERT_REQUIRED))
+        self.assertEqual(2, len(_tls._contexts))
+
+    def test_configured_like_wrap_socket(self):
+        ctx = _tls.context()
+        self.assertEqual(ssl.CERT_NONE, ctx.verify_mode)
+        self.assertFalse(ctx.check_hostname)
+        ctx = _tls.context(cert_reqs=ssl.CERT_REQUIRED)
+        self.assertEqual(ssl.CERT_REQUIRED, ctx.verify_mode)
+        self.assertFalse(ctx.check_hostname)
+
+    def test_unhashable_options_not_cached(self):
+        orig = _tls._newcontext
+        _tls._newcontext = lambda **opts: opts
+        try:
+            self.assertEqual({'ciphers': ['x']}, _tls.context(ciphers=['x']))
+        finally:
+            _tls._newcontext = orig
+        self.assertEqual({}, _tls._contexts)
+
+    def test_wrap_socket_uses_shared_context(self):
+        # Python 2's socketpair() makes _socket.sockets, which ssl
+        # can't wrap, so connect a real pair.
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        a = socket.create_connection(listener.getsockname())
+        b = listener.accept()[0]
+        listener.close()
+        try:
+            wrapped = _tls.wrap_socket(a, server_hostname=b'example.com',
+                                       do_handshake_on_connect=False)
+            self.assertTrue(wrapped.context is _tls.context())
+            self.assertEqual('example.com', wrapped.server_hostname)
+            wrapped.close()
+        finally:
+            a.close()
+            b.close()
+
+
+class RecordingContext(object):
+    def __init__(self):
+        self.wrapped = []
+
+    def wrap_socket(self, sock, server_hostname=None, session=None):
+        self.wrapped.append((server_hostname, session))
+        return util.MockSSLSocket(sock)
+
+
+class ConnectionContextTest(util.HttpTestBase, unittest.TestCase):
+    def test_default_wraps_with_shared_context(self):
+        wraps = []
+        def wrap(sock, server_hostname=None, **ssl_opts):
+            wraps.append((server_hostname, ssl_opts))
+            return util.MockSSLSocket(sock)
+        _tls.wrap_socket = wrap
+        for _ in range(2):
+            con = httpplus.HTTPConnection('1.2.3.4:443',
+                                          cert_reqs=ssl.CERT_REQUIRED)
+            con._connect({})
+        self.assertEqual([(b'1.2.3.4', {'cert_reqs': ssl.CERT_REQUIRED})] * 2,
+                         wraps)
+
+    def test_ssl_context(self):
+        _tls.wrap_socket = self.orig_tlswrap
+        ctx = RecordingContext()
+        con = httpplus.HTTPConnection('1.2.3.4:443', ssl_context=ctx)
+        con._connect({})
+        self.assertEqual([('1.2.3.4', None)], ctx.wrapped)
+        self.assertTrue(isinstance(con.sock, util.MockSSLSocket))
+
+
+CERTFILE = os.path.join(os.path.dirname(__file__), 'localhost.pem')
+
+_TLSV1_2 = getattr(getattr(ssl, 'TLSVersion', None), 'TLSv1_2', None)
+
+
+def _application(unused_environ, start_response):
+    start_response('200 OK', [('Content-Length', '2')])
+    return [b'ok']
+
+
+class FakeSession(object):
+    def __init__(self, has_ticket=True):
+        self.has_ticket = has_ticket
+
+
+class FakeSSLSocket(object):
+    def __init__(self, session, reused=False, version='TLSv1.3'):
+        self.session = session
+        self.session_reused = reused
+        self._version = version
+
+    def version(self):
+        return self._version
+
+
+class SessionCacheTest(unittest.TestCase):
+    def test_counts_and_saves(self):
+        cache = _tls.SessionCache()
+        first = FakeSession()
+        cache.handshaken(FakeSSLSocket(first), 'k')
+        self.assertTrue(cache.get('k') is first)
+        cache.handshaken(FakeSSLSocket(FakeSession(), reused=True), 'k')
+        self.assertEqual((1, 1), (cache.full, cache.resumed))
+        cache.clear()
+        self.assertEqual((0, 0, None),
+                         (cache.full, cache.resumed, cache.get('k')))
+
+    def test_tls13_session_saved_once_ticket_arrives(self):
+        cache = _tls.SessionCache()
+        sock = FakeSSLSocket(FakeSession(has_ticket=False))
+        cache.handshaken(sock, 'k')
+        self.assertEqual(None, cache.get('k'))
+        sock.session = FakeSession()
+        cache.save(sock)
+        self.assertTrue(cache.get('k') is sock.session)
+        # Later sessions from the same socket are left alone.
+        cache.save(FakeSSLSocket(FakeSession()))
+        saved = sock.session
+        sock.session = FakeSession()
+        cache.save(sock)
+        self.assertTrue(cache.get('k') is saved)
+
+    def test_tls12_session_without_ticket_saved(self):
+        cache = _tls.SessionCache()
+        sock = FakeSSLSocket(FakeSession(has_ticket=False),
+                             version='TLSv1.2')
+        cache.handshaken(sock, 'k')
+        self.assertTrue(cache.get('k') is sock.session)
+
+    def test_oldest_evicted(self):
+        cache = _tls.SessionCache(maxsize=2)
+        for key in 'abc':
+            cache.handshaken(FakeSSLSocket(FakeSession()), key)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(None, cache.get('a'))
+
+
+@unittest.skipIf(getattr(ssl, 'SSLSession', None) is None,
+                 'TLS sessions need Python 3.6 or later')
+class SessionResumptionTest(unittest.TestCase):
+    max_version = None
+
+    @classmethod
+    def setUpClass(cls):
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(CERTFILE)
+        if cls.max_version is not None:
+            ctx.maximum_version = cls.max_version
+        cls._server = simple_server.make_server('localhost', 0, _application)
+        cls._server.socket = ctx.wrap_socket(cls._server.socket,
+                                             server_side=True)
+        cls._port = cls._server.socket.getsockname()[1]
+        t = threading.Thread(target=cls._server.serve_forever)
+        t.daemon = True
+        t.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.shutdown()
+        cls._server.server_close()
+
+    def setUp(self):
+        _tls.sessions.clear()
+
+    def tearDown(self):
+        _tls.sessions.clear()
+
+    def fetch(self, con):
+        con.request('GET', '/')
+        self.assertEqual(b'ok', con.getresponse().read())
+
+    def test_reconnect_resumes(self):
+        # The server closes the connection after every response, so
+        # each request is a reconnect.
+        con = httpplus.HTTPConnection('localhost', self._port, use_ssl=True)
+        for _ in range(3):
+            self.fetch(con)
+        self.assertEqual(1, httpplus.tls_sessions.full)
+        self.assertEqual(2, httpplus.tls_sessions.resumed)
+
+    def test_new_connection_resumes(self):
+        for _ in range(2):
+            con = httpplus.HTTPConnection('localhost', self._port,
+                                          use_ssl=True)
+            self.fetch(con)
+            con.close()
+        self.assertEqual((1, 1), (_tls.sessions.full, _tls.sessions.resumed))
+
+    def test_not_resumed_with_other_options(self):
+        self.fetch(httpplus.HTTPConnection('localhost', self._port,
+                                           use_ssl=True))
+        con = httpplus.HTTPConnection('localhost', self._port, use_ssl=True,
+                                      cert_reqs=ssl.CERT_REQUIRED,
+                                      ca_certs=CERTFILE)
+        self.fetch(con)
+        self.fetch(con)
+        self.assertEqual((2, 1), (_tls.sessions.full, _tls.sessions.resumed))
+
+    def test_ssl_context_resumes(self):
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        ctx.load_verify_locations(CERTFILE)
+        con = httpplus.HTTPConnection('localhost', self._port, use_ssl=True,
+                                      ssl_context=ctx)
+        self.fetch(con)
+        self.fetch(con)
+        self.assertEqual((1, 1), (_tls.sessions.full, _tls.sessions.resumed))
+
+    def test_multiplexer_handshakes(self):
+        mux = multiplex.Multiplexer()
+        transfers = [
+            mux.request(httpplus.HTTPConnection('localhost', self._port,
+                                                use_ssl=True), 'GET', '/')
+            for _ in range(2)]
+        mux.run()
+        self.assertEqual([b'ok', b'ok'], [t.body for t in transfers])
+        self.assertEqual(2, _tls.sessions.full + _tls.sessions.resumed)
+
+
+@unittest.skipIf(_TLSV1_2 is None, 'ssl.TLSVersion needs Python 3.7 or later')
+class TLS12SessionResumptionTest(SessionResumptionTest):
+    max_version = _TLSV1_2
+
+
+if __name__ == '__main__':
+    unittest.main()
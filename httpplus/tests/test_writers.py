@@ -0,0 +1,272 @@
+# Copyright 2010, Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# pylint: disable=protected-access,missing-docstring,too-few-public-methods,invalid-name,too-many-public-methods
+from __future__ import absolute_import
+
+import io
+import os
+import socket
+import sys
+import tempfile
+import unittest
+
+from httpplus import _writers
+
+
+class RecordingSocket(object):
+    """Socket that accepts at most limit bytes per call."""
+    def __init__(self, limit=1 << 30, vectored=True):
+        self.limit = limit
+        self.calls = []
+        self.sent = b''
+        if vectored:
+            self.sendmsg = self._sendmsg
+
+    def send(self, data):
+        data = memoryview(data).tobytes()[:self.limit]
+        self.calls.append(('send', 1))
+        self.sent += data
+        return len(data)
+
+    def _sendmsg(self, buffers, ancdata=(), flags=0): # pylint: disable=W0613
+        data = b''.join(memoryview(b).tobytes() for b in buffers)
+        data = data[:self.limit]
+        self.calls.append(('sendmsg', len(buffers)))
+        self.sent += data
+        return len(data)
+
+
+def tempfile_with(data):
+    f = tempfile.TemporaryFile()
+    f.write(data)
+    f.seek(0)
+    return f
+
+
+def drain(writer, sock, headers_only=False):
+    while not writer.done():
+        if not writer.write(sock, headers_only=headers_only):
+            break
+
+
+class RequestWriterTest(unittest.TestCase):
+    def test_headers_and_body_in_one_call(self):
+        sock = RecordingSocket()
+        w = _writers.RequestWriter(b'HEADERS\r\n\r\n', b'body', False, 32)
+        self.assertEqual(15, w.write(sock))
+        self.assertTrue(w.done())
+        self.assertEqual([('sendmsg', 2)], sock.calls)
+        self.assertEqual(b'HEADERS\r\n\r\nbody', sock.sent)
+
+    def test_partial_writes(self):
+        sock = RecordingSocket(limit=3)
+        body = b'0123456789'
+        w = _writers.RequestWriter(b'HDR\r\n', body, False, 32)
+        drain(w, sock)
+        self.assertEqual(b'HDR\r\n' + body, sock.sent)
+        self.assertTrue(w.done())
+
+    def test_headers_only(self):
+        sock = RecordingSocket(limit=2)
+        w = _writers.RequestWriter(b'HDR\r\n', b'body', False, 32)
+        drain(w, sock, headers_only=True)
+        self.assertTrue(w.headerssent())
+        self.assertFalse(w.done())
+        self.assertEqual(b'HDR\r\n', sock.sent)
+        drain(w, sock)
+        self.assertEqual(b'HDR\r\nbody', sock.sent)
+
+    def test_chunked_file_body(self):
+        sock = RecordingSocket()
+        w = _writers.RequestWriter(b'HDR\r\n', io.BytesIO(b'x' * 20), True, 8)
+        drain(w, sock)
+        self.assertEqual(b'HDR\r\n'
+                         b'8\r\nxxxxxxxx\r\n'
+                         b'8\r\nxxxxxxxx\r\n'
+                         b'4\r\nxxxx\r\n'
+                         b'0\r\n\r\n', sock.sent)
+        self.assertEqual('sendmsg', sock.calls[0][0])
+
+    def test_exact_multiple_file_body(self):
+        sock = RecordingSocket()
+        w = _writers.RequestWriter(b'', io.BytesIO(b'x' * 16), True, 8)
+        drain(w, sock)
+        self.assertEqual(b'8\r\nxxxxxxxx\r\n8\r\nxxxxxxxx\r\n0\r\n\r\n',
+                         sock.sent)
+
+    def test_coalesce_without_sendmsg(self):
+        sock = RecordingSocket(vectored=False)
+        w = _writers.RequestWriter(b'HDR\r\n', io.BytesIO(b'x' * 20), True, 8)
+        drain(w, sock)
+        self.assertEqual(b'HDR\r\n'
+                         b'8\r\nxxxxxxxx\r\n'
+                         b'8\r\nxxxxxxxx\r\n'
+                         b'4\r\nxxxx\r\n'
+                         b'0\r\n\r\n', sock.sent)
+        # Small segments are copied together rather than each getting
+        # their own send().
+        self.assertTrue(len(sock.calls) < 12)
+
+    def test_write_size_adapts(self):
+        sock = RecordingSocket(limit=5000)
+        body = b'x' * 100000
+        w = _writers.RequestWriter(b'', body, False, 8192)
+        w.write(sock)
+        # The socket only took 5000 bytes, so that's all we offer next.
+        self.assertEqual(5000, w._writesize)
+        sock.limit = 10
+        w.write(sock)
+        self.assertEqual(_writers._MIN_WRITE_SIZE, w._writesize)
+        sock.limit = 1 << 30
+        w.write(sock)
+        self.assertEqual(2 * _writers._MIN_WRITE_SIZE, w._writesize)
+        drain(w, sock)
+        self.assertEqual(body, sock.sent)
+        # Never beyond the blocksize, since this socket has no send
+        # buffer to measure.
+        self.assertEqual(8192, w._writesize)
+
+    @unittest.skipIf(sys.version_info < (3, 0),
+                     "Python 2's memoryview has no obj attribute")
+    def test_body_is_not_copied_after_partial_write(self):
+        sock = RecordingSocket(limit=10, vectored=False)
+        body = bytearray(b'y' * 100)
+        w = _writers.RequestWriter(b'', body, False, 64)
+        w.write(sock)
+        self.assertTrue(w._segments[0].obj is body)
+
+    def test_send_buffer_raises_ceiling(self):
+        a, b = socket.socketpair()
+        try:
+            a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 18)
+            w = _writers.RequestWriter(b'', b'x' * 100, False, 4096)
+            w.write(a)
+            self.assertEqual(b'x' * 100, b.recv(200))
+            self.assertTrue(w._maxwritesize >= 1 << 18)
+        finally:
+            a.close()
+            b.close()
+
+    def test_iterable_body(self):
+        sock = RecordingSocket()
+        body = (b for b in [b'ab', b'', memoryview(b'cde'), bytearray(b'f')])
+        w = _writers.RequestWriter(b'HDR\r\n', body, True, 32)
+        drain(w, sock)
+        self.assertEqual(b'HDR\r\n'
+                         b'2\r\nab\r\n'
+                         b'3\r\ncde\r\n'
+                         b'1\r\nf\r\n'
+                         b'0\r\n\r\n', sock.sent)
+        self.assertTrue(w.done())
+
+    def test_iterable_body_with_known_length(self):
+        sock = RecordingSocket()
+        w = _writers.RequestWriter(b'', [b'ab', b'cd'], False, 32)
+        drain(w, sock)
+        self.assertEqual(b'abcd', sock.sent)
+
+    def test_iterable_body_is_pulled_lazily(self):
+        pulled = []
+        def gen():
+            for i in range(100):
+                pulled.append(i)
+                yield b'x' * 1000
+        sock = RecordingSocket(limit=4096)
+        w = _writers.RequestWriter(b'', gen(), True, 4096)
+        w.write(sock)
+        # Only about one write's worth has been generated so far.
+        self.assertTrue(len(pulled) <= 6, pulled)
+        drain(w, sock)
+        self.assertEqual(100, len(pulled))
+        self.assertTrue(sock.sent.endswith(b'x\r\n0\r\n\r\n'))
+
+    def test_isiterable(self):
+        self.assertTrue(_writers.isiterable(iter([b'a'])))
+        self.assertTrue(_writers.isiterable([b'a']))
+        self.assertTrue(_writers.isiterable((b'a',)))
+        self.assertFalse(_writers.isiterable(b'abc'))
+        self.assertFalse(_writers.isiterable(memoryview(b'abc')))
+        self.assertFalse(_writers.isiterable(io.BytesIO(b'abc')))
+
+    def test_filerange(self):
+        self.assertEqual(None, _writers.filerange(io.BytesIO(b'abc')))
+        self.assertEqual(None, _writers.filerange(b'abc'))
+        with tempfile_with(b'x' * 100) as f:
+            f.seek(30)
+            fd, offset, length = _writers.filerange(f)
+            self.assertEqual(f.fileno(), fd)
+            self.assertEqual(30, offset)
+            self.assertEqual(70, length)
+
+    @unittest.skipIf(sys.version_info < (3, 0),
+                     "Python 2's mmaps can't be viewed with a memoryview")
+    def test_file_body_is_mapped(self):
+        sock = RecordingSocket()
+        data = bytes(bytearray(range(256))) * 100
+        with tempfile_with(data) as f:
+            f.seek(1000)
+            w = _writers.RequestWriter(b'HDR\r\n', f, False, 4096)
+            self.assertTrue(w._file is f)
+            w.write(sock)
+            # No socket fd to sendfile() to, so the file was mapped and
+            # went out in the same sendmsg() as the headers.
+            self.assertEqual([('sendmsg', 2)], sock.calls)
+            self.assertTrue(w._source is None)
+            drain(w, sock)
+            self.assertEqual(b'HDR\r\n' + data[1000:], sock.sent)
+            self.assertEqual(len(data), f.tell())
+
+    def test_chunked_file_body_is_read(self):
+        with tempfile_with(b'x' * 20) as f:
+            w = _writers.RequestWriter(b'', f, True, 8)
+            self.assertTrue(w._source is f)
+            self.assertTrue(w._file is None)
+
+    @unittest.skipIf(getattr(os, 'sendfile', None) is None,
+                     'os.sendfile() is not available')
+    def test_file_body_uses_sendfile(self):
+        data = b'z' * 50000
+        a, b = socket.socketpair()
+        try:
+            with tempfile_with(data) as f:
+                w = _writers.RequestWriter(b'HDR\r\n', f, False, 4096)
+                got = b''
+                while not w.done():
+                    w.write(a)
+                    # Nothing of the file should be queued in memory.
+                    self.assertEqual(0, w._queued)
+                    got += b.recv(1 << 16)
+                while len(got) < len(data) + 5:
+                    got += b.recv(1 << 16)
+                self.assertEqual(b'HDR\r\n' + data, got)
+                self.assertEqual(len(data), f.tell())
+        finally:
+            a.close()
+            b.close()
@@ -31,6 +31,7 @@
 from __future__ import absolute_import, print_function
 
 import difflib
+import errno
 import socket
 import ssl
 
@@ -51,6 +52,11 @@ class MockSocket(object):
                           beginning the response.
       close_on_empty: If true, close the socket when it runs out of data
                       for the client.
+      connect_hangs: If true, a connection attempt never completes.
+      connect_error: errno with which a connection attempt fails, or 0.
+      per_request: If true, each string in data is a whole response,
+                   which is only available once as many requests have
+                   been sent (counting read_wait_sentinel).
     """
     def __init__(self, af, socktype, proto):
         self.af = af
@@ -64,6 +70,10 @@ class MockSocket(object):
         self.sent = b''
         self.read_wait_sentinel = httpplus._END_HEADERS
         self.blocking = True
+        self.per_request = False
+        self.responded = 0
+        self.connect_hangs = False
+        self.connect_error = 0
 
     def close(self):
         self.closed = True
@@ -71,12 +81,32 @@ class MockSocket(object):
     def connect(self, sa):
         self.sa = sa
 
+    def connect_ex(self, sa):
+        assert not self.blocking
+        self.sa = sa
+        return errno.EINPROGRESS
+
+    def getsockopt(self, level, option):
+        if (level, option) != (socket.SOL_SOCKET, socket.SO_ERROR):
+            raise socket.error(errno.ENOPROTOOPT, 'not mocked')
+        return self.connect_error
+
+    @property
+    def ready_for_write(self):
+        return not self.connect_hangs
+
     def setblocking(self, timeout):
         self.blocking = bool(timeout)
 
-    def recv(self, amt=-1):
+    def recv(self, amt=-1, flags=0):
         # we only properly emulate non-blocking sockets
         assert not self.blocking
+        if not self.ready_for_read:
+            raise socket.error(errno.EAGAIN, 'would block')
+        if flags & socket.MSG_PEEK:
+            if self.early_data:
+                return self.early_data[0][:amt]
+            return self.data and self.data[0][:amt] or b''
         if self.early_data:
             datalist = self.early_data
         elif not self.data:
@@ -88,14 +118,23 @@ class MockSocket(object):
         data = datalist.pop(0)
         if len(data) > amt:
             datalist.insert(0, data[amt:])
+        elif datalist is self.data:
+            self.responded += 1
         if not self.data and not self.early_data and self.close_on_empty:
             self.remote_closed = True
         return data[:amt]
 
+    def recv_into(self, buf, amt=0):
+        data = self.recv(amt or len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
     @property
     def ready_for_read(self):
         return ((self.early_data and httpplus._END_HEADERS in self.sent)
-                or (self.read_wait_sentinel in self.sent and self.data)
+                or (self.read_wait_sentinel in self.sent and self.data
+                    and (not self.per_request or self.responded
+                         < self.sent.count(self.read_wait_sentinel)))
                 or self.closed or self.remote_closed)
 
     def send(self, data):
@@ -106,30 +145,87 @@ class MockSocket(object):
                                         ' socket closed by the server')
         if len(data) > 8192:
             data = data[:8192]
+        if isinstance(data, memoryview):
+            # Python 2's str can't be concatenated with one.
+            data = data.tobytes()
         self.sent += data
         return len(data)
 
+    def sendall(self, data):
+        data = memoryview(data)
+        while data:
+            data = data[self.send(data):]
 
-def mockselect(r, w, x, timeout=0): # pylint: disable=W0613
-    """Simple mock for select()
+
+class MockPoller(object):
+    """Simple mock for _poll.Poller.
+
+    Mock sockets are always writable, and readable when their
+    ready_for_read property says so.
     """
-    readable = [s for s in r if s.ready_for_read]
-    return readable, w[:], []
+    def __init__(self, sock):
+        self.sock = sock
+        self.closed = False
+
+    def wait(self, read, write, timeout): # pylint: disable=W0613
+        assert not self.closed, 'attempted to wait on a closed poller'
+        return bool(read and self.sock.ready_for_read), bool(write)
+
+    def close(self):
+        self.closed = True
+
+
+class MockSocketSet(object):
+    """Simple mock for _poll.SocketSet, which behaves like MockPoller."""
+    def __init__(self):
+        self.socks = {}
+        self.closed = False
+
+    def __len__(self):
+        return len(self.socks)
+
+    def set(self, sock, read, write, data):
+        assert not self.closed, 'attempted to use a closed socket set'
+        self.socks[sock] = (read, write, data)
+
+    def discard(self, sock):
+        self.socks.pop(sock, None)
+
+    def select(self, timeout): # pylint: disable=W0613
+        assert not self.closed, 'attempted to wait on a closed socket set'
+        ready = []
+        for sock, (read, write, data) in self.socks.items():
+            read = bool(read and sock.ready_for_read)
+            write = bool(write and sock.ready_for_write)
+            if read or write:
+                ready.append((data, read, write))
+        return ready
+
+    def close(self):
+        self.closed = True
 
 
 class MockSSLSocket(object): # pylint: disable=too-few-public-methods
     def __init__(self, sock):
         self._sock = sock
         self._fail_recv = True
+        self.handshakes = 0
 
     def __getattr__(self, key):
         return getattr(self._sock, key)
 
     def __setattr__(self, key, value):
-        if key not in ('_sock', '_fail_recv'):
+        if key not in ('_sock', '_fail_recv', 'handshakes'):
             return setattr(self._sock, key, value)
         return object.__setattr__(self, key, value)
 
+    def do_handshake(self):
+        # The first try has to wait for the socket, as it would
+        # with a real non-blocking socket.
+        self.handshakes += 1
+        if self.handshakes == 1:
+            raise ssl.SSLError(ssl.SSL_ERROR_WANT_WRITE)
+
     def recv(self, amt=-1):
         try:
             if self._fail_recv:
@@ -138,6 +234,14 @@ class MockSSLSocket(object): # pylint: disable=too-few-public-methods
         finally:
             self._fail_recv = not self._fail_recv
 
+    def recv_into(self, buf, amt=0):
+        try:
+            if self._fail_recv:
+                raise ssl.SSLError(ssl.SSL_ERROR_WANT_READ)
+            return self._sock.recv_into(buf, amt)
+        finally:
+            self._fail_recv = not self._fail_recv
+
 
 # Mock sslwrap doesn't need to use these args, silence lint
 #
@@ -173,17 +277,49 @@ class HttpTestBase(object):
         self.orig_getaddrinfo = socket.getaddrinfo
         socket.getaddrinfo = mockgetaddrinfo
 
-        self.orig_select = httpplus.select.select
-        httpplus.select.select = mockselect
+        self.orig_poller = httpplus._poll.Poller
+        httpplus._poll.Poller = MockPoller
+
+        self.orig_socketset = httpplus._poll.SocketSet
+        httpplus._poll.SocketSet = MockSocketSet
 
         self.orig_sslwrap = ssl.wrap_socket
         ssl.wrap_socket = mocksslwrap
+        self.orig_tlswrap = httpplus._tls.wrap_socket
+        httpplus._tls.wrap_socket = mocksslwrap
+
+        # Lookups mustn't leak from one test into another.
+        httpplus.dnscache.default.clear()
 
     def tearDown(self):
         socket.socket = self.orig_socket
-        httpplus.select.select = self.orig_select
+        httpplus._poll.Poller = self.orig_poller
+        httpplus._poll.SocketSet = self.orig_socketset
         ssl.wrap_socket = self.orig_sslwrap
+        httpplus._tls.wrap_socket = self.orig_tlswrap
         socket.getaddrinfo = self.orig_getaddrinfo
+        httpplus.dnscache.default.clear()
+
+    def mocksockets(self, *datas, **kwargs):
+        """Make each new socket serve the next of datas.
+
+        If per_request is passed as true, each string in a socket's
+        data is one response, which it only serves once it has been
+        sent a request for it.
+
+        Returns a list which the sockets are added to as they're made.
+        """
+        per_request = kwargs.pop('per_request', False)
+        datas = list(datas)
+        made = []
+        def factory(af, socktype, proto):
+            sock = MockSocket(af, socktype, proto)
+            sock.per_request = per_request
+            sock.data = datas.pop(0)
+            made.append(sock)
+            return sock
+        socket.socket = factory
+        return made
 
     def assertStringEqual(self, l, r):
         try:
@@ -24,6 +24,7 @@ setup(
 #                                         'README')).read(),
     keywords='http',
     packages=('httpplus', 'httpplus.tests'),
+    package_data={'httpplus.tests': ['*.pem']},
     platforms='any',
     classifiers=[
         'License :: OSI Approved :: Apache 2',